@@ -1,15 +1,21 @@
 """Function to scrap allociné data
 """
 import math
-
-import pandas as pd
-from bs4 import BeautifulSoup
-
-from bechdelai.data.scrap import get_data_from_url
-from bechdelai.data.scrap import RequestException
+import threading
+from collections import Counter
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from bs4 import SoupStrainer
+from tqdm.contrib.concurrent import thread_map
+
+from bechdelai.data.fetch import fetch_data_from_url
+from bechdelai.data.fetch import RequestException
+from bechdelai.data.parsing import has_class
+from bechdelai.data.parsing import make_soup
 from bechdelai.data.src import load_allocine_filters
-from bechdelai.data.tmdb import get_movie_cast_from_id
-from bechdelai.data.tmdb import search_movie_from_query
+from bechdelai.data.tmdb import TMDB
 
 # Url to scrap Allociné website
 BASE_URL = "https://www.allocine.fr/"
@@ -102,7 +108,7 @@ def get_allocine_filters(filters_path: str) -> dict:
     """
 
     html = get_file_content(filters_path, encoding="utf-8")
-    soup = BeautifulSoup(html, "html.parser")
+    soup = make_soup(html, parse_only=SoupStrainer("div", {"id": "filter-entity"}))
 
     filter_list = soup.find("div", {"id": "filter-entity"})
     filters = filter_list.find_all("ul", {"class": "filter-entity-word"})
@@ -228,14 +234,16 @@ def get_allocine_movies_from_one_page(
     if verbose:
         print(f"Scrap url: {url}")
 
-    ans = get_data_from_url(url)
+    ans = fetch_data_from_url(url)
 
     if ans.status_code != 200:
         raise RequestException(
             "Request response is not valid (status code %s)" % ans.status_code
         )
 
-    html = BeautifulSoup(ans.text, "html.parser")
+    html = make_soup(
+        ans.text, parse_only=SoupStrainer("li", {"class": has_class("mdl")})
+    )
 
     movies_html = html.find_all("li", {"class": "mdl"})
 
@@ -261,6 +269,69 @@ def _check_filter_validity(val, key):
     return elements[val]
 
 
+def iter_movies(
+    n_movies=10,
+    genre="",
+    decade="",
+    year="",
+    country="",
+    sort_by="popularity",
+    verbose=True,
+    n_workers=1,
+):
+    """Yields `n_movies` for wanted filters sorted by `sort_by`,
+    one list of movies per Allociné page
+
+    See `get_movies()` for the parameters.
+
+    Yields
+    ------
+    list(dict)
+        formated movies of one page
+    """
+
+    filters = {}
+    filters["genre_filter"] = _check_filter_validity(genre, key=GENRE_FILTER)
+    filters["decennie_filter"] = _check_filter_validity(decade, key=DECADE_FILTER)
+    filters["annee_filter"] = _check_filter_validity(year, key=YEAR_FILTER)
+    filters["pays_filter"] = _check_filter_validity(country, key=COUNTRY_FILTER)
+
+    n_pages = math.ceil(n_movies / N_MAX_MOVIES_PAGE)
+
+    def fetch_page(num_page):
+        _filters = {**filters, "page_num": str(num_page)}
+        return get_allocine_movies_from_one_page(_filters, sort_by, verbose)
+
+    # At most `n_workers` pages are fetched ahead of the one being consumed
+    # (requests to Allociné are rate limited by the fetch session)
+    pages = iter(range(1, n_pages + 1))
+    n_workers = max(1, n_workers)
+    n_found = 0
+
+    with ThreadPoolExecutor(n_workers) as executor:
+        futures = deque(
+            executor.submit(fetch_page, page) for page in islice(pages, n_workers)
+        )
+        try:
+            while futures:
+                page_movies = futures.popleft().result()
+                is_last_page = len(page_movies) < N_MAX_MOVIES_PAGE
+                if not is_last_page:
+                    for page in islice(pages, 1):
+                        futures.append(executor.submit(fetch_page, page))
+
+                page_movies = page_movies[: n_movies - n_found]
+                n_found += len(page_movies)
+
+                yield page_movies
+
+                if is_last_page:
+                    break
+        finally:
+            for future in futures:
+                future.cancel()
+
+
 def get_movies(
     n_movies=10,
     genre="",
@@ -269,6 +340,7 @@ def get_movies(
     country="",
     sort_by="popularity",
     verbose=True,
+    n_workers=1,
 ):
     """Returns `n_movies` for wanted filters sorted by `sort_by`
 
@@ -288,80 +360,203 @@ def get_movies(
         How to sort results, by default "popularity"
     verbose : bool, optional
         Whether to show verbosity or not, by default True
+    n_workers : int, optional
+        Number of pages fetched concurrently, by default 1
 
     Returns
     -------
     list(dict)
         formated movie as dictionnaries with title, url, img, director and date
     """
+    movies = []
+    for page_movies in iter_movies(
+        n_movies, genre, decade, year, country, sort_by, verbose, n_workers
+    ):
+        movies.extend(page_movies)
 
-    filters = {}
-    filters["genre_filter"] = _check_filter_validity(genre, key=GENRE_FILTER)
-    filters["decennie_filter"] = _check_filter_validity(decade, key=DECADE_FILTER)
-    filters["annee_filter"] = _check_filter_validity(year, key=YEAR_FILTER)
-    filters["pays_filter"] = _check_filter_validity(country, key=COUNTRY_FILTER)
+    return movies
 
-    n_pages = math.ceil(n_movies / N_MAX_MOVIES_PAGE)
 
-    movies = []
-    for num_page in range(1, n_pages + 1):
-        _filters = {**filters, "page_num": str(num_page)}
+class TMDBMatcher:
+    """Matches formated Allociné movies with TMDB ids
 
-        page_movies = get_allocine_movies_from_one_page(_filters, sort_by, verbose)
+    A movie is searched by title on TMDB: the first result released the
+    same year is taken, otherwise the first result whose director is the
+    Allociné director. Credits of the candidates are only fetched when no
+    release year matches, concurrently on an executor shared by all the
+    matches (so that at most `n_workers` credits requests are in flight),
+    and the ones not needed after a match are cancelled.
 
-        if len(page_movies) + len(movies) > n_movies:
-            _max = n_movies - len(movies)
-            movies.extend(page_movies[:_max])
-        else:
-            movies.extend(page_movies)
+    Matches are memoized by (title, year, director), as well as the
+    directors of the candidates, and counted in `stats()`.
 
-        if len(page_movies) < N_MAX_MOVIES_PAGE:
-            break
+    Parameters
+    ----------
+    tmdb : TMDB, optional
+        TMDB client to use, by default a new one is created
+    n_workers : int, optional
+        Number of requests sent concurrently, by default 4
+    """
 
-    return movies
+    def __init__(self, tmdb: TMDB = None, n_workers: int = 4):
+        self.tmdb = TMDB() if tmdb is None else tmdb
+        self.n_workers = max(1, n_workers)
+        self._matches = {}
+        self._directors = {}
+        self._lock = threading.Lock()
+        self._stats = Counter()
+        self._executor = ThreadPoolExecutor(self.n_workers)
+
+    @staticmethod
+    def _get_key(movie_dict: dict) -> tuple:
+        """Returns the memoization key of a movie"""
+        director = movie_dict.get("director")
+        if director is not None:
+            director = director.split(",")[0].strip()
+
+        return (
+            movie_dict["title"].strip().lower(),
+            str(movie_dict.get("year")),
+            director,
+        )
+
+    def _count(self, stat: str) -> None:
+        """Increment a counter of `stats()`"""
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _get_directors(self, movie_id) -> str:
+        """Returns the names of the directors of a TMDB movie"""
+        with self._lock:
+            if movie_id in self._directors:
+                return self._directors[movie_id]
+
+        _, crew_df = self.tmdb.get_movie_cast(movie_id)
+        directors = ""
+        if len(crew_df) > 0:
+            directors = ", ".join(crew_df.loc[crew_df["job"] == "Director", "name"])
+
+        with self._lock:
+            self._directors[movie_id] = directors
+            self._stats["credits_fetched"] += 1
+
+        return directors
+
+    def _search(self, title: str, year: str, director: str):
+        """Returns the TMDB id matching a movie and how it was matched"""
+        results = self.tmdb.search_movie_from_query(title, return_json=True)["results"]
+
+        for res in results:
+            if (res.get("release_date") or "")[:4] == year:
+                return res["id"], "matched_by_year"
+
+        if not director or not results:
+            return None, "not_found"
 
+        futures = [
+            (res["id"], self._executor.submit(self._get_directors, res["id"]))
+            for res in results
+        ]
+        try:
+            for movie_id, future in futures:
+                if director in future.result():
+                    return movie_id, "matched_by_director"
+        finally:
+            for _, future in futures:
+                future.cancel()
+
+        return None, "not_found"
+
+    def match(self, movie_dict: dict):
+        """Retrieves TMDB id of a formated Allociné movie
+
+        Parameters
+        ----------
+        movie_dict : dict
+            formated movie from Allociné page
+
+        Returns
+        -------
+        int
+            TMDB id (or None if nothing found)
+
+        Raises
+        ------
+        RequestException
+            TMDB request failed (the failure is not memoized)
+        """
+        key = self._get_key(movie_dict)
+
+        with self._lock:
+            if key in self._matches:
+                self._stats["cache_hits"] += 1
+                return self._matches[key]
+
+        try:
+            movie_id, stat = self._search(movie_dict["title"], key[1], key[2])
+        except Exception:
+            self._count("errors")
+            raise
+
+        with self._lock:
+            self._matches[key] = movie_id
+            self._stats[stat] += 1
+
+        return movie_id
+
+    def _match_or_none(self, movie_dict: dict):
+        """`match()` returning None when requests fail"""
+        try:
+            return self.match(movie_dict)
+        except Exception as e:
+            print(
+                "Error when try to get TMDB ID for '%s': %s" % (movie_dict["title"], e)
+            )
+            return None
+
+    def match_many(self, movies: list) -> list:
+        """Returns TMDB ids of a list of formated Allociné movies
+        (None when not found or when requests failed), in input order
+        """
+        return thread_map(self._match_or_none, movies, max_workers=self.n_workers)
+
+    def close(self) -> None:
+        """Wait for the credits requests in flight and stop the workers"""
+        self._executor.shutdown(wait=True)
 
-def get_tmdb_id(movie_dict: dict):
+    def stats(self) -> dict:
+        """Returns the number of movies matched by year, by director,
+        not found, failed, memoized and the number of credits fetched
+        """
+        with self._lock:
+            return dict(self._stats)
+
+
+def get_tmdb_id(movie_dict: dict, tmdb: TMDB = None):
     """Retrieves TMDB id from a formated allociné result
 
     Query by title, if year is the same then take this movie
     else if the director are the same then take this movie
+    (see `TMDBMatcher`)
 
     Parameters
     ----------
     movie_dict : dict
         formated movie from Allociné page
+    tmdb : TMDB, optional
+        TMDB client to use, by default a new one is created
 
     Returns
     -------
     int
         TMDB id (or None if nothing found)
     """
+    return TMDBMatcher(tmdb).match(movie_dict)
 
-    title = movie_dict["title"]
-    year = movie_dict["year"]
-    director = movie_dict["director"].split(",")[0]
-
-    data = search_movie_from_query(title)
-
-    for res in data["results"]:
-        if res["release_date"][:4] == str(year):
-            return res["id"]
-
-        if director is None:
-            continue
 
-        details = get_movie_cast_from_id(res["id"])
-        crew_df = pd.DataFrame(details["crew"])
-        dir_name = "".join(crew_df.loc[crew_df["job"] == "Director"]["name"])
-
-        if director in dir_name:
-            return res["id"]
-
-    return None
-
-
-def get_tmdb_ids(movies: list) -> list:
+def get_tmdb_ids(
+    movies: list, tmdb: TMDB = None, n_workers: int = 4, matcher: TMDBMatcher = None
+) -> list:
     """Returns list of TMDB ids given a list of
     movies returned by `get_movies()`
 
@@ -369,17 +564,21 @@ def get_tmdb_ids(movies: list) -> list:
     ----------
     movies : list
         list of dictionnary returned by `get_movies()`
+    tmdb : TMDB, optional
+        TMDB client to use, by default a new one is created
+    n_workers : int, optional
+        Number of movies matched concurrently, by default 4
+    matcher : TMDBMatcher, optional
+        matcher to reuse (with its memoized matches), by default a new one
+        is created with `tmdb` and `n_workers`
 
     Returns
     -------
     list
-        List of TMDB ids for each movie
+        List of TMDB ids for each movie (None when not found or
+        when requests failed)
     """
-    ids = []
-    for movie_dict in movies:
-        try:
-            ids.append(get_tmdb_id(movie_dict))
-        except:
-            print("Error when try to get TMDB ID for '%s'" % movie_dict["title"])
+    if matcher is None:
+        matcher = TMDBMatcher(tmdb, n_workers)
 
-    return ids
+    return matcher.match_many(movies)
@@ -1,14 +1,33 @@
 """
 Utils script to fetch data from the website bechdeltest.com<br>
-There is no rate limit to the API, so don't push them ;) please be cautious while calling it
+There is no rate limit to the API, so don't push them ;) please be cautious while calling it<br>
+Requests to bechdeltest.com are throttled by `bechdelai.data.throttle.DEFAULT_RATE_LIMITS`<br>
+Use `load_catalogue()` to work on a local copy of the catalogue refreshed at most once a day
 
 """
+import time
+
 import requests
 import pandas as pd
 
+from bechdelai.data.fetch import create_header
+from bechdelai.data.fetch import fetch_data_from_url
+from bechdelai.data.fetch import get_session
+from bechdelai.data.store import BechdelTestStore
+from bechdelai.data.store import normalize_imdb_id
+
 
 BASE_URL = "http://bechdeltest.com/api/v1"
 
+# Maximum age in seconds of the local catalogue before `load_catalogue()` refreshes it
+CATALOGUE_MAX_AGE = 24 * 3600
+
+# Keys of the store meta table
+ETAG_KEY = "bechdeltest_etag"
+LAST_MODIFIED_KEY = "bechdeltest_last_modified"
+MAX_ID_KEY = "bechdeltest_max_id"
+REFRESHED_AT_KEY = "bechdeltest_refreshed_at"
+
 
 def fetch_all_data() -> pd.DataFrame:
     """
@@ -35,7 +54,7 @@ def fetch_all_data() -> pd.DataFrame:
     """
     url = "http://bechdeltest.com/api/v1/getAllMovies"
     try:
-        response = requests.get(url)
+        response = fetch_data_from_url(url)
         response.raise_for_status()  # Raise an exception for any HTTP error status code
         data = pd.DataFrame(response.json())
         return data
@@ -44,4 +63,108 @@ def fetch_all_data() -> pd.DataFrame:
 
 
 
-    
\ No newline at end of file
+    
+
+
+def refresh_catalogue(store: BechdelTestStore, tmdb=None, force: bool = False) -> dict:
+    """
+    Updates the local catalogue with the new and changed movies of Bechdeltest.com.
+
+    The catalogue is requested with the ETag and Last-Modified of the previous refresh so that
+    an unchanged catalogue is not downloaded again (304 answer). Otherwise only the new movies
+    (id above the previous max id) and the changed ones are written to the store.
+    The API has no endpoint returning only the changes, so the whole catalogue is downloaded then.
+
+    If a TMDB client is given, the TMDB ids of the movies not looked up yet are added to the store.
+    IMDB ids whose lookup failed are not stored, so that they are looked up again on the next refresh.
+
+    Args:
+        store (BechdelTestStore): local catalogue to update.
+        tmdb (TMDB, optional): client used to map the IMDB ids to TMDB ids. Defaults to None (no mapping).
+        force (bool, optional): whether to download the catalogue even if it did not change. Defaults to False.
+
+    Raises:
+        requests.exceptions.RequestException: If the request to the Bechdeltest.com API fails for any reason.
+
+    Returns:
+        dict: "status" ("not_modified" or "updated"), number of "new", "changed" and "unchanged" movies
+            of the downloaded catalogue (all 0 if it was not modified), number "above_max_id" of downloaded
+            movies whose id is above the max id of the previous refresh, number of TMDB ids "mapped"
+            (movies with a TMDB match) and number of "mapping_errors" (lookups that failed).
+    """
+    url = f"{BASE_URL}/getAllMovies"
+    headers = create_header(url)
+
+    etag = store.get_meta(ETAG_KEY)
+    last_modified = store.get_meta(LAST_MODIFIED_KEY)
+    if not force and store.max_id() is not None:
+        if etag is not None:
+            headers["If-None-Match"] = etag
+        if last_modified is not None:
+            headers["If-Modified-Since"] = last_modified
+
+    response = get_session().get(url, headers=headers)
+
+    if response.status_code == 304:
+        stats = {"status": "not_modified", "new": 0, "changed": 0, "unchanged": 0, "above_max_id": 0}
+    else:
+        response.raise_for_status()
+        movies = pd.DataFrame(response.json())
+
+        previous_max_id = int(store.get_meta(MAX_ID_KEY, 0))
+        stats = {"status": "updated", **store.merge(movies)}
+        stats["above_max_id"] = int((pd.to_numeric(movies["id"]) > previous_max_id).sum())
+
+        store.set_meta(MAX_ID_KEY, store.max_id())
+        for key, header in [(ETAG_KEY, "ETag"), (LAST_MODIFIED_KEY, "Last-Modified")]:
+            if header in response.headers:
+                store.set_meta(key, response.headers[header])
+
+    stats["mapped"] = 0
+    stats["mapping_errors"] = 0
+    if tmdb is not None:
+        imdb_ids = store.unmatched_imdb_ids()
+        if imdb_ids:
+            tmdb_ids = tmdb.map_imdb_ids(imdb_ids)
+            errors = tmdb_ids.attrs.get("errors", {})
+            failed = [normalize_imdb_id(imdb_id) in errors for imdb_id in imdb_ids]
+            mapping = {
+                imdb_id: tmdb_id
+                for imdb_id, tmdb_id, is_failed in zip(imdb_ids, tmdb_ids, failed)
+                if not is_failed
+            }
+            store.set_tmdb_ids(mapping)
+            stats["mapped"] = sum(not pd.isna(tmdb_id) for tmdb_id in mapping.values())
+            stats["mapping_errors"] = sum(failed)
+
+    store.set_meta(REFRESHED_AT_KEY, time.time())
+
+    return stats
+
+
+def load_catalogue(
+    store: BechdelTestStore = None, tmdb=None, max_age: float = CATALOGUE_MAX_AGE
+) -> pd.DataFrame:
+    """
+    Returns the Bechdeltest.com catalogue from the local store, refreshed with `refresh_catalogue()`
+    if the last refresh is older than `max_age`.
+
+    A warm start only reads the local SQLite store, without any request.
+
+    Args:
+        store (BechdelTestStore, optional): local catalogue. Defaults to the store at `DEFAULT_STORE_PATH`.
+        tmdb (TMDB, optional): client used to map the IMDB ids of the new movies to TMDB ids. Defaults to None.
+        max_age (float, optional): maximum age of the catalogue in seconds (0 to always refresh).
+            Defaults to CATALOGUE_MAX_AGE.
+
+    Returns:
+        pd.DataFrame: id, imdbid, title, year, rating and tmdb_id (None if not mapped or no match) of each movie.
+    """
+    if store is None:
+        store = BechdelTestStore()
+
+    refreshed_at = float(store.get_meta(REFRESHED_AT_KEY, 0))
+    if time.time() - refreshed_at >= max_age:
+        refresh_catalogue(store, tmdb)
+
+    return store.load()
@@ -0,0 +1,280 @@
+"""Persistent on-disk cache of HTTP responses
+
+Responses are stored in a SQLite database, keyed by the normalized url
+(query parameters sorted and API keys stripped). Each endpoint can have its
+own time to live and the database size is capped with a LRU eviction.
+
+Enable it for all the data fetchers with:
+
+```python
+from bechdelai.data.cache import ResponseCache
+from bechdelai.data.fetch import set_cache
+
+set_cache(ResponseCache("~/.cache/bechdelai/http.sqlite"))
+```
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Optional
+from typing import Tuple
+from urllib.parse import parse_qsl
+from urllib.parse import urlencode
+from urllib.parse import urlsplit
+from urllib.parse import urlunsplit
+
+DEFAULT_CACHE_PATH = "~/.cache/bechdelai/http.sqlite"
+
+# Query parameters removed from the cache keys
+SECRET_PARAMS = {"api_key", "apikey", "token", "access_token"}
+
+# Time to live (in seconds) by default and by endpoint
+# (patterns are searched in the normalized url, first match wins)
+DAY = 24 * 3600
+DEFAULT_TTL = 7 * DAY
+DEFAULT_TTLS = {
+    r"api\.themoviedb\.org/3/(movie|person)/changes": 0,
+    r"api\.themoviedb\.org/3/(discover|search|trending)/": DAY,
+    r"api\.themoviedb\.org/3/movie/(now_playing|popular|top_rated|upcoming)": DAY,
+    r"api\.themoviedb\.org/3/": 30 * DAY,
+    r"image\.tmdb\.org/": 365 * DAY,
+    r"allocine\.fr/": 7 * DAY,
+    r"bechdeltest\.com/": DAY,
+}
+
+# Maximum size of the stored responses (in bytes)
+DEFAULT_MAX_SIZE = 2 * 1024**3
+
+
+def normalize_url(url: str, params: dict = None) -> str:
+    """Returns the cache key of a url
+
+    The scheme and host are lowercased, repeated slashes are removed,
+    query parameters (including `params`) are sorted and secret parameters
+    such as `api_key` are stripped.
+
+    Parameters
+    ----------
+    url : str
+        requested url
+    params : dict, optional
+        query parameters sent with the url, by default None
+
+    Returns
+    -------
+    str
+        normalized url
+    """
+    split = urlsplit(url)
+
+    query = parse_qsl(split.query, keep_blank_values=True)
+    if params is not None:
+        query += [(k, str(v)) for k, v in params.items()]
+    query = sorted((k, v) for k, v in query if k.lower() not in SECRET_PARAMS)
+
+    path = re.sub("/{2,}", "/", split.path)
+
+    return urlunsplit(
+        (split.scheme.lower(), split.netloc.lower(), path, urlencode(query), "")
+    )
+
+
+class ResponseCache:
+    """SQLite cache of HTTP responses with TTL and LRU eviction
+
+    Parameters
+    ----------
+    path : str, optional
+        path of the SQLite database, by default DEFAULT_CACHE_PATH
+    ttls : dict, optional
+        time to live in seconds by url pattern (regex searched in the
+        normalized url), by default DEFAULT_TTLS. A TTL of 0 disables
+        caching for the matching urls
+    default_ttl : float, optional
+        time to live of urls matching no pattern, by default DEFAULT_TTL
+    max_size : int, optional
+        maximum size in bytes of the stored responses, by default DEFAULT_MAX_SIZE
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        ttls: dict = None,
+        default_ttl: float = DEFAULT_TTL,
+        max_size: int = DEFAULT_MAX_SIZE,
+    ):
+        self.path = os.path.expanduser(path)
+        self.ttls = [
+            (re.compile(p), ttl)
+            for p, ttl in (DEFAULT_TTLS if ttls is None else ttls).items()
+        ]
+        self.default_ttl = default_ttl
+        self.max_size = max_size
+
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                status INTEGER,
+                content_type TEXT,
+                content BLOB,
+                size INTEGER,
+                expires_at REAL,
+                accessed_at REAL
+            )""")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)"
+        )
+        self._conn.commit()
+
+        self._size = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    def ttl_for(self, key: str) -> float:
+        """Returns the time to live of a normalized url"""
+        for pattern, ttl in self.ttls:
+            if pattern.search(key):
+                return ttl
+        return self.default_ttl
+
+    def get(self, url: str, params: dict = None) -> Optional[Tuple[int, str, bytes]]:
+        """Returns a stored response if it exists and has not expired
+
+        Parameters
+        ----------
+        url : str
+            requested url
+        params : dict, optional
+            query parameters sent with the url, by default None
+
+        Returns
+        -------
+        tuple or None
+            status code, content type and content of the response
+        """
+        key = normalize_url(url, params)
+        now = time.time()
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, content_type, content, expires_at FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+
+            if row is None or row[3] < now:
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+
+        return row[0], row[1], row[2]
+
+    def set(
+        self,
+        url: str,
+        status: int,
+        content_type: str,
+        content: bytes,
+        params: dict = None,
+    ) -> None:
+        """Store a response
+
+        Parameters
+        ----------
+        url : str
+            requested url
+        status : int
+            status code of the response
+        content_type : str
+            content type of the response
+        content : bytes
+            body of the response
+        params : dict, optional
+            query parameters sent with the url, by default None
+        """
+        key = normalize_url(url, params)
+        ttl = self.ttl_for(key)
+        if ttl <= 0:
+            return
+
+        now = time.time()
+        size = len(content)
+
+        with self._lock:
+            old = self._conn.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if old is not None:
+                self._size -= old[0]
+
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, status, content_type, content, size, now + ttl, now),
+            )
+            self._size += size
+
+            if self._size > self.max_size:
+                self._evict()
+
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """Remove expired then least recently used responses
+        until the cache fits in 90% of `max_size` (lock must be held)
+        """
+        self._conn.execute("DELETE FROM responses WHERE expires_at < ?", (time.time(),))
+        self._size = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+        target = 0.9 * self.max_size
+        cursor = self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at ASC"
+        )
+        to_delete = []
+        for key, size in cursor:
+            if self._size <= target:
+                break
+            to_delete.append((key,))
+            self._size -= size
+
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", to_delete)
+
+    def stats(self) -> dict:
+        """Returns hit and miss counters, number of entries and size"""
+        with self._lock:
+            n_entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[
+                0
+            ]
+
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "n_entries": n_entries,
+            "size": self._size,
+        }
+
+    def clear(self) -> None:
+        """Remove all stored responses"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._size = 0
+
+    def close(self) -> None:
+        """Close the database"""
+        with self._lock:
+            self._conn.close()
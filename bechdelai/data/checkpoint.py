@@ -0,0 +1,82 @@
+"""Append-only checkpoints of long scraping runs
+
+Each stage of a pipeline appends its results to a JSON lines file as soon
+as they are computed. Records are identified by a key so that a resumed
+run skips what is already done and a record written twice is kept once.
+"""
+import json
+import os
+import threading
+from typing import Iterator
+from typing import Optional
+
+
+class JSONLinesCheckpoint:
+    """JSON lines file of records identified by a key
+
+    The last record of a key wins. A truncated last line (run killed
+    while writing) is ignored when loading.
+
+    Parameters
+    ----------
+    path : str
+        path of the JSON lines file
+    key : str
+        record field identifying the records
+    reset : bool, optional
+        whether to remove the existing file, by default False
+    """
+
+    def __init__(self, path: str, key: str, reset: bool = False):
+        self.path = path
+        self.key = key
+        self.records = {}
+        self._lock = threading.Lock()
+
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        if reset and os.path.exists(self.path):
+            os.remove(self.path)
+
+        if os.path.exists(self.path):
+            self._load()
+
+    def _load(self) -> None:
+        """Read the records of the existing file"""
+        line = ""
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self.records[str(record[self.key])] = record
+
+        # Terminate a truncated last line so that new records start on their own line
+        if line and not line.endswith("\n"):
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n")
+
+    def __contains__(self, key) -> bool:
+        return str(key) in self.records
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self) -> Iterator[dict]:
+        return iter(list(self.records.values()))
+
+    def get(self, key, default: Optional[dict] = None) -> Optional[dict]:
+        """Returns the record of a key"""
+        return self.records.get(str(key), default)
+
+    def append(self, record: dict) -> None:
+        """Write a record to the file"""
+        line = json.dumps(record, default=str)
+
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            self.records[str(record[self.key])] = record
@@ -0,0 +1,197 @@
+"""Local corpus of compressed text documents (scripts, subtitles...)
+
+Each document is stored gzip-compressed in its own file and recorded in a
+JSON lines manifest with its sha256 hash and metadata. Documents are only
+added to the manifest once their file is written, so an interrupted crawl
+is resumed by skipping the ids already in the manifest.
+
+```python
+from bechdelai.data.corpus import TextCorpus
+
+corpus = TextCorpus("~/.cache/bechdelai/imsdb")
+corpus.add("Alien", "INT. NOSTROMO...", url="https://imsdb.com/scripts/Alien.html")
+for doc_id, text in corpus.iter_texts():
+    ...
+```
+"""
+import gzip
+import hashlib
+import os
+import re
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from bechdelai.data.checkpoint import JSONLinesCheckpoint
+
+MANIFEST_NAME = "manifest.jsonl"
+
+
+def text_hash(text: str) -> str:
+    """Returns the sha256 hash of a text (encoded in UTF-8)"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class TextCorpus:
+    """Folder of gzip-compressed texts with a manifest
+
+    Parameters
+    ----------
+    folder : str
+        folder of the corpus (created if needed)
+    """
+
+    def __init__(self, folder: str):
+        self.folder = os.path.expanduser(folder)
+        os.makedirs(os.path.join(self.folder, "texts"), exist_ok=True)
+        self.manifest = JSONLinesCheckpoint(
+            os.path.join(self.folder, MANIFEST_NAME), key="id"
+        )
+
+    def __contains__(self, doc_id) -> bool:
+        return doc_id in self.manifest
+
+    def __len__(self) -> int:
+        return len(self.manifest)
+
+    def ids(self) -> List[str]:
+        """Returns the ids of the documents, in insertion order"""
+        return [record["id"] for record in self.manifest]
+
+    def get_record(self, doc_id) -> Optional[dict]:
+        """Returns the manifest record of a document (path, hash and metadata)"""
+        return self.manifest.get(doc_id)
+
+    def _text_path(self, doc_id: str) -> str:
+        """Returns the relative path of the file of a document"""
+        name = re.sub(r"[^\w.-]+", "_", doc_id).strip("_") or "_"
+        # Ids mapped to the same name are told apart by a short hash
+        if name != doc_id:
+            name = f"{name}_{text_hash(doc_id)[:8]}"
+        return os.path.join("texts", f"{name}.txt.gz")
+
+    def add(self, doc_id, text: str, **meta) -> dict:
+        """Write a document and record it in the manifest
+
+        The file is written then renamed so that a document in the manifest
+        is always complete. Adding an existing id replaces the document.
+
+        Parameters
+        ----------
+        doc_id : str
+            document id
+        text : str
+            document content
+        **meta
+            metadata stored in the manifest (must be JSON serializable)
+
+        Returns
+        -------
+        dict
+            manifest record of the document
+        """
+        doc_id = str(doc_id)
+        path = self._text_path(doc_id)
+        full_path = os.path.join(self.folder, path)
+
+        with gzip.open(full_path + ".tmp", "wt", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(full_path + ".tmp", full_path)
+
+        record = {
+            **meta,
+            "id": doc_id,
+            "path": path,
+            "sha256": text_hash(text),
+            "n_chars": len(text),
+        }
+        self.manifest.append(record)
+
+        return record
+
+    def update(self, doc_id, **meta) -> dict:
+        """Update the metadata of a document without writing its text again
+
+        Parameters
+        ----------
+        doc_id : str
+            document id
+        **meta
+            metadata to add or replace (must be JSON serializable)
+
+        Returns
+        -------
+        dict
+            updated manifest record of the document
+
+        Raises
+        ------
+        KeyError
+            document is not in the corpus
+        """
+        record = self.manifest.get(str(doc_id))
+        if record is None:
+            raise KeyError(doc_id)
+
+        record = {**record, **meta}
+        self.manifest.append(record)
+
+        return record
+
+    def read(self, doc_id, check: bool = False) -> str:
+        """Returns the text of a document
+
+        Parameters
+        ----------
+        doc_id : str
+            document id
+        check : bool, optional
+            whether to compare the text with its manifest hash, by default False
+
+        Raises
+        ------
+        KeyError
+            document is not in the corpus
+        ValueError
+            text does not match its hash (only if `check`)
+        """
+        record = self.manifest.get(doc_id)
+        if record is None:
+            raise KeyError(doc_id)
+
+        with gzip.open(
+            os.path.join(self.folder, record["path"]), "rt", encoding="utf-8"
+        ) as f:
+            text = f.read()
+
+        if check and text_hash(text) != record["sha256"]:
+            raise ValueError(f"Text of {doc_id} does not match its hash")
+
+        return text
+
+    def iter_texts(
+        self, ids: Optional[Iterable[str]] = None, check: bool = False
+    ) -> Iterator[Tuple[str, str]]:
+        """Yield (id, text) of documents, one file read at a time
+
+        Parameters
+        ----------
+        ids : Iterable, optional
+            ids of the documents to read, by default all of them
+        check : bool, optional
+            whether to check the hash of each text, by default False
+        """
+        for doc_id in self.ids() if ids is None else ids:
+            yield doc_id, self.read(doc_id, check=check)
+
+    def verify(self) -> List[str]:
+        """Returns the ids of the documents missing or not matching their hash"""
+        invalid = []
+        for doc_id in self.ids():
+            try:
+                self.read(doc_id, check=True)
+            except (OSError, EOFError, ValueError):
+                invalid.append(doc_id)
+        return invalid
@@ -4,10 +4,9 @@ from https://www.dictionary.com website
 import json
 import re
 
-import requests
 from bs4 import BeautifulSoup
 
-from bechdelai.data.scrap import get_data_from_url
+from bechdelai.data.fetch import fetch_data_from_url
 
 BASE_URL = "https://www.dictionary.com"
 LIST_URL = f"{BASE_URL}/list/{{letter}}/{{num}}"
@@ -47,7 +46,7 @@ def get_definition_from_word_url(url):
     """Returns the definitions of a word given the
     dictionary word url
     """
-    ans = requests.get(url)
+    ans = fetch_data_from_url(url)
     soup = BeautifulSoup(ans.text, "html.parser")
 
     sections = soup.find("div", {"class": "e16867sm0"}).find_all(
@@ -95,7 +94,7 @@ def get_url_from_word(word):
     word = word.lower().strip()
     url = f"{WORD_URL}/{word}"
 
-    ans = get_data_from_url(url)
+    ans = fetch_data_from_url(url)
 
     if ans.url == url:
         return ans
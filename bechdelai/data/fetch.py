@@ -1,14 +1,35 @@
 """Functions to scrap website
+
+All the scrapers of `bechdelai.data` send their requests through a shared
+`HTTPSession`: connections are pooled and kept alive per host, so bulk runs
+only pay the TCP+TLS handshake once per connection. Requests are throttled
+by host and failed ones are retried (see `bechdelai.data.throttle`).
+Responses can also be stored on disk with `set_cache()` (see `bechdelai.data.cache`).
 """
+import threading
+import time
+from io import BytesIO
+from typing import Optional
+
 import requests
 from PIL import Image
-from io import BytesIO
+from requests.adapters import HTTPAdapter
+from requests.utils import get_encoding_from_headers
+
+from bechdelai.data.cache import ResponseCache
+from bechdelai.data.throttle import RateLimiter
+from bechdelai.data.throttle import RetryPolicy
 
 DEFAULT_HEADER = {
     "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/73.0.3683.86 Safari/537.36",
     "Accept-Language": "en-GB,en;q=0.5",
 }
 
+# Default settings of the shared session
+DEFAULT_TIMEOUT = 30
+DEFAULT_POOL_CONNECTIONS = 16
+DEFAULT_POOL_MAXSIZE = 16
+
 
 class RequestException(Exception):
     """Exception class for request error"""
@@ -48,7 +69,7 @@ def create_header(url: str) -> dict:
     if not (url.startswith("http://") or url.startswith("https://")):
         raise ValueError("url must start with 'http'")
 
-    header = DEFAULT_HEADER
+    header = dict(DEFAULT_HEADER)
 
     url_split = url.split("//")
     http = url_split[0]
@@ -61,19 +82,282 @@ def create_header(url: str) -> dict:
     return header
 
 
-def fetch_data_from_url(url: str) -> requests.Response:
+class HTTPSession:
+    """Pooled keep-alive session used by all the scrapers
+
+    Connections are kept alive and reused per host, requests are throttled
+    by host and retried on failure. The session also records transport
+    statistics (see `stats()`).
+
+    Parameters
+    ----------
+    pool_connections : int, optional
+        number of host pools to keep alive, by default DEFAULT_POOL_CONNECTIONS
+    pool_maxsize : int, optional
+        maximum number of connections kept per host, by default DEFAULT_POOL_MAXSIZE
+    timeout : float, optional
+        default timeout in seconds of each request, by default DEFAULT_TIMEOUT
+    rate_limiter : RateLimiter, optional
+        requests per second by host, by default `RateLimiter()`
+    retry_policy : RetryPolicy, optional
+        retries of the failed requests, by default `RetryPolicy()`
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+        pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+        timeout: float = DEFAULT_TIMEOUT,
+        rate_limiter: Optional[RateLimiter] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+    ):
+        self.timeout = timeout
+        self.rate_limiter = RateLimiter() if rate_limiter is None else rate_limiter
+        self.retry_policy = RetryPolicy() if retry_policy is None else retry_policy
+
+        self._adapter = HTTPAdapter(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize
+        )
+        self._session = requests.Session()
+        self._session.mount("http://", self._adapter)
+        self._session.mount("https://", self._adapter)
+
+        self._lock = threading.Lock()
+        self.n_requests = 0
+        self.n_errors = 0
+        self.n_retries = 0
+        self.n_bytes = 0
+        self.throttled_time = 0.0
+
+    def get(
+        self,
+        url: str,
+        headers: dict = None,
+        params: dict = None,
+        stream: bool = False,
+        timeout: float = None,
+    ) -> requests.Response:
+        """Send a GET request through the pooled connections
+
+        The request waits for the host rate limit and is retried
+        following the retry policy (the last answer or error is returned).
+
+        Parameters
+        ----------
+        url : str
+            url to request
+        headers : dict, optional
+            request headers, by default None
+        params : dict, optional
+            query parameters, by default None
+        stream : bool, optional
+            whether to stream the body instead of reading it, by default False.
+            Streamed bytes must be reported with `add_bytes()`
+        timeout : float, optional
+            timeout in seconds, by default the session timeout
+
+        Returns
+        -------
+        requests.Response
+            answer of the request
+        """
+        if timeout is None:
+            timeout = self.timeout
+
+        attempt = 0
+        while True:
+            waited = self.rate_limiter.acquire(url)
+
+            try:
+                r = self._session.get(
+                    url, headers=headers, params=params, stream=stream, timeout=timeout
+                )
+            except requests.exceptions.RequestException as e:
+                with self._lock:
+                    self.n_errors += 1
+                    self.throttled_time += waited
+                if not self.retry_policy.should_retry(attempt, error=e):
+                    raise
+                r = None
+            else:
+                n_bytes = 0 if stream else len(r.content)
+                with self._lock:
+                    self.n_requests += 1
+                    self.n_bytes += n_bytes
+                    self.throttled_time += waited
+                if not self.retry_policy.should_retry(attempt, response=r):
+                    return r
+                r.close()
+
+            with self._lock:
+                self.n_retries += 1
+            time.sleep(self.retry_policy.get_backoff(attempt, r))
+            attempt += 1
+
+    def add_bytes(self, n_bytes: int) -> None:
+        """Record bytes read from a streamed response"""
+        with self._lock:
+            self.n_bytes += n_bytes
+
+    def stats(self) -> dict:
+        """Returns transport statistics of the session
+
+        Connections are counted on the host pools still alive, so
+        `n_connections_reused` is a lower bound once pools are evicted.
+
+        Returns
+        -------
+        dict
+            number of requests, errors, retries, bytes received, time
+            waiting for rate limits, connections opened and reused
+        """
+        pools = self._adapter.poolmanager.pools
+        n_connections = 0
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                n_connections += pool.num_connections
+
+        return {
+            "n_requests": self.n_requests,
+            "n_errors": self.n_errors,
+            "n_retries": self.n_retries,
+            "n_bytes": self.n_bytes,
+            "throttled_time": self.throttled_time,
+            "n_connections": n_connections,
+            "n_connections_reused": max(self.n_requests - n_connections, 0),
+        }
+
+    def close(self) -> None:
+        """Close all pooled connections"""
+        self._session.close()
+
+
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+
+def get_session() -> HTTPSession:
+    """Returns the shared session (created at first call)"""
+    global _SESSION
+
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            _SESSION = HTTPSession()
+
+    return _SESSION
+
+
+def configure_session(
+    pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+    pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+    timeout: float = DEFAULT_TIMEOUT,
+    rate_limiter: Optional[RateLimiter] = None,
+    retry_policy: Optional[RetryPolicy] = None,
+) -> HTTPSession:
+    """Replace the shared session with a new configured one
+
+    Parameters
+    ----------
+    pool_connections : int, optional
+        number of host pools to keep alive, by default DEFAULT_POOL_CONNECTIONS
+    pool_maxsize : int, optional
+        maximum number of connections kept per host (should be at least
+        the number of threads used), by default DEFAULT_POOL_MAXSIZE
+    timeout : float, optional
+        default timeout in seconds of each request, by default DEFAULT_TIMEOUT
+    rate_limiter : RateLimiter, optional
+        requests per second by host, by default `RateLimiter()`
+    retry_policy : RetryPolicy, optional
+        retries of the failed requests, by default `RetryPolicy()`
+
+    Returns
+    -------
+    HTTPSession
+        the new shared session
+    """
+    global _SESSION
+
+    session = HTTPSession(
+        pool_connections, pool_maxsize, timeout, rate_limiter, retry_policy
+    )
+
+    with _SESSION_LOCK:
+        old_session, _SESSION = _SESSION, session
+
+    if old_session is not None:
+        old_session.close()
+
+    return session
+
+
+_CACHE = None
+
+
+def get_cache() -> Optional[ResponseCache]:
+    """Returns the response cache used by the fetchers (None if disabled)"""
+    return _CACHE
+
+
+def set_cache(cache: Optional[ResponseCache]) -> None:
+    """Set the response cache used by the fetchers
+
+    Parameters
+    ----------
+    cache : ResponseCache or None
+        cache to use, None to disable caching
+    """
+    global _CACHE
+    _CACHE = cache
+
+
+def _build_response(
+    url: str, status: int, content_type: str, content: bytes
+) -> requests.Response:
+    """Build a response from a cached one"""
+    r = requests.Response()
+    r.url = url
+    r.status_code = status
+    r.headers["Content-Type"] = content_type
+    r.encoding = get_encoding_from_headers(r.headers)
+    r._content = content
+
+    return r
+
+
+def fetch_data_from_url(
+    url: str,
+    params: dict = None,
+    stream: bool = False,
+    use_cache: bool = True,
+    refresh: bool = False,
+) -> requests.Response:
     """Return answer of a request get
-    from a wanted url
+    from a wanted url (sent through the shared session)
+
+    If a cache is set with `set_cache()`, successful answers are
+    stored and returned without network call while they are valid.
+    Redirected answers are not stored, so that `r.url` is always the
+    final url of the request.
 
     Parameters
     ----------
     url : str
         url to request
+    params : dict, optional
+        query parameters, by default None
+    stream : bool, optional
+        whether to stream the body (never cached), by default False
+    use_cache : bool, optional
+        whether to use the response cache, by default True
+    refresh : bool, optional
+        whether to ignore the cached answer and store the new one
+        (e.g. for data known to have changed), by default False
 
     Returns
     -------
     requests.Response
-        answer from requests.get function
+        answer from the get request
 
     Raises
     ------
@@ -88,19 +372,34 @@ def fetch_data_from_url(url: str) -> requests.Response:
     if not (url.startswith("http://") or url.startswith("https://")):
         raise ValueError("url must start with 'http'")
 
+    cache = get_cache() if (use_cache and not stream) else None
+
+    if cache is not None and not refresh:
+        cached = cache.get(url, params)
+        if cached is not None:
+            return _build_response(url, *cached)
+
     headers = create_header(url)
-    r = requests.get(url, headers=headers)
+    r = get_session().get(url, headers=headers, params=params, stream=stream)
+
+    if cache is not None and r.status_code == 200 and not r.history:
+        content_type = r.headers.get("Content-Type", "")
+        cache.set(url, r.status_code, content_type, r.content, params)
 
     return r
 
 
-def fetch_json_from_url(url: str) -> dict:
+def fetch_json_from_url(url: str, params: dict = None, refresh: bool = False) -> dict:
     """Get json results from an endpoint
 
     Parameters
     ----------
     url : str
         url to request
+    params : dict, optional
+        query parameters, by default None
+    refresh : bool, optional
+        whether to ignore the cached answer and store the new one, by default False
 
     Returns
     -------
@@ -112,12 +411,12 @@ def fetch_json_from_url(url: str) -> dict:
     RequestException
         Status code different from 200
     """
-    ans = fetch_data_from_url(url)
+    ans = fetch_data_from_url(url, params=params, refresh=refresh)
 
     if ans.status_code != 200:
         raise RequestException(f"Status code different from 200, got {ans.status_code}")
 
-    content_type = ans.headers["Content-Type"]
+    content_type = ans.headers.get("Content-Type", "")
     if "json" not in content_type:
         raise NotJSONContentException(f"Result is not a JSON, got {content_type}")
 
@@ -139,6 +438,6 @@ def fetch_image_from_url(url: str) -> Image:
     Returns:
         PIL.Image: The fetched image as a PIL Image object.
     """
-    response = requests.get(url)
+    response = fetch_data_from_url(url)
     img = Image.open(BytesIO(response.content))
-    return img
\ No newline at end of file
+    return img
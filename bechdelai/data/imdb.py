@@ -1,8 +1,14 @@
+import warnings
+
 import numpy as np
-from bs4 import BeautifulSoup
+import pandas as pd
+from bs4 import SoupStrainer
 
-from bechdelai.data.scrap import get_data_from_url
-from bechdelai.data.scrap import RequestException
+from bechdelai.data.fetch import fetch_data_from_url
+from bechdelai.data.fetch import RequestException
+from bechdelai.data.imdb_datasets import SortedIndex
+from bechdelai.data.parsing import has_class
+from bechdelai.data.parsing import make_soup
 
 MAIN_URL = "https://www.imdb.com"
 URL_SEARCH = f"{MAIN_URL}/find?s=tt&q={{q}}"
@@ -29,14 +35,16 @@ def find_movie_from_kerword(q):
     """
     url = URL_SEARCH.format(q=q)
 
-    ans = get_data_from_url(url)
+    ans = fetch_data_from_url(url)
 
     if ans.status_code != 200:
         raise RequestException(
             "Request response is not valid (status code %s)" % ans.status_code
         )
 
-    soup = BeautifulSoup(ans.text, "html.parser")
+    soup = make_soup(
+        ans.text, parse_only=SoupStrainer("tr", {"class": has_class("findResult")})
+    )
     res = soup.find_all("tr", {"class": "findResult"})
 
     res = preprocess_search_result_list(res)
@@ -46,8 +54,8 @@ def find_movie_from_kerword(q):
 
 def get_movie_details(url):
     """Get main details of a movie from url"""
-    ans = get_data_from_url(url)
-    soup = BeautifulSoup(ans.text, "html.parser")
+    ans = fetch_data_from_url(url)
+    soup = make_soup(ans.text)
 
     title = soup.find("h1").text
 
@@ -60,8 +68,10 @@ def get_movie_details(url):
 
 def get_movie_casts(url):
     """Get casting of a movie with the url"""
-    ans = get_data_from_url(url)
-    soup = BeautifulSoup(ans.text, "html.parser")
+    ans = fetch_data_from_url(url)
+    soup = make_soup(
+        ans.text, parse_only=SoupStrainer("table", {"class": has_class("cast_list")})
+    )
 
     cast_list = soup.find("table", {"class": "cast_list"}).find_all("tr")
     cast = []
@@ -140,6 +150,23 @@ def postprocess_cast_id(full_cast):
     return full_cast
 
 
+def _lookup(table, key, ids):
+    """Returns the rows of `table` whose `key` is in `ids`, in the order of `ids`
+
+    `table` is either a dataframe (scanned) or a `SortedIndex` on `key`
+    (binary search, see `bechdelai.data.imdb_datasets`)
+    """
+    if isinstance(table, SortedIndex):
+        if table.key != key:
+            raise ValueError(f"Index must be on `{key}`, got `{table.key}`")
+        return table.get_many(ids)
+
+    ids = pd.unique(np.asarray(ids))
+    rows = table.loc[np.isin(table[key].values, ids)]
+    order = pd.Series(np.arange(len(ids)), index=ids)
+    return rows.iloc[np.argsort(order.loc[rows[key].values].values, kind="stable")]
+
+
 def get_movie_job_details(movie_principals, category, name_df):
     """Get detail of a person from a category into a movie
 
@@ -152,6 +179,8 @@ def get_movie_job_details(movie_principals, category, name_df):
         Principals dataframe filtered on the wanted movie
     category: str
         Job category (mainly used for "director" and "producer")
+    name_df: pandas.DataFrame or SortedIndex
+        Names dataframe, or names indexed on `nconst`
     """
     cols = ["nconst", "primaryName", "birthYear", "deathYear", "primaryProfession"]
 
@@ -159,9 +188,7 @@ def get_movie_job_details(movie_principals, category, name_df):
     if len(df) == 0:
         return None
 
-    df = df.merge(
-        name_df.loc[np.isin(name_df["nconst"].values, df["nconst"].values)], on="nconst"
-    )
+    df = df.merge(_lookup(name_df, "nconst", df["nconst"].values), on="nconst")
     df = df[cols]
 
     res = df.to_dict(orient="records")
@@ -185,6 +212,9 @@ def get_movie_data(movie_id, name_df, basics_df, principals_df):
     - name_df : https://datasets.imdbws.com/name.basics.tsv.gz
     - basics_df : https://datasets.imdbws.com/title.basics.tsv.gz
     - principals_df : https://datasets.imdbws.com/title.principals.tsv.gz
+
+    Each dataset can be given as a dataframe or, for fast lookups, as a
+    `SortedIndex` on its id (see `bechdelai.data.imdb_datasets.IMDBDatasets.index()`)
     """
     # Get id as int and as imdb format
     if str(movie_id).startswith("tt"):
@@ -199,12 +229,10 @@ def get_movie_data(movie_id, name_df, basics_df, principals_df):
     movie_cast = get_movie_casts(movie_cast_url)
 
     # Get basic informations of the movie
-    movie_data = basics_df.loc[basics_df["tconst"].values == movie_id].to_dict(
-        orient="records"
-    )[0]
+    movie_data = _lookup(basics_df, "tconst", [movie_id]).to_dict(orient="records")[0]
     movie_data["tconst"] = movie_id_imdb
     movie_data["url"] = f"{MAIN_URL}/name/{movie_id_imdb}/"
-    movie_principals = principals_df.loc[principals_df.tconst.values == movie_id]
+    movie_principals = _lookup(principals_df, "tconst", [movie_id])
 
     movie_data["director"] = get_movie_job_details(
         movie_principals, "director", name_df
@@ -213,13 +241,24 @@ def get_movie_data(movie_id, name_df, basics_df, principals_df):
         movie_principals, "producer", name_df
     )
 
-    # Get cast characters details
-    full_cast = []
-    for cast in movie_cast:
-        cast_id = cast["nconst"]
-        idx = np.where(name_df.nconst.values == cast_id)[0][0]
-        full_cast.append(name_df.iloc[idx].to_dict())
+    # Get cast characters details (in credits order, with repeated persons)
+    cast_ids = [cast["nconst"] for cast in movie_cast]
+    names = _lookup(name_df, "nconst", cast_ids).drop_duplicates("nconst")
+    names = dict(zip(names["nconst"], names.to_dict(orient="records")))
+
+    unknown_ids = [cast_id for cast_id in cast_ids if cast_id not in names]
+    if unknown_ids:
+        warnings.warn(
+            f"{len(unknown_ids)} cast members of {movie_id_imdb} are not in "
+            f"`name_df` and are skipped: {unknown_ids}"
+        )
+
+    positions = [i + 1 for i, cast_id in enumerate(cast_ids) if cast_id in names]
+    full_cast = [dict(names[cast_id]) for cast_id in cast_ids if cast_id in names]
 
     movie_data["cast"] = postprocess_cast_id(full_cast)
+    # Positions in the credits are kept when cast members are skipped
+    for cast, position in zip(movie_data["cast"], positions):
+        cast["ordering"] = position
 
     return movie_data
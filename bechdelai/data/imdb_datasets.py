@@ -0,0 +1,456 @@
+"""Local copy of the IMDB bulk datasets
+
+The `.tsv.gz` files of https://datasets.imdbws.com/ are downloaded once
+and converted to typed Parquet files sorted by id, with integer ids
+(`tt0000123` and `nm0000123` become 123). Datasets are then loaded as
+`SortedIndex` so that the rows of a movie or a person are found by
+binary search instead of a scan of the whole dataframe.
+
+```python
+from bechdelai.data.imdb import get_movie_data
+from bechdelai.data.imdb_datasets import IMDBDatasets
+
+datasets = IMDBDatasets()
+movie = get_movie_data(
+    "tt0078748",
+    datasets.index("name.basics"),
+    datasets.index("title.basics"),
+    datasets.index("title.principals"),
+)
+```
+"""
+import csv
+import hashlib
+import os
+from typing import Iterable
+from typing import List
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from bechdelai.data.fetch import fetch_data_from_url
+from bechdelai.data.fetch import get_session
+from bechdelai.data.fetch import RequestException
+
+DATASETS_URL = "https://datasets.imdbws.com/{name}.tsv.gz"
+DEFAULT_FOLDER = "~/.cache/bechdelai/imdb"
+
+# Size of the chunks written to disk when downloading
+DOWNLOAD_CHUNK_SIZE = 1024**2
+
+# Number of rows read at once when converting a dataset
+INGEST_CHUNK_ROWS = 1_000_000
+
+# Prefix of the id columns, stripped to store ids as integers
+ID_PREFIXES = {"tconst": "tt", "nconst": "nm", "titleId": "tt", "parentTconst": "tt"}
+
+# Sort key and column types of each dataset ("id" for prefixed ids).
+# IMDB files are sorted by their key.
+DATASETS = {
+    "title.basics": {
+        "key": "tconst",
+        "dtypes": {
+            "tconst": "id",
+            "titleType": "category",
+            "primaryTitle": "str",
+            "originalTitle": "str",
+            "isAdult": "Int8",
+            "startYear": "Int16",
+            "endYear": "Int16",
+            "runtimeMinutes": "Int32",
+            "genres": "category",
+        },
+    },
+    "name.basics": {
+        "key": "nconst",
+        "dtypes": {
+            "nconst": "id",
+            "primaryName": "str",
+            "birthYear": "Int16",
+            "deathYear": "Int16",
+            "primaryProfession": "category",
+            "knownForTitles": "str",
+        },
+    },
+    "title.principals": {
+        "key": "tconst",
+        "dtypes": {
+            "tconst": "id",
+            "ordering": "Int16",
+            "nconst": "id",
+            "category": "category",
+            "job": "str",
+            "characters": "str",
+        },
+    },
+    "title.crew": {
+        "key": "tconst",
+        "dtypes": {"tconst": "id", "directors": "str", "writers": "str"},
+    },
+    "title.ratings": {
+        "key": "tconst",
+        "dtypes": {"tconst": "id", "averageRating": "float32", "numVotes": "Int32"},
+    },
+    "title.episode": {
+        "key": "tconst",
+        "dtypes": {
+            "tconst": "id",
+            "parentTconst": "id",
+            "seasonNumber": "Int16",
+            "episodeNumber": "Int32",
+        },
+    },
+    "title.akas": {
+        "key": "titleId",
+        "dtypes": {
+            "titleId": "id",
+            "ordering": "Int16",
+            "title": "str",
+            "region": "category",
+            "language": "category",
+            "types": "category",
+            "attributes": "str",
+            "isOriginalTitle": "Int8",
+        },
+    },
+}
+
+
+def convert_ids(values: pd.Series, prefix: str) -> pd.Series:
+    """Convert IMDB ids to integers ("tt0000123" -> 123)
+
+    Ids are int32 (nullable Int32 if some are missing)
+    """
+    ids = pd.to_numeric(values.str.slice(len(prefix)), errors="coerce")
+    return ids.astype("Int32" if ids.isna().any() else "int32")
+
+
+# Arrow types of the column types, fixed so that all chunks share one schema
+ARROW_TYPES = {
+    "id": pa.int32(),
+    "str": pa.string(),
+    "category": pa.dictionary(pa.int32(), pa.string()),
+    "Int8": pa.int8(),
+    "Int16": pa.int16(),
+    "Int32": pa.int32(),
+    "float32": pa.float32(),
+}
+
+
+def convert_types(df: pd.DataFrame, name: str) -> pd.DataFrame:
+    """Convert the string columns of a dataset to their `DATASETS` types"""
+    dtypes = DATASETS[name]["dtypes"]
+
+    for col, dtype in dtypes.items():
+        if col not in df.columns:
+            continue
+        if dtype == "id":
+            df[col] = convert_ids(df[col], ID_PREFIXES[col])
+        elif dtype == "category":
+            df[col] = df[col].astype("category")
+        elif dtype != "str":
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype(dtype)
+
+    return df
+
+
+def get_arrow_schema(columns: List[str], name: str) -> pa.Schema:
+    """Returns the Arrow schema of dataset columns (unknown columns are strings)"""
+    dtypes = DATASETS[name]["dtypes"]
+    return pa.schema([(col, ARROW_TYPES[dtypes.get(col, "str")]) for col in columns])
+
+
+def ingest_tsv(
+    tsv_path: str,
+    parquet_path: str,
+    name: str,
+    ids: Optional[Iterable[int]] = None,
+    chunk_rows: int = INGEST_CHUNK_ROWS,
+) -> int:
+    """Convert an IMDB `.tsv.gz` file to a typed Parquet file, chunk by chunk
+
+    Only `chunk_rows` rows are in memory at once: each chunk is typed
+    (`\\N` as null, ids as int32, categories) and written as a Parquet row group.
+    Rows stay in file order.
+
+    Parameters
+    ----------
+    tsv_path : str
+        path of the `.tsv.gz` file
+    parquet_path : str
+        path of the Parquet file to write
+    name : str
+        dataset name, one of `DATASETS`
+    ids : Iterable, optional
+        integer ids to keep (matched on the dataset key, e.g. `tconst` for
+        "title.principals"), by default all rows are kept
+    chunk_rows : int, optional
+        number of rows read at once, by default INGEST_CHUNK_ROWS
+
+    Returns
+    -------
+    int
+        number of rows written
+    """
+    key = DATASETS[name]["key"]
+    if ids is not None:
+        ids = np.unique(np.asarray(list(ids), dtype="int64"))
+
+    reader = pd.read_csv(
+        tsv_path,
+        sep="\t",
+        dtype=str,
+        na_values="\\N",
+        keep_default_na=False,
+        quoting=csv.QUOTE_NONE,
+        chunksize=chunk_rows,
+    )
+
+    n_rows = 0
+    schema = None
+    writer = None
+    try:
+        for chunk in reader:
+            chunk = convert_types(chunk, name)
+            if ids is not None:
+                chunk = chunk.loc[np.isin(chunk[key].to_numpy(), ids)]
+
+            table = pa.Table.from_pandas(
+                chunk,
+                schema=schema or get_arrow_schema(list(chunk.columns), name),
+                preserve_index=False,
+            )
+            if writer is None:
+                schema = table.schema
+                writer = pq.ParquetWriter(parquet_path, schema)
+
+            writer.write_table(table)
+            n_rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    # File without rows
+    if writer is None:
+        columns = pd.read_csv(tsv_path, sep="\t", nrows=0).columns
+        pq.write_table(
+            get_arrow_schema(list(columns), name).empty_table(), parquet_path
+        )
+
+    return n_rows
+
+
+class SortedIndex:
+    """Dataframe sorted by an integer key with binary search lookups
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        dataframe to index (sorted by `key` if it is not already)
+    key : str
+        integer column to search
+    """
+
+    def __init__(self, df: pd.DataFrame, key: str):
+        keys = df[key].to_numpy()
+        if len(keys) > 1 and not (keys[1:] >= keys[:-1]).all():
+            df = df.sort_values(key, kind="stable").reset_index(drop=True)
+            keys = df[key].to_numpy()
+
+        self.df = df
+        self.key = key
+        self.keys = keys
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    def get(self, value) -> pd.DataFrame:
+        """Returns the rows of a key value"""
+        left = np.searchsorted(self.keys, value, side="left")
+        right = np.searchsorted(self.keys, value, side="right")
+        return self.df.iloc[left:right]
+
+    def get_many(self, values: Iterable) -> pd.DataFrame:
+        """Returns the rows of many key values, in the order of the values
+        (duplicated values are returned once, unknown values are ignored)
+        """
+        values = pd.unique(np.asarray(list(values)))
+        left = np.searchsorted(self.keys, values, side="left")
+        right = np.searchsorted(self.keys, values, side="right")
+
+        # Positions of all the rows between left and right of each value
+        counts = right - left
+        starts = np.repeat(left - (np.cumsum(counts) - counts), counts)
+        positions = starts + np.arange(counts.sum())
+
+        return self.df.iloc[positions]
+
+    def contains(self, values: Iterable) -> np.ndarray:
+        """Returns whether each value is a key of the index"""
+        values = np.asarray(list(values))
+        left = np.searchsorted(self.keys, values, side="left")
+        return (left < len(self.keys)) & (
+            self.keys[np.minimum(left, len(self.keys) - 1)] == values
+        )
+
+
+class IMDBDatasets:
+    """Download, convert and index the IMDB bulk datasets
+
+    Parameters
+    ----------
+    folder : str, optional
+        folder of the downloaded and converted files, by default DEFAULT_FOLDER
+    """
+
+    def __init__(self, folder: str = DEFAULT_FOLDER):
+        self.folder = os.path.expanduser(folder)
+        os.makedirs(self.folder, exist_ok=True)
+        self._indexes = {}
+
+    @staticmethod
+    def _check_name(name: str) -> None:
+        """Raises a ValueError if the dataset is unknown"""
+        if name not in DATASETS:
+            raise ValueError(f"name must be one of {list(DATASETS)}")
+
+    def tsv_path(self, name: str) -> str:
+        """Returns the path of the downloaded `.tsv.gz` file"""
+        return os.path.join(self.folder, f"{name}.tsv.gz")
+
+    @staticmethod
+    def _ids_hash(ids: Iterable[int]) -> str:
+        """Returns a short hash of a set of integer ids (order and duplicates
+        do not matter)
+        """
+        ids = np.unique(np.asarray(list(ids), dtype="int64"))
+        return hashlib.sha256(ids.tobytes()).hexdigest()[:12]
+
+    def parquet_path(self, name: str, ids: Optional[Iterable[int]] = None) -> str:
+        """Returns the path of the converted Parquet file
+
+        A subset of `ids` has its own file, named with a hash of the ids
+        """
+        if ids is None:
+            return os.path.join(self.folder, f"{name}.parquet")
+        return os.path.join(self.folder, f"{name}.{self._ids_hash(ids)}.parquet")
+
+    def download(self, name: str, force: bool = False) -> str:
+        """Download a dataset (only once unless `force`)
+
+        Parameters
+        ----------
+        name : str
+            dataset name, one of `DATASETS` (e.g. "title.basics")
+        force : bool, optional
+            whether to download the file again, by default False
+
+        Returns
+        -------
+        str
+            path of the `.tsv.gz` file
+
+        Raises
+        ------
+        RequestException
+            Status code different from 200
+        """
+        self._check_name(name)
+        path = self.tsv_path(name)
+        if os.path.exists(path) and not force:
+            return path
+
+        response = fetch_data_from_url(DATASETS_URL.format(name=name), stream=True)
+        if response.status_code != 200:
+            raise RequestException(
+                f"Status code different from 200, got {response.status_code}"
+            )
+
+        with open(path + ".tmp", "wb") as f:
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+                get_session().add_bytes(len(chunk))
+        os.replace(path + ".tmp", path)
+
+        return path
+
+    def build(
+        self, name: str, force: bool = False, ids: Optional[Iterable[int]] = None
+    ) -> str:
+        """Convert a dataset to a typed Parquet file with `ingest_tsv()`
+        (downloaded first if needed)
+
+        Parameters
+        ----------
+        name : str
+            dataset name, one of `DATASETS`
+        force : bool, optional
+            whether to convert the file again, by default False
+        ids : Iterable, optional
+            integer ids to keep (matched on the dataset key), by default all
+            rows are kept. Each subset is written to its own file (see
+            `parquet_path()`) so that it never replaces the full dataset.
+
+        Returns
+        -------
+        str
+            path of the Parquet file
+        """
+        self._check_name(name)
+        if ids is not None:
+            ids = list(ids)
+        path = self.parquet_path(name, ids)
+        if os.path.exists(path) and not force:
+            return path
+
+        ingest_tsv(self.download(name), path + ".tmp", name, ids=ids)
+        os.replace(path + ".tmp", path)
+
+        return path
+
+    def load(
+        self,
+        name: str,
+        columns: Optional[List[str]] = None,
+        ids: Optional[Iterable[int]] = None,
+    ) -> pd.DataFrame:
+        """Returns a converted dataset, or the subset of `ids`
+        (built first if needed)
+        """
+        return pd.read_parquet(self.build(name, ids=ids), columns=columns)
+
+    def index(
+        self,
+        name: str,
+        columns: Optional[List[str]] = None,
+        ids: Optional[Iterable[int]] = None,
+    ) -> SortedIndex:
+        """Returns a dataset indexed on its key (loaded once)
+
+        Parameters
+        ----------
+        name : str
+            dataset name, one of `DATASETS`
+        columns : list, optional
+            columns to load (the key is always loaded), by default all
+        ids : Iterable, optional
+            integer ids to keep (see `build()`), by default all rows
+        """
+        key = DATASETS[name]["key"]
+        if columns is not None and key not in columns:
+            columns = [key] + list(columns)
+        if ids is not None:
+            ids = list(ids)
+
+        cache_key = (
+            name,
+            None if columns is None else tuple(columns),
+            None if ids is None else self._ids_hash(ids),
+        )
+        if cache_key not in self._indexes:
+            self._indexes[cache_key] = SortedIndex(self.load(name, columns, ids), key)
+
+        return self._indexes[cache_key]
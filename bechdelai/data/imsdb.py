@@ -1,13 +1,26 @@
 """Functions to scrap scripts from IMSDB
 """
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
 import pandas as pd
-from bs4 import BeautifulSoup
+from bs4 import SoupStrainer
+from tqdm.contrib.concurrent import thread_map
 
-from bechdelai.data.scrap import get_data_from_url
+from bechdelai.data.corpus import TextCorpus
+from bechdelai.data.fetch import fetch_data_from_url
+from bechdelai.data.fetch import RequestException
+from bechdelai.data.parsing import make_soup
 
 ALL_URL = "https://imsdb.com/all-scripts.html"
 BASE_URL = "https://imsdb.com"
 
+# Default number of scripts downloaded concurrently by `crawl_scripts()`
+# (requests to imsdb.com are rate limited by the fetch session)
+CRAWL_MAX_WORKERS = 4
+
 
 def get_all_scripts():
     """Scrap all scripts from IMSDB
@@ -20,8 +33,8 @@ def get_all_scripts():
     """
 
     # Get all scripts from ALL_URL
-    ans = get_data_from_url(ALL_URL)
-    soup = BeautifulSoup(ans.text, "html.parser")
+    ans = fetch_data_from_url(ALL_URL)
+    soup = make_soup(ans.text, parse_only=SoupStrainer("p"))
 
     # All scripts are stored into <p>
     scripts_html = soup.find_all("p")
@@ -57,15 +70,103 @@ def get_script_from_url(url):
         List of lines of the script
     """
 
-    ans = get_data_from_url(url)
-    soup = BeautifulSoup(ans.text, "html.parser")
+    ans = fetch_data_from_url(url)
+
+    return parse_script(ans.text).split("\n")
+
+
+def parse_script(page: str) -> Optional[str]:
+    """Extract the script of an IMSDB script page
 
-    # Get script and split it as a array by line
+    Parameters
+    ----------
+    page : str
+        html of the page
+
+    Returns
+    -------
+    str
+        script text, None if the page has no script
+    """
+    soup = make_soup(page, parse_only=SoupStrainer("pre"))
     html = soup.find("pre")
+    if html is None:
+        return None
 
     if html.pre is not None:
         html = html.find("pre")
 
-    script = html.text.split("\n")
+    return html.text
+
+
+def get_script_id(url: str) -> str:
+    """Returns the corpus id of a script url ("Alien" for .../scripts/Alien.html)"""
+    return url.rsplit("/", 1)[-1][: -len(".html")]
+
+
+def _crawl_one_script(script: Tuple[str, str], corpus: TextCorpus) -> dict:
+    """Download a script and add it to the corpus for `crawl_scripts()`"""
+    title, url = script
+    result = {"id": get_script_id(url), "title": title, "url": url}
+    if result["id"] in corpus:
+        return {**result, "status": "cached"}
+
+    try:
+        ans = fetch_data_from_url(url, use_cache=False)
+        if ans.status_code != 200:
+            raise RequestException(
+                f"Status code different from 200, got {ans.status_code}"
+            )
+        text = parse_script(ans.text)
+    except Exception as e:
+        return {**result, "status": "error", "error": str(e)}
+
+    if not text or not text.strip():
+        return {**result, "status": "no_script"}
+
+    corpus.add(result["id"], text, title=title, url=url)
+
+    return {**result, "status": "downloaded"}
+
+
+def crawl_scripts(
+    corpus: TextCorpus,
+    scripts: Optional[pd.DataFrame] = None,
+    n_workers: int = CRAWL_MAX_WORKERS,
+) -> pd.DataFrame:
+    """Download scripts concurrently into a local corpus
+
+    Scripts already in the corpus manifest are skipped, so an interrupted
+    crawl is resumed by calling the function again with the same corpus.
+
+    Parameters
+    ----------
+    corpus : TextCorpus
+        corpus of the scripts (ids are given by `get_script_id()`)
+    scripts : pd.DataFrame, optional
+        scripts to download (title and url), by default `get_all_scripts()`
+    n_workers : int, optional
+        number of scripts downloaded concurrently, by default CRAWL_MAX_WORKERS
+
+    Returns
+    -------
+    pd.DataFrame
+        id, title, url and status of each script ("cached", "downloaded",
+        "no_script" or "error" with the error message)
+    """
+    if scripts is None:
+        scripts = get_all_scripts()
+
+    results = thread_map(
+        lambda script: _crawl_one_script(script, corpus),
+        list(zip(scripts["title"], scripts["url"])),
+        max_workers=n_workers,
+    )
+
+    return pd.DataFrame(results, columns=["id", "title", "url", "status", "error"])
+
 
-    return script
+def iter_scripts(corpus: TextCorpus) -> Iterator[Tuple[str, List[str]]]:
+    """Yield the title and lines of each script of a corpus, one at a time"""
+    for doc_id, text in corpus.iter_texts():
+        yield corpus.get_record(doc_id).get("title", doc_id), text.split("\n")
@@ -1,12 +1,22 @@
+import os
+import re
+import tempfile
 import zipfile
-from io import BytesIO
+from typing import BinaryIO
 from typing import Dict
 from typing import List
+from typing import Optional
+from typing import Tuple
 
-import chardet
+import pandas as pd
 import pysrt
 import requests
 from bs4 import BeautifulSoup
+from tqdm.contrib.concurrent import thread_map
+
+from bechdelai.data.fetch import fetch_data_from_url
+from bechdelai.data.fetch import get_session
+from bechdelai.utils.encoding import decode_bytes
 
 BASE_URL = "https://www.opensubtitles.org"
 QUERY_URL = (
@@ -15,6 +25,16 @@ QUERY_URL = (
 
 DEFAULT_LANGUAGE_CODE = "fre"
 
+# Default number of movies processed concurrently by `download_subtitles()`
+# (requests to opensubtitles.org are rate limited by the fetch session)
+SUBTITLES_MAX_WORKERS = 4
+
+# Size of the chunks read when streaming a zip
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Size over which a streamed zip is spooled to disk instead of memory
+SPOOL_MAX_SIZE = 4 * 1024**2
+
 
 def search(
     movie_name: str, language_code: str = DEFAULT_LANGUAGE_CODE
@@ -30,7 +50,7 @@ def search(
     """
     query_url = QUERY_URL.format(language_code=language_code, movie_name=movie_name)
     try:
-        response = requests.get(query_url)
+        response = fetch_data_from_url(query_url)
         response.raise_for_status()
     except requests.exceptions.HTTPError as errh:
         raise Exception("Http Error:", errh)
@@ -61,7 +81,7 @@ def get_subtitle_link(search_url: str) -> str:
         str: the subtitle download link from the search url
     """
     try:
-        response = requests.get(search_url)
+        response = fetch_data_from_url(search_url)
         response.raise_for_status()
     except requests.exceptions.HTTPError as errh:
         raise Exception("Http Error:", errh)
@@ -79,11 +99,40 @@ def get_subtitle_link(search_url: str) -> str:
     return f"{BASE_URL}{download_link.get('href')}"
 
 
-def download_subtitle_from_url(url: str) -> List[str]:
-    response = requests.get(url)
-    f = BytesIO()
-    f.write(response.content)
-    return _extract_zip(f)
+def _stream_to_file(url: str, f: BinaryIO) -> None:
+    """Write the streamed body of a request to a file, chunk by chunk
+
+    Args:
+        url (str): the url to download
+        f (BinaryIO): the file to write to
+
+    Raises:
+        requests.exceptions.HTTPError: status code of the answer is an error
+    """
+    response = fetch_data_from_url(url, stream=True)
+    response.raise_for_status()
+
+    for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+        f.write(chunk)
+        get_session().add_bytes(len(chunk))
+
+
+def download_subtitle_from_url(url: str) -> pysrt.SubRipFile:
+    """Download a subtitles zip and extract its srt file
+
+    The zip is streamed to a spooled temporary file (kept in memory
+    unless it is larger than SPOOL_MAX_SIZE).
+
+    Args:
+        url (str): the subtitle download link
+
+    Returns:
+        pysrt.SubRipFile: the extracted subtitles
+    """
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as f:
+        _stream_to_file(url, f)
+        f.seek(0)
+        return _extract_zip(f)
 
 
 def get_subtitles_from_movie(
@@ -138,11 +187,14 @@ def get_subtitles_from_movie(
     return download_subtitle_from_url(subtitle_url)
 
 
-def _extract_zip(input_zip: BytesIO) -> pysrt.SubRipFile:
+def _extract_zip(input_zip: BinaryIO) -> pysrt.SubRipFile:
     """extract content from zip file
 
+    The encoding of the srt file is detected with `decode_bytes()`
+    (BOM and UTF-8 checks first, then detection on a sample).
+
     Args:
-        input_zip (BytesIO): the zip file to extract content from
+        input_zip (BinaryIO): the zip file to extract content from
 
     Returns:
         pysrt.SubRipFile: the extracted content as a pysrt SubRipFile
@@ -156,9 +208,7 @@ def _extract_zip(input_zip: BytesIO) -> pysrt.SubRipFile:
 
                 # If srt file then get the string
                 with zfile.open(name) as readfile:
-                    srt = readfile.read()
-                    encoding = chardet.detect(srt)["encoding"]
-                    srt = srt.decode(encoding)
+                    srt = decode_bytes(readfile.read())
                     break
     except Exception as e:
         print("Error during unzipping:", e)
@@ -169,3 +219,111 @@ def _extract_zip(input_zip: BytesIO) -> pysrt.SubRipFile:
         print("Error during pysrt parsing:", e)
 
         return pysrt.SubRipFile()
+
+
+def choose_search_result(
+    search_results: Dict[str, str], year: Optional[int] = None
+) -> Optional[str]:
+    """Choose a search result without user input
+
+    Args:
+        search_results (Dict[str, str]): movie name and url returned by `search()`
+        year (int, optional): release year of the movie. Defaults to None.
+
+    Returns:
+        Optional[str]: url of the first result with the year in its name
+            (first result if no year is given), None if there is no match
+    """
+    for name, url in search_results.items():
+        if year is None or f"({year})" in name:
+            return url
+    return None
+
+
+def get_subtitle_zip_path(
+    folder: str, movie_name: str, year: Optional[int], language_code: str
+) -> str:
+    """Returns the path of the cached subtitles zip of a movie"""
+    slug = re.sub(r"\W+", "_", movie_name.lower()).strip("_")
+    return os.path.join(folder, f"{slug}_{year}_{language_code}.zip")
+
+
+def _download_one_subtitle(
+    movie: Tuple[str, Optional[int], str], folder: str
+) -> Dict[str, str]:
+    """Resolve and download the subtitles zip of one movie for `download_subtitles()`"""
+    movie_name, year, language_code = movie
+    result = {"movie_name": movie_name, "year": year, "language_code": language_code}
+
+    path = get_subtitle_zip_path(folder, movie_name, year, language_code)
+    if os.path.exists(path):
+        return {**result, "path": path, "status": "cached"}
+
+    try:
+        search_url = choose_search_result(search(movie_name, language_code), year)
+        if search_url is None:
+            return {**result, "path": None, "status": "not_found"}
+
+        subtitle_url = get_subtitle_link(search_url)
+        if not subtitle_url:
+            return {**result, "path": None, "status": "no_subtitles"}
+
+        # The file on disk is the cache of the zip (streamed requests are not cached)
+        with open(path + ".tmp", "wb") as f:
+            _stream_to_file(subtitle_url, f)
+    except Exception as e:
+        if os.path.exists(path + ".tmp"):
+            os.remove(path + ".tmp")
+        return {**result, "path": None, "status": "error", "error": str(e)}
+
+    os.replace(path + ".tmp", path)
+
+    return {**result, "path": path, "status": "downloaded"}
+
+
+def download_subtitles(
+    movies: List[Tuple[str, Optional[int], str]],
+    folder: str = "subtitles",
+    n_workers: int = SUBTITLES_MAX_WORKERS,
+) -> pd.DataFrame:
+    """Download the subtitles of many movies without user input
+
+    For each movie the first search result with the movie year is taken.
+    Subtitles zips are saved in `folder`, movies with a zip already saved
+    are skipped before any request.
+
+    Args:
+        movies (List[Tuple[str, Optional[int], str]]): (movie name, year, language code) of each movie,
+            year can be None to take the first search result
+        folder (str, optional): folder of the subtitles zips. Defaults to "subtitles".
+        n_workers (int, optional): number of movies processed concurrently. Defaults to SUBTITLES_MAX_WORKERS.
+
+    Returns:
+        pd.DataFrame: movie name, year, language code, path of the zip and status of each movie
+            ("cached", "downloaded", "not_found", "no_subtitles" or "error" with the error message)
+    """
+    os.makedirs(folder, exist_ok=True)
+
+    results = thread_map(
+        lambda movie: _download_one_subtitle(movie, folder),
+        [tuple(movie) for movie in movies],
+        max_workers=n_workers,
+    )
+
+    return pd.DataFrame(
+        results,
+        columns=["movie_name", "year", "language_code", "path", "status", "error"],
+    )
+
+
+def load_subtitle_zip(path: str) -> pysrt.SubRipFile:
+    """Load the subtitles of a zip saved by `download_subtitles()`
+
+    Args:
+        path (str): path of the zip
+
+    Returns:
+        pysrt.SubRipFile: the subtitles of the first srt file of the zip
+    """
+    with open(path, "rb") as f:
+        return _extract_zip(f)
@@ -0,0 +1,213 @@
+"""Typed Parquet output of the TMDB bulk results
+
+Dataframes returned by `TMDB.get_all_movies_details()` are object typed,
+with ids as strings and nested lists (genres, production companies...)
+that CSV files can only store as strings. They are converted here to
+Arrow tables with a typed schema: integer ids, categorical departments
+and jobs and native nested list columns.
+
+```python
+from bechdelai.data.parquet import write_parquet
+
+movies_df, cast_df, crew_df = tmdb.get_all_movies_details(ids)
+write_parquet(cast_df, "data/movies_cast", kind="cast", partition_cols=["department"])
+```
+"""
+import uuid
+from typing import List
+from typing import Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Categorical strings (stored as Arrow dictionaries)
+CATEGORY = pa.dictionary(pa.int32(), pa.string())
+
+# Nested columns of the movie details
+GENRES = pa.list_(pa.struct([("id", pa.int64()), ("name", pa.string())]))
+COMPANIES = pa.list_(
+    pa.struct(
+        [
+            ("id", pa.int64()),
+            ("logo_path", pa.string()),
+            ("name", pa.string()),
+            ("origin_country", pa.string()),
+        ]
+    )
+)
+COUNTRIES = pa.list_(pa.struct([("iso_3166_1", pa.string()), ("name", pa.string())]))
+LANGUAGES = pa.list_(
+    pa.struct(
+        [
+            ("english_name", pa.string()),
+            ("iso_639_1", pa.string()),
+            ("name", pa.string()),
+        ]
+    )
+)
+
+# Types of the known columns of each dataframe kind,
+# the types of the other columns are inferred
+SCHEMAS = {
+    "movies": {
+        "id": pa.int64(),
+        "imdb_id": pa.string(),
+        "title": pa.string(),
+        "original_title": pa.string(),
+        "original_language": CATEGORY,
+        "status": CATEGORY,
+        "release_date": pa.date32(),
+        "runtime": pa.int32(),
+        "budget": pa.int64(),
+        "revenue": pa.int64(),
+        "popularity": pa.float64(),
+        "vote_average": pa.float64(),
+        "vote_count": pa.int64(),
+        "adult": pa.bool_(),
+        "video": pa.bool_(),
+        "genres": GENRES,
+        "production_companies": COMPANIES,
+        "production_countries": COUNTRIES,
+        "spoken_languages": LANGUAGES,
+    },
+    "cast": {
+        "id": pa.int64(),
+        "movie_id": pa.int64(),
+        "cast_id": pa.int64(),
+        "gender": pa.int8(),
+        "name": pa.string(),
+        "original_name": pa.string(),
+        "character": pa.string(),
+        "order": pa.int32(),
+        "popularity": pa.float64(),
+        "credit_id": pa.string(),
+        "known_for_department": CATEGORY,
+        "adult": pa.bool_(),
+    },
+    "crew": {
+        "id": pa.int64(),
+        "movie_id": pa.int64(),
+        "gender": pa.int8(),
+        "name": pa.string(),
+        "original_name": pa.string(),
+        "department": CATEGORY,
+        "job": CATEGORY,
+        "popularity": pa.float64(),
+        "credit_id": pa.string(),
+        "known_for_department": CATEGORY,
+        "adult": pa.bool_(),
+    },
+}
+
+
+def _to_arrow_array(values: pd.Series, arrow_type: pa.DataType) -> pa.Array:
+    """Convert a pandas column to an Arrow array of the wanted type"""
+    if pa.types.is_integer(arrow_type) or pa.types.is_floating(arrow_type):
+        values = pd.to_numeric(values, errors="coerce")
+        return pa.array(values, type=arrow_type, from_pandas=True, safe=False)
+
+    if pa.types.is_date(arrow_type):
+        values = pd.to_datetime(values, errors="coerce").dt.date
+        return pa.array(values, type=arrow_type, from_pandas=True)
+
+    if pa.types.is_dictionary(arrow_type):
+        values = values.astype(object).where(values.notna(), None)
+        return pa.array(values, type=pa.string(), from_pandas=True).dictionary_encode()
+
+    if pa.types.is_string(arrow_type):
+        values = values.astype(object).where(values.notna(), None).map(
+            lambda x: x if x is None else str(x)
+        )
+
+    return pa.array(values, type=arrow_type, from_pandas=True)
+
+
+def to_arrow_table(df: pd.DataFrame, kind: Optional[str] = None) -> pa.Table:
+    """Convert a TMDB dataframe to a typed Arrow table
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        movies details, cast or crew dataframe
+    kind : str, optional
+        "movies", "cast" or "crew" to use the typed schema of `SCHEMAS`,
+        by default None (all types are inferred)
+
+    Returns
+    -------
+    pa.Table
+        typed table
+
+    Raises
+    ------
+    ValueError
+        `kind` is not valid
+    """
+    if kind is not None and kind not in SCHEMAS:
+        raise ValueError(f"kind must be one of {list(SCHEMAS)}")
+
+    schema = SCHEMAS.get(kind, {})
+
+    arrays = []
+    for col in df.columns:
+        if col in schema:
+            arrays.append(_to_arrow_array(df[col], schema[col]))
+        else:
+            arrays.append(pa.array(df[col], from_pandas=True))
+
+    return pa.Table.from_arrays(arrays, names=[str(col) for col in df.columns])
+
+
+def write_parquet(
+    df: pd.DataFrame,
+    path: str,
+    kind: Optional[str] = None,
+    partition_cols: Optional[List[str]] = None,
+) -> None:
+    """Write a TMDB dataframe as Parquet with a typed schema
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        movies details, cast or crew dataframe
+    path : str
+        file path, or folder of the dataset if `partition_cols` is set
+    kind : str, optional
+        "movies", "cast" or "crew" (see `to_arrow_table()`), by default None
+    partition_cols : list, optional
+        columns to partition the dataset by. New files are added to the
+        dataset so successive calls append data, by default None
+    """
+    table = to_arrow_table(df, kind)
+
+    if partition_cols is None:
+        pq.write_table(table, path)
+    else:
+        pq.write_to_dataset(
+            table,
+            root_path=path,
+            partition_cols=partition_cols,
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+        )
+
+
+def read_parquet(path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Read a Parquet file or dataset written with `write_parquet()`
+
+    Dictionary columns are returned as pandas categoricals and nested
+    columns as lists of dictionaries.
+
+    Parameters
+    ----------
+    path : str
+        file or dataset folder
+    columns : list, optional
+        columns to read, by default all
+
+    Returns
+    -------
+    pd.DataFrame
+        loaded dataframe
+    """
+    return pq.read_table(path, columns=columns).to_pandas()
@@ -0,0 +1,100 @@
+"""HTML parsing backend of the scrapers
+
+Scrapers only look up a handful of nodes in each page, so they parse
+the matching tags only (`SoupStrainer`) with the fastest available
+BeautifulSoup backend: lxml if installed, Python `html.parser` otherwise.
+
+```python
+from bs4 import SoupStrainer
+from bechdelai.data.parsing import has_class
+from bechdelai.data.parsing import make_soup
+
+soup = make_soup(html, parse_only=SoupStrainer("li", {"class": has_class("mdl")}))
+movies_html = soup.find_all("li", {"class": "mdl"})
+```
+"""
+from typing import Callable
+from typing import Optional
+from typing import Union
+
+from bs4 import BeautifulSoup
+from bs4 import SoupStrainer
+
+try:
+    import lxml  # noqa: F401
+
+    DEFAULT_BACKEND = "lxml"
+except ImportError:
+    DEFAULT_BACKEND = "html.parser"
+
+VALID_BACKENDS = ["lxml", "html.parser", "html5lib"]
+
+_backend = DEFAULT_BACKEND
+
+
+def get_backend() -> str:
+    """Returns the backend used by `make_soup()`"""
+    return _backend
+
+
+def set_backend(backend: str) -> None:
+    """Set the backend used by `make_soup()`
+
+    Parameters
+    ----------
+    backend : str
+        one of `VALID_BACKENDS` (the matching package must be installed)
+
+    Raises
+    ------
+    ValueError
+        `backend` is not valid
+    """
+    global _backend
+
+    if backend not in VALID_BACKENDS:
+        raise ValueError(f"backend must be one of {VALID_BACKENDS}")
+
+    _backend = backend
+
+
+def has_class(class_name: str) -> Callable[[Optional[str]], bool]:
+    """Returns a `SoupStrainer` attribute matcher of tags having a CSS class
+
+    Strainers see the raw `class` attribute, so `{"class": "mdl"}` would
+    not match `class="mdl big"` while `{"class": has_class("mdl")}` does.
+    """
+
+    def match(value) -> bool:
+        if value is None:
+            return False
+        if isinstance(value, str):
+            value = value.split()
+        return class_name in value
+
+    return match
+
+
+def make_soup(
+    html: Union[str, bytes],
+    parse_only: Optional[SoupStrainer] = None,
+    backend: Optional[str] = None,
+) -> BeautifulSoup:
+    """Parse an HTML page
+
+    Parameters
+    ----------
+    html : str or bytes
+        page content
+    parse_only : SoupStrainer, optional
+        only build the tags matching the strainer (and their children),
+        by default the whole page is parsed
+    backend : str, optional
+        BeautifulSoup parser, by default `get_backend()`
+
+    Returns
+    -------
+    BeautifulSoup
+        parsed page
+    """
+    return BeautifulSoup(html, backend or _backend, parse_only=parse_only)
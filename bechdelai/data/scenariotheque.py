@@ -1,11 +1,25 @@
+import hashlib
+import os
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
 import fitz
 import pandas as pd
-import requests
-from bechdelai.data.scrap import RequestException, get_data_from_url
+from bechdelai.data.fetch import RequestException, fetch_data_from_url
 from bs4 import BeautifulSoup
 
 MAIN_URL = "https://lecteursanonymes.org/scenario/"
 
+# Default number of PDFs downloaded concurrently by `extract_scripts()`
+# (requests to lecteursanonymes.org are rate limited by the fetch session)
+DOWNLOAD_MAX_WORKERS = 4
+
+# Number of pages parsed by one process task, larger PDFs are split
+PAGES_PER_TASK = 40
+
 
 def get_scripts():
     """Return list of scripts available on lecteursanonymes
@@ -13,7 +27,7 @@ def get_scripts():
     """
     url = MAIN_URL
 
-    ans = get_data_from_url(url)
+    ans = fetch_data_from_url(url)
 
     if ans.status_code != 200:
         raise RequestException(
@@ -38,16 +52,188 @@ def get_scripts():
 def read_pdf_from_stream(stream):
     """Parse a PDF file
     """
-    text = ""
     with fitz.open(stream=stream, filetype="pdf") as doc:
-        for page in doc:
-            text += page.get_text()
-    return text
+        return "".join(page.get_text() for page in doc)
 
-def get_file_content(url):
-    r = requests.get(url)
+def read_pdf_pages(path, start, end):
+    """Parse the pages `start` to `end` (excluded) of a PDF file on disk
+    """
+    with fitz.open(path, filetype="pdf") as doc:
+        return "".join(doc[i].get_text() for i in range(start, min(end, len(doc))))
+
+def count_pdf_pages(stream):
+    """Return the number of pages of a PDF file
+    """
+    with fitz.open(stream=stream, filetype="pdf") as doc:
+        return len(doc)
+
+def download_pdf(url):
+    """Return the content of a PDF file
+    """
+    r = fetch_data_from_url(url, use_cache=False)
     if r.status_code != 200:
         raise RequestException(
             "Request response is not valid (status code %s)" % r.status_code
         )
-    return read_pdf_from_stream(r.content)
+    return r.content
+
+def get_file_content(url):
+    return read_pdf_from_stream(download_pdf(url))
+
+def _download_pdfs(urls, n_workers):
+    """Yield (url, future of the PDF content) in url order, with at most
+    `2 * n_workers` downloads submitted ahead of the one being consumed
+    """
+    urls = iter(urls)
+    with ThreadPoolExecutor(n_workers) as executor:
+        futures = deque(
+            (url, executor.submit(download_pdf, url))
+            for url in islice(urls, 2 * n_workers)
+        )
+        try:
+            while futures:
+                url, future = futures.popleft()
+                for next_url in islice(urls, 1):
+                    futures.append((next_url, executor.submit(download_pdf, next_url)))
+                yield url, future
+        finally:
+            for _, future in futures:
+                future.cancel()
+
+def extract_scripts(
+    urls,
+    corpus,
+    n_workers=None,
+    n_download_workers=DOWNLOAD_MAX_WORKERS,
+    pages_per_task=PAGES_PER_TASK,
+):
+    """Download PDF scripts and extract their text into a corpus
+
+    PDFs are downloaded concurrently in threads, written to a temporary
+    folder and parsed in a process pool by ranges of `pages_per_task` pages,
+    so that a large PDF is parsed by several processes and only its path is
+    sent to them. At most `2 * n_workers` page ranges are parsed or waiting,
+    older PDFs are added to the corpus before new ones are submitted.
+
+    Texts are stored in the corpus under the sha256 hash of their PDF with
+    the `urls` serving it: urls already in the corpus manifest are not
+    downloaded again, and a PDF already extracted from another url is not
+    parsed again (the url is added to its record).
+
+    Parameters
+    ----------
+    urls : list
+        urls of the PDF files (e.g. the "PDF" column of `get_scripts()`)
+    corpus : TextCorpus
+        corpus of the extracted texts
+    n_workers : int, optional
+        number of parsing processes, by default the number of CPUs
+    n_download_workers : int, optional
+        number of concurrent downloads, by default DOWNLOAD_MAX_WORKERS
+    pages_per_task : int, optional
+        number of pages parsed by one task, by default PAGES_PER_TASK
+
+    Returns
+    -------
+    pd.DataFrame
+        url, PDF hash, number of pages and status of each PDF
+        ("cached", "extracted" or "error" with the error message)
+    """
+    urls = list(urls)
+    n_workers = n_workers or os.cpu_count() or 1
+    max_pending_tasks = 2 * n_workers
+
+    done_urls = {}
+    for record in corpus.manifest:
+        for url in record.get("urls", [record.get("url")]):
+            done_urls[url] = record
+
+    results = {}
+    for url in urls:
+        if url in done_urls:
+            record = done_urls[url]
+            results[url] = {
+                "url": url,
+                "sha256": record["id"],
+                "n_pages": record.get("n_pages"),
+                "status": "cached",
+            }
+
+    def add_url(pdf_hash, url):
+        """Record one more url of a PDF already in the corpus"""
+        record = corpus.get_record(pdf_hash)
+        if url not in record.get("urls", []):
+            corpus.update(pdf_hash, urls=record.get("urls", []) + [url])
+        results[url] = {
+            "url": url,
+            "sha256": pdf_hash,
+            "n_pages": record.get("n_pages"),
+            "status": "cached",
+        }
+
+    # PDFs being parsed, in submission order: hash -> (path, n_pages, urls, futures)
+    pending = {}
+
+    def finish_oldest():
+        """Join the page ranges of the oldest PDF being parsed and store its text"""
+        pdf_hash = next(iter(pending))
+        path, n_pages, pdf_urls, page_futures = pending.pop(pdf_hash)
+        result = {"sha256": pdf_hash, "n_pages": n_pages}
+        try:
+            text = "".join(f.result() for f in page_futures)
+        except Exception as e:
+            for url in pdf_urls:
+                results[url] = {
+                    "url": url,
+                    **result,
+                    "status": "error",
+                    "error": str(e),
+                }
+        else:
+            corpus.add(pdf_hash, text, url=pdf_urls[0], urls=pdf_urls, n_pages=n_pages)
+            for url in pdf_urls:
+                results[url] = {"url": url, **result, "status": "extracted"}
+        finally:
+            os.remove(path)
+
+    to_download = [url for url in dict.fromkeys(urls) if url not in results]
+    parser = ProcessPoolExecutor(n_workers)
+    with tempfile.TemporaryDirectory() as folder, parser:
+        for url, future in _download_pdfs(to_download, n_download_workers):
+            try:
+                content = future.result()
+                n_pages = count_pdf_pages(content)
+            except Exception as e:
+                results[url] = {"url": url, "status": "error", "error": str(e)}
+                continue
+
+            pdf_hash = hashlib.sha256(content).hexdigest()
+            if pdf_hash in pending:
+                pending[pdf_hash][2].append(url)
+                continue
+            if pdf_hash in corpus:
+                add_url(pdf_hash, url)
+                continue
+
+            path = os.path.join(folder, f"{pdf_hash}.pdf")
+            with open(path, "wb") as f:
+                f.write(content)
+
+            page_futures = [
+                parser.submit(read_pdf_pages, path, i, i + pages_per_task)
+                for i in range(0, max(n_pages, 1), pages_per_task)
+            ]
+            pending[pdf_hash] = (path, n_pages, [url], page_futures)
+
+            n_pending_tasks = sum(len(p[3]) for p in pending.values())
+            while n_pending_tasks > max_pending_tasks and len(pending) > 1:
+                n_pending_tasks -= len(pending[next(iter(pending))][3])
+                finish_oldest()
+
+        while pending:
+            finish_oldest()
+
+    return pd.DataFrame(
+        [results[url] for url in urls],
+        columns=["url", "sha256", "n_pages", "status", "error"],
+    )
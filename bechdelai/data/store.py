@@ -0,0 +1,411 @@
+"""Local SQLite stores for data fetched from the APIs
+
+Stores are filled as data is fetched so that bulk runs only
+request what is not known yet.
+"""
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Set
+
+import pandas as pd
+
+DEFAULT_STORE_PATH = "~/.cache/bechdelai/store.sqlite"
+
+# Maximum number of parameters in one SQLite query
+SQLITE_CHUNK_SIZE = 500
+
+
+def normalize_imdb_id(imdb_id) -> str:
+    """Returns the IMDB id as "tt" followed by at least 7 digits
+
+    Example: 123, "123", "tt0000123" all become "tt0000123"
+    """
+    return "tt" + str(imdb_id).replace("tt", "").zfill(7)
+
+
+def _chunks(values: list, size: int = SQLITE_CHUNK_SIZE) -> Iterable[list]:
+    """Split a list in chunks of `size` elements"""
+    for i in range(0, len(values), size):
+        yield values[i : i + size]
+
+
+class SQLiteStore:
+    """Base class of the stores: a SQLite database shared between threads
+    with a `meta` table for key/value settings (e.g. sync watermarks)
+
+    Parameters
+    ----------
+    path : str, optional
+        path of the SQLite database, by default DEFAULT_STORE_PATH
+    """
+
+    # SQL statements creating the tables of the store
+    SCHEMA = []
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        self.path = os.path.expanduser(path)
+
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        for statement in self.SCHEMA:
+            self._conn.execute(statement)
+        self._conn.commit()
+
+    def get_meta(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        """Returns a value of the meta table"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM meta WHERE key = ?", (key,)
+            ).fetchone()
+
+        return default if row is None else row[0]
+
+    def set_meta(self, key: str, value: str) -> None:
+        """Set a value of the meta table"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(value))
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        """Close the database"""
+        with self._lock:
+            self._conn.close()
+
+
+class IdMappingIndex(SQLiteStore):
+    """Index of IMDB ids to TMDB ids
+
+    IMDB ids without TMDB match are also stored (with a None TMDB id)
+    so that they are not requested again.
+
+    Parameters
+    ----------
+    path : str, optional
+        path of the SQLite database, by default DEFAULT_STORE_PATH
+    """
+
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS imdb_tmdb_ids (imdb_id TEXT PRIMARY KEY, tmdb_id TEXT)"
+    ]
+
+    def get_many(self, imdb_ids: Iterable) -> Dict[str, Optional[str]]:
+        """Returns the known TMDB ids of IMDB ids
+
+        Parameters
+        ----------
+        imdb_ids : Iterable
+            IMDB ids (any format accepted by `normalize_imdb_id()`)
+
+        Returns
+        -------
+        dict
+            normalized IMDB id to TMDB id (None if no match) for the
+            ids in the index, unknown ids are missing
+        """
+        imdb_ids = list({normalize_imdb_id(imdb_id) for imdb_id in imdb_ids})
+
+        mapping = {}
+        with self._lock:
+            for chunk in _chunks(imdb_ids):
+                rows = self._conn.execute(
+                    "SELECT imdb_id, tmdb_id FROM imdb_tmdb_ids WHERE imdb_id IN (%s)"
+                    % ",".join("?" * len(chunk)),
+                    chunk,
+                )
+                mapping.update(rows)
+
+        return mapping
+
+    def set_many(self, mapping: Dict) -> None:
+        """Store IMDB ids to TMDB ids (None or NaN if no match)"""
+        rows = [
+            (normalize_imdb_id(imdb_id), None if pd.isna(tmdb_id) else str(tmdb_id))
+            for imdb_id, tmdb_id in mapping.items()
+        ]
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO imdb_tmdb_ids VALUES (?, ?)", rows
+            )
+            self._conn.commit()
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Returns the whole index as a dataframe"""
+        with self._lock:
+            return pd.read_sql("SELECT * FROM imdb_tmdb_ids", self._conn)
+
+
+class TMDBStore(SQLiteStore):
+    """Local copy of TMDB movies, cast, crew and persons
+
+    Rows are stored as JSON so that the dataframes returned by the
+    `TMDB` client can be saved whatever their columns.
+
+    Parameters
+    ----------
+    path : str, optional
+        path of the SQLite database, by default DEFAULT_STORE_PATH
+    """
+
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS movies (id TEXT PRIMARY KEY, data TEXT)",
+        "CREATE TABLE IF NOT EXISTS cast (movie_id TEXT, data TEXT)",
+        "CREATE INDEX IF NOT EXISTS cast_movie_id ON cast (movie_id)",
+        "CREATE TABLE IF NOT EXISTS crew (movie_id TEXT, data TEXT)",
+        "CREATE INDEX IF NOT EXISTS crew_movie_id ON crew (movie_id)",
+        "CREATE TABLE IF NOT EXISTS persons (id TEXT PRIMARY KEY, data TEXT)",
+    ]
+
+    def upsert_movies(
+        self, movies_df: pd.DataFrame, cast_df: pd.DataFrame, crew_df: pd.DataFrame
+    ) -> None:
+        """Insert or replace movies with their cast and crew
+
+        Parameters
+        ----------
+        movies_df, cast_df, crew_df : pd.DataFrame
+            dataframes returned by `TMDB.get_all_movies_details()`
+        """
+        movie_ids = [str(movie_id) for movie_id in movies_df["id"]]
+        movies = [
+            (str(movie["id"]), json.dumps(movie, default=str))
+            for movie in movies_df.to_dict(orient="records")
+        ]
+
+        with self._lock:
+            for table, df in [("cast", cast_df), ("crew", crew_df)]:
+                for chunk in _chunks(movie_ids):
+                    self._conn.execute(
+                        f"DELETE FROM {table} WHERE movie_id IN (%s)"
+                        % ",".join("?" * len(chunk)),
+                        chunk,
+                    )
+                self._conn.executemany(
+                    f"INSERT INTO {table} VALUES (?, ?)",
+                    [
+                        (str(row["movie_id"]), json.dumps(row, default=str))
+                        for row in df.to_dict(orient="records")
+                    ],
+                )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO movies VALUES (?, ?)", movies
+            )
+            self._conn.commit()
+
+    def upsert_persons(self, persons: List[dict]) -> None:
+        """Insert or replace persons details (as returned by `TMDB.get_person_details()`)"""
+        rows = [
+            (str(person["id"]), json.dumps(person, default=str)) for person in persons
+        ]
+
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO persons VALUES (?, ?)", rows)
+            self._conn.commit()
+
+    def _ids(self, table: str) -> Set[str]:
+        """Returns all the ids of a table"""
+        with self._lock:
+            return {row[0] for row in self._conn.execute(f"SELECT id FROM {table}")}
+
+    def movie_ids(self) -> Set[str]:
+        """Returns the ids of the stored movies"""
+        return self._ids("movies")
+
+    def person_ids(self) -> Set[str]:
+        """Returns the ids of the stored persons"""
+        return self._ids("persons")
+
+    def get_persons(self, person_ids: Iterable) -> Dict[str, dict]:
+        """Returns stored persons details by id (unknown ids are missing)"""
+        person_ids = list({str(person_id) for person_id in person_ids})
+
+        persons = {}
+        with self._lock:
+            for chunk in _chunks(person_ids):
+                rows = self._conn.execute(
+                    "SELECT id, data FROM persons WHERE id IN (%s)"
+                    % ",".join("?" * len(chunk)),
+                    chunk,
+                )
+                persons.update((row[0], json.loads(row[1])) for row in rows)
+
+        return persons
+
+    def _load(self, table: str) -> pd.DataFrame:
+        """Returns all the rows of a table as a dataframe"""
+        with self._lock:
+            rows = self._conn.execute(f"SELECT data FROM {table}").fetchall()
+
+        return pd.DataFrame([json.loads(row[0]) for row in rows])
+
+    def load_movies(self) -> pd.DataFrame:
+        """Returns the stored movies details"""
+        return self._load("movies")
+
+    def load_cast(self) -> pd.DataFrame:
+        """Returns the stored cast of all movies"""
+        return self._load("cast")
+
+    def load_crew(self) -> pd.DataFrame:
+        """Returns the stored crew of all movies"""
+        return self._load("crew")
+
+    def load_persons(self) -> pd.DataFrame:
+        """Returns the stored persons details"""
+        return self._load("persons")
+
+
+class BechdelTestStore(SQLiteStore):
+    """Local copy of the bechdeltest.com catalogue with the TMDB id of each movie
+
+    Parameters
+    ----------
+    path : str, optional
+        path of the SQLite database, by default DEFAULT_STORE_PATH
+    """
+
+    SCHEMA = ["""CREATE TABLE IF NOT EXISTS bechdel_movies (
+            id INTEGER PRIMARY KEY,
+            imdbid TEXT,
+            title TEXT,
+            year INTEGER,
+            rating INTEGER,
+            tmdb_id TEXT,
+            tmdb_checked INTEGER DEFAULT 0
+        )"""]
+
+    # Columns of the bechdeltest.com API
+    COLUMNS = ["id", "imdbid", "title", "year", "rating"]
+
+    @staticmethod
+    def _to_row(movie: dict) -> tuple:
+        """Returns the stored values of a movie of the API"""
+
+        def to_int(value):
+            value = pd.to_numeric(value, errors="coerce")
+            return None if pd.isna(value) else int(value)
+
+        def to_str(value):
+            return None if pd.isna(value) else str(value)
+
+        return (
+            to_int(movie["id"]),
+            to_str(movie["imdbid"]),
+            to_str(movie["title"]),
+            to_int(movie["year"]),
+            to_int(movie["rating"]),
+        )
+
+    def _rows(self) -> Dict[int, tuple]:
+        """Returns the stored API columns by id"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT %s FROM bechdel_movies" % ", ".join(self.COLUMNS)
+            ).fetchall()
+
+        return {row[0]: row for row in rows}
+
+    def merge(self, movies_df: pd.DataFrame) -> Dict[str, int]:
+        """Insert new movies and update changed ones
+
+        The TMDB id of a movie is kept unless its IMDB id changed.
+
+        Parameters
+        ----------
+        movies_df : pd.DataFrame
+            catalogue returned by the API (see `bechdeltestcom.fetch_all_data()`)
+
+        Returns
+        -------
+        dict
+            number of "new", "changed" and "unchanged" movies
+        """
+        rows = [
+            self._to_row(movie)
+            for movie in movies_df[self.COLUMNS].to_dict(orient="records")
+        ]
+        stored = self._rows()
+
+        new = [row for row in rows if row[0] not in stored]
+        changed = [row for row in rows if row[0] in stored and stored[row[0]] != row]
+
+        with self._lock:
+            self._conn.executemany(
+                """INSERT INTO bechdel_movies (id, imdbid, title, year, rating)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    tmdb_id = CASE WHEN imdbid IS excluded.imdbid THEN tmdb_id END,
+                    tmdb_checked = CASE WHEN imdbid IS excluded.imdbid THEN tmdb_checked ELSE 0 END,
+                    imdbid = excluded.imdbid,
+                    title = excluded.title,
+                    year = excluded.year,
+                    rating = excluded.rating""",
+                new + changed,
+            )
+            self._conn.commit()
+
+        return {
+            "new": len(new),
+            "changed": len(changed),
+            "unchanged": len(rows) - len(new) - len(changed),
+        }
+
+    def max_id(self) -> Optional[int]:
+        """Returns the highest stored bechdeltest.com id"""
+        with self._lock:
+            return self._conn.execute("SELECT MAX(id) FROM bechdel_movies").fetchone()[
+                0
+            ]
+
+    def unmatched_imdb_ids(self) -> List[str]:
+        """Returns the IMDB ids whose TMDB id was not looked up yet"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT imdbid FROM bechdel_movies "
+                "WHERE tmdb_checked = 0 AND imdbid IS NOT NULL"
+            ).fetchall()
+
+        return [row[0] for row in rows]
+
+    def set_tmdb_ids(self, mapping: Dict) -> None:
+        """Store the TMDB ids (None or NaN if no match) of IMDB ids"""
+        rows = [
+            (None if pd.isna(tmdb_id) else str(tmdb_id), imdb_id)
+            for imdb_id, tmdb_id in mapping.items()
+        ]
+
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE bechdel_movies SET tmdb_id = ?, tmdb_checked = 1 WHERE imdbid = ?",
+                rows,
+            )
+            self._conn.commit()
+
+    def load(self) -> pd.DataFrame:
+        """Returns the stored catalogue with the TMDB ids"""
+        with self._lock:
+            df = pd.read_sql(
+                "SELECT %s, tmdb_id FROM bechdel_movies ORDER BY id"
+                % ", ".join(self.COLUMNS),
+                self._conn,
+            )
+
+        for col in ["year", "rating"]:
+            df[col] = df[col].astype("Int64")
+
+        return df
@@ -0,0 +1,170 @@
+"""Tests the Allociné pages and the matching of Allociné movies with TMDB ids
+
+Allociné pages and TMDB answers are faked so that the tests run offline
+"""
+import threading
+import time
+
+import pandas as pd
+
+from bechdelai.data import allocine
+from bechdelai.data.allocine import get_movies
+from bechdelai.data.allocine import get_tmdb_ids
+from bechdelai.data.allocine import iter_movies
+from bechdelai.data.allocine import TMDBMatcher
+from bechdelai.data.fetch import RequestException
+
+
+class FakeTMDB:
+    """TMDB client answering fixed search results and credits"""
+
+    def __init__(self):
+        self.n_searches = 0
+        self.credits_requested = []
+
+    def search_movie_from_query(self, query, return_json=False):
+        self.n_searches += 1
+        if query == "Error":
+            raise RequestException("Request response is not valid")
+
+        return {
+            "results": [
+                {"id": 1, "release_date": "1990-01-01"},
+                {"id": 2, "release_date": ""},
+                {"id": 3, "release_date": "2010-05-05"},
+            ]
+        }
+
+    def get_movie_cast(self, movie_id):
+        self.credits_requested.append(movie_id)
+        directors = {1: "John Doe", 2: "Jane Doe", 3: "Jim Doe"}
+        crew = pd.DataFrame([{"name": directors[movie_id], "job": "Director"}])
+        return pd.DataFrame(), crew
+
+
+def test_matcher_release_year_first():
+    """Test that a matching release year needs no credits request"""
+    tmdb = FakeTMDB()
+    matcher = TMDBMatcher(tmdb)
+
+    movie = {"title": "Movie", "year": "2010", "director": "John Doe"}
+
+    assert matcher.match(movie) == 3
+    assert tmdb.credits_requested == []
+
+
+def test_matcher_director_and_memoization():
+    """Test matching by director and that matches are memoized"""
+    tmdb = FakeTMDB()
+    matcher = TMDBMatcher(tmdb)
+
+    movie = {"title": "Movie", "year": "2000", "director": "Jane Doe, Other"}
+
+    assert matcher.match(movie) == 2
+    assert matcher.match(dict(movie)) == 2
+    assert tmdb.n_searches == 1
+    assert sorted(tmdb.credits_requested)[:2] == [1, 2]
+    matcher.close()
+    assert matcher.stats() == {
+        "credits_fetched": len(tmdb.credits_requested),
+        "matched_by_director": 1,
+        "cache_hits": 1,
+    }
+
+
+def test_get_tmdb_ids_keeps_alignment():
+    """Test that failed and not found movies give None at their position"""
+    movies = [
+        {"title": "Error", "year": "2000", "director": "Jane Doe"},
+        {"title": "Movie", "year": "2000", "director": "Nobody"},
+        {"title": "Movie", "year": "1990", "director": None},
+    ]
+
+    ids = get_tmdb_ids(movies, FakeTMDB(), n_workers=2)
+
+    assert ids == [None, None, 1]
+
+
+def fake_pages(monkeypatch, n_pages, last_page_size=allocine.N_MAX_MOVIES_PAGE):
+    """Fake `n_pages` Allociné pages, first pages answering last
+
+    Returns the list of requested page numbers
+    """
+    requested = []
+    lock = threading.Lock()
+
+    def get_page(filters, sort_by="popularity", verbose=False):
+        page = int(filters["page_num"])
+        with lock:
+            requested.append(page)
+        time.sleep(0.01 * (n_pages - page))
+        size = last_page_size if page == n_pages else allocine.N_MAX_MOVIES_PAGE
+        return [{"url": f"u{page}_{i}"} for i in range(size)]
+
+    monkeypatch.setattr(allocine, "get_allocine_movies_from_one_page", get_page)
+    return requested
+
+
+def test_iter_movies_page_order(monkeypatch):
+    """Test that concurrent pages are yielded in page order and cut at `n_movies`"""
+    requested = fake_pages(monkeypatch, n_pages=4)
+    n_movies = 3 * allocine.N_MAX_MOVIES_PAGE + 2
+
+    pages = list(iter_movies(n_movies, verbose=False, n_workers=3))
+
+    assert [page[0]["url"] for page in pages] == ["u1_0", "u2_0", "u3_0", "u4_0"]
+    assert [len(page) for page in pages] == [allocine.N_MAX_MOVIES_PAGE] * 3 + [2]
+    assert sorted(requested) == [1, 2, 3, 4]
+    assert get_movies(n_movies, verbose=False, n_workers=3) == [
+        movie for page in pages for movie in page
+    ]
+
+
+def test_iter_movies_stops_on_short_page(monkeypatch):
+    """Test that no page is requested after a page with fewer movies"""
+    requested = fake_pages(monkeypatch, n_pages=2, last_page_size=4)
+
+    movies = get_movies(10 * allocine.N_MAX_MOVIES_PAGE, verbose=False, n_workers=1)
+
+    assert len(movies) == allocine.N_MAX_MOVIES_PAGE + 4
+    assert movies[-1]["url"] == "u2_3"
+    assert requested == [1, 2]
+
+
+class SlowTMDB(FakeTMDB):
+    """FakeTMDB with slow credits, recording the concurrent credits requests"""
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def get_movie_cast(self, movie_id):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.05 if movie_id > 1 else 0)
+        with self.lock:
+            self.in_flight -= 1
+        return super().get_movie_cast(movie_id)
+
+
+def test_matcher_shares_credits_workers():
+    """Test that credits requests are bounded by `n_workers` for all the
+    matches and that candidates not needed after a match are cancelled
+    """
+    tmdb = SlowTMDB()
+    matcher = TMDBMatcher(tmdb, n_workers=1)
+
+    assert matcher.match({"title": "A", "year": "2000", "director": "John Doe"}) == 1
+    assert 3 not in tmdb.credits_requested
+
+    tmdb = SlowTMDB()
+    matcher = TMDBMatcher(tmdb, n_workers=2)
+    movies = [
+        {"title": f"Movie {i}", "year": "2000", "director": "Nobody"} for i in range(4)
+    ]
+
+    assert matcher.match_many(movies) == [None] * 4
+    assert tmdb.max_in_flight <= 2
@@ -0,0 +1,164 @@
+"""Tests the local bechdeltest.com catalogue
+
+A local http server answers the catalogue with an ETag
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+from bechdelai.data import bechdeltestcom
+from bechdelai.data.fetch import configure_session
+from bechdelai.data.store import BechdelTestStore
+
+
+class CatalogueHandler(BaseHTTPRequestHandler):
+    """Answers the catalogue, or 304 if the ETag did not change"""
+
+    protocol_version = "HTTP/1.1"
+    movies = []
+    n_downloads = 0
+
+    def do_GET(self):
+        """Answer the catalogue"""
+        etag = '"%d"' % len(json.dumps(CatalogueHandler.movies))
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        CatalogueHandler.n_downloads += 1
+        body = json.dumps(CatalogueHandler.movies).encode()
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        """Silence the server logs"""
+        pass
+
+
+class FakeTMDB:
+    """TMDB client mapping IMDB ids to fixed TMDB ids, the `failing` ids fail"""
+
+    def __init__(self, failing=()):
+        self.requested = []
+        self.failing = set(failing)
+
+    def map_imdb_ids(self, imdb_ids):
+        self.requested += list(imdb_ids)
+        tmdb_ids = pd.Series(
+            [{"0078748": 348}.get(i) for i in imdb_ids], index=imdb_ids, dtype=object
+        )
+        tmdb_ids.attrs["errors"] = {
+            f"tt{i}": "Status code different from 200, got 500"
+            for i in imdb_ids
+            if i in self.failing
+        }
+        return tmdb_ids
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """Run a local catalogue server during the test"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CatalogueHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    CatalogueHandler.n_downloads = 0
+    CatalogueHandler.movies = [
+        {
+            "id": "1",
+            "imdbid": "0078748",
+            "title": "Alien",
+            "year": "1979",
+            "rating": "3",
+        },
+        {
+            "id": "2",
+            "imdbid": "0000001",
+            "title": "Carmencita",
+            "year": "1894",
+            "rating": "0",
+        },
+    ]
+    monkeypatch.setattr(
+        bechdeltestcom, "BASE_URL", f"http://127.0.0.1:{server.server_port}"
+    )
+    configure_session()
+
+    yield CatalogueHandler
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_refresh_merges_changes(api, tmp_path):
+    """Test conditional refresh, merge of changes and TMDB ids mapping"""
+    store = BechdelTestStore(str(tmp_path / "store.sqlite"))
+    tmdb = FakeTMDB()
+
+    stats = bechdeltestcom.refresh_catalogue(store, tmdb)
+    assert stats["new"] == 2
+    assert stats["mapped"] == 1
+
+    stats = bechdeltestcom.refresh_catalogue(store, tmdb)
+    assert stats["status"] == "not_modified"
+    assert stats.keys() == {
+        "status",
+        "new",
+        "changed",
+        "unchanged",
+        "above_max_id",
+        "mapped",
+        "mapping_errors",
+    }
+    assert api.n_downloads == 1
+
+    api.movies[1]["rating"] = "1"
+    api.movies.append(
+        {"id": "3", "imdbid": "0000003", "title": "New", "year": "2020", "rating": "2"}
+    )
+    stats = bechdeltestcom.refresh_catalogue(store, tmdb)
+    assert (stats["new"], stats["changed"], stats["unchanged"]) == (1, 1, 1)
+    assert tmdb.requested == ["0078748", "0000001", "0000003"]
+
+    df = store.load()
+    assert df["rating"].tolist() == [3, 1, 2]
+    assert df["tmdb_id"].tolist() == ["348", None, None]
+
+
+def test_refresh_retries_failed_mapping(api, tmp_path):
+    """Test that IMDB ids whose TMDB lookup failed are looked up again"""
+    store = BechdelTestStore(str(tmp_path / "store.sqlite"))
+
+    stats = bechdeltestcom.refresh_catalogue(store, FakeTMDB(failing={"0078748"}))
+
+    assert (stats["mapped"], stats["mapping_errors"]) == (0, 1)
+    assert store.unmatched_imdb_ids() == ["0078748"]
+
+    tmdb = FakeTMDB()
+    stats = bechdeltestcom.refresh_catalogue(store, tmdb)
+
+    assert (stats["mapped"], stats["mapping_errors"]) == (1, 0)
+    assert tmdb.requested == ["0078748"]
+    assert store.load()["tmdb_id"].tolist() == ["348", None]
+
+
+def test_load_catalogue_warm_start(api, tmp_path):
+    """Test that a recent catalogue is loaded without request"""
+    store = BechdelTestStore(str(tmp_path / "store.sqlite"))
+
+    first = bechdeltestcom.load_catalogue(store)
+    api.movies = []
+    second = bechdeltestcom.load_catalogue(store)
+
+    assert api.n_downloads == 1
+    pd.testing.assert_frame_equal(first, second)
@@ -0,0 +1,86 @@
+"""Tests the HTTP response cache
+"""
+import time
+
+import pytest
+
+from bechdelai.data.cache import normalize_url
+from bechdelai.data.cache import ResponseCache
+
+
+@pytest.mark.parametrize(
+    "url, params, expected",
+    [
+        (
+            "https://api.themoviedb.org/3/movie/81?api_key=SECRET",
+            None,
+            "https://api.themoviedb.org/3/movie/81",
+        ),
+        (
+            "HTTPS://API.themoviedb.org/3//find/tt1?external_source=imdb_id&api_key=S",
+            None,
+            "https://api.themoviedb.org/3/find/tt1?external_source=imdb_id",
+        ),
+        (
+            "https://en.wikipedia.org/w/api.php?format=json",
+            {"action": "parse", "page": "Alien"},
+            "https://en.wikipedia.org/w/api.php?action=parse&format=json&page=Alien",
+        ),
+        (
+            "https://example.com/search?key=alien&api_key=S",
+            None,
+            "https://example.com/search?key=alien",
+        ),
+    ],
+)
+def test_normalize_url(url, params, expected):
+    """Test that keys are sorted and api keys stripped"""
+    assert normalize_url(url, params) == expected
+
+
+def test_cache_hit_and_miss(tmp_path):
+    """Test that a stored response is returned whatever the api key"""
+    cache = ResponseCache(str(tmp_path / "http.sqlite"))
+
+    assert cache.get("https://api.themoviedb.org/3/movie/81?api_key=A") is None
+
+    cache.set(
+        "https://api.themoviedb.org/3/movie/81?api_key=A",
+        200,
+        "application/json",
+        b"{}",
+    )
+    cached = cache.get("https://api.themoviedb.org/3/movie/81?api_key=B")
+
+    assert cached == (200, "application/json", b"{}")
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_cache_ttl(tmp_path):
+    """Test that expired responses and disabled endpoints are not returned"""
+    cache = ResponseCache(
+        str(tmp_path / "http.sqlite"), ttls={"expired": 0.001, "disabled": 0}
+    )
+
+    cache.set("https://test.com/expired", 200, "text/html", b"a")
+    cache.set("https://test.com/disabled", 200, "text/html", b"a")
+    time.sleep(0.01)
+
+    assert cache.get("https://test.com/expired") is None
+    assert cache.stats()["n_entries"] == 1
+
+
+def test_cache_lru_eviction(tmp_path):
+    """Test that the least recently used responses are evicted first"""
+    cache = ResponseCache(str(tmp_path / "http.sqlite"), max_size=25)
+
+    cache.set("https://test.com/1", 200, "text/html", b"0" * 10)
+    cache.set("https://test.com/2", 200, "text/html", b"0" * 10)
+    cache.get("https://test.com/1")
+    cache.set("https://test.com/3", 200, "text/html", b"0" * 10)
+
+    assert cache.get("https://test.com/1") is not None
+    assert cache.get("https://test.com/2") is None
+    assert cache.get("https://test.com/3") is not None
+    assert cache.stats()["size"] <= 25
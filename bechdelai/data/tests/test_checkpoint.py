@@ -0,0 +1,38 @@
+"""Tests the JSON lines checkpoints"""
+from bechdelai.data.checkpoint import JSONLinesCheckpoint
+
+
+def test_checkpoint_reload(tmp_path):
+    """Test that records are reloaded and the last one of a key wins"""
+    path = str(tmp_path / "ckpt.jsonl")
+    ckpt = JSONLinesCheckpoint(path, key="id")
+    ckpt.append({"id": 1, "value": "a"})
+    ckpt.append({"id": 2, "value": "b"})
+    ckpt.append({"id": 1, "value": "c"})
+
+    ckpt = JSONLinesCheckpoint(path, key="id")
+
+    assert len(ckpt) == 2
+    assert 1 in ckpt
+    assert ckpt.get(1)["value"] == "c"
+    assert [r["id"] for r in ckpt] == [1, 2]
+
+
+def test_checkpoint_truncated_line(tmp_path):
+    """Test that a line cut by a crash is skipped and does not break new records"""
+    path = tmp_path / "ckpt.jsonl"
+    path.write_text('{"id": 1}\n{"id": 2, "val')
+
+    ckpt = JSONLinesCheckpoint(str(path), key="id")
+    ckpt.append({"id": 3})
+
+    ckpt = JSONLinesCheckpoint(str(path), key="id")
+    assert sorted(r["id"] for r in ckpt) == [1, 3]
+
+
+def test_checkpoint_reset(tmp_path):
+    """Test that reset removes the previous records"""
+    path = str(tmp_path / "ckpt.jsonl")
+    JSONLinesCheckpoint(path, key="id").append({"id": 1})
+
+    assert len(JSONLinesCheckpoint(path, key="id", reset=True)) == 0
@@ -0,0 +1,75 @@
+"""Tests the compressed text corpus and the IMSDB crawl
+
+IMSDB requests are faked so that the tests run offline
+"""
+import gzip
+import os
+
+import pandas as pd
+import pytest
+
+from bechdelai.data import imsdb
+from bechdelai.data.corpus import TextCorpus
+
+
+def test_corpus_add_read(tmp_path):
+    """Test that texts are compressed, hashed and reloaded from the manifest"""
+    corpus = TextCorpus(str(tmp_path))
+    record = corpus.add("Alien/1979", "INT. NOSTROMO\nRipley", title="Alien")
+
+    assert record["path"].endswith(".txt.gz")
+    with gzip.open(os.path.join(str(tmp_path), record["path"]), "rt") as f:
+        assert f.read() == "INT. NOSTROMO\nRipley"
+
+    corpus = TextCorpus(str(tmp_path))
+    corpus.add("Aliens", "INT. SULACO")
+
+    assert "Alien/1979" in corpus
+    assert corpus.get_record("Alien/1979")["title"] == "Alien"
+    assert list(corpus.iter_texts(check=True)) == [
+        ("Alien/1979", "INT. NOSTROMO\nRipley"),
+        ("Aliens", "INT. SULACO"),
+    ]
+    assert corpus.verify() == []
+
+    with gzip.open(os.path.join(str(tmp_path), record["path"]), "wt") as f:
+        f.write("edited")
+    assert corpus.verify() == ["Alien/1979"]
+    with pytest.raises(KeyError):
+        corpus.read("Alien 3")
+
+
+def test_crawl_scripts_resume(monkeypatch, tmp_path):
+    """Test per script status and that stored scripts are not downloaded again"""
+    downloads = []
+
+    class FakeResponse:
+        def __init__(self, url):
+            self.status_code = 404 if "Missing" in url else 200
+            self.text = "<html></html>" if "Empty" in url else "<pre>INT. SHIP</pre>"
+
+    def fetch_data_from_url(url, use_cache=True):
+        downloads.append(url)
+        return FakeResponse(url)
+
+    monkeypatch.setattr(imsdb, "fetch_data_from_url", fetch_data_from_url)
+    scripts = pd.DataFrame(
+        {
+            "title": ["Alien", "Empty", "Missing"],
+            "url": [
+                f"{imsdb.BASE_URL}/scripts/{t}.html"
+                for t in ["Alien", "Empty", "Missing"]
+            ],
+        }
+    )
+    corpus = TextCorpus(str(tmp_path))
+
+    df = imsdb.crawl_scripts(corpus, scripts, n_workers=2)
+
+    assert df["status"].tolist() == ["downloaded", "no_script", "error"]
+
+    df = imsdb.crawl_scripts(TextCorpus(str(tmp_path)), scripts.iloc[:1])
+
+    assert df["status"].tolist() == ["cached"]
+    assert len(downloads) == 3
+    assert list(imsdb.iter_scripts(corpus)) == [("Alien", ["INT. SHIP"])]
@@ -0,0 +1,190 @@
+"""Tests the shared session of the fetch module
+
+A local http server is used so that the tests run offline
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from bechdelai.data.cache import ResponseCache
+from bechdelai.data.fetch import configure_session
+from bechdelai.data.fetch import create_header
+from bechdelai.data.fetch import DEFAULT_HEADER
+from bechdelai.data.fetch import fetch_data_from_url
+from bechdelai.data.fetch import fetch_json_from_url
+from bechdelai.data.fetch import HTTPSession
+from bechdelai.data.fetch import set_cache
+from bechdelai.data.throttle import parse_retry_after
+from bechdelai.data.throttle import RetryPolicy
+from bechdelai.data.throttle import TokenBucket
+
+
+class JSONHandler(BaseHTTPRequestHandler):
+    """Answers a JSON with the requested path"""
+
+    protocol_version = "HTTP/1.1"
+
+    # number of errors to answer on "/flaky" before succeeding
+    n_flaky_errors = 0
+
+    def do_GET(self):
+        """Answer the path as JSON"""
+        if self.path == "/redirect":
+            self.send_response(302)
+            self.send_header("Location", "/target")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        status = 200
+        if self.path == "/flaky" and JSONHandler.n_flaky_errors > 0:
+            JSONHandler.n_flaky_errors -= 1
+            status = 503
+
+        body = json.dumps({"path": self.path}).encode()
+        self.send_response(status)
+        if status == 503:
+            self.send_header("Retry-After", "0")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        """Silence the server logs"""
+        pass
+
+
+@pytest.fixture
+def server_url():
+    """Run a local http server during the test"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), JSONHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield f"http://127.0.0.1:{server.server_port}"
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_create_header_does_not_mutate_default():
+    """Test that create_header returns a new dict"""
+    create_header("http://test.com")
+    assert "Host" not in DEFAULT_HEADER
+
+
+def test_session_reuses_connections(server_url):
+    """Test that sequential requests share one connection"""
+    session = HTTPSession(pool_connections=1, pool_maxsize=1)
+
+    for i in range(5):
+        r = session.get(f"{server_url}/{i}")
+        assert r.json() == {"path": f"/{i}"}
+
+    stats = session.stats()
+    session.close()
+
+    assert stats["n_requests"] == 5
+    assert stats["n_connections"] == 1
+    assert stats["n_connections_reused"] == 4
+    assert stats["n_bytes"] > 0
+
+
+def test_fetch_json_from_url_uses_shared_session(server_url):
+    """Test that fetch_json_from_url goes through the shared session"""
+    session = configure_session()
+
+    data = fetch_json_from_url(f"{server_url}/movie", params={"id": 1})
+
+    assert data == {"path": "/movie?id=1"}
+    assert session.stats()["n_requests"] == 1
+
+
+def test_fetch_data_from_url_cache(server_url, tmp_path):
+    """Test that cached answers do not reach the network"""
+    session = configure_session()
+    set_cache(ResponseCache(str(tmp_path / "http.sqlite")))
+
+    try:
+        first = fetch_json_from_url(f"{server_url}/movie?api_key=A")
+        second = fetch_json_from_url(f"{server_url}/movie?api_key=B")
+    finally:
+        set_cache(None)
+
+    assert first == second
+    assert session.stats()["n_requests"] == 1
+
+
+def test_fetch_data_from_url_cache_redirect(server_url, tmp_path):
+    """Test that redirected answers are not cached (their final url is kept)"""
+    session = configure_session()
+    set_cache(ResponseCache(str(tmp_path / "http.sqlite")))
+
+    try:
+        answers = [fetch_data_from_url(f"{server_url}/redirect") for _ in range(2)]
+    finally:
+        set_cache(None)
+
+    assert [r.url for r in answers] == [f"{server_url}/target"] * 2
+    assert session.stats()["n_requests"] == 2
+
+
+def test_session_retries_failed_requests(server_url):
+    """Test that 503 answers are retried until success"""
+    JSONHandler.n_flaky_errors = 2
+    session = HTTPSession(retry_policy=RetryPolicy(max_retries=3))
+
+    r = session.get(f"{server_url}/flaky")
+
+    assert r.status_code == 200
+    assert session.stats()["n_retries"] == 2
+
+
+def test_session_stops_retrying(server_url):
+    """Test that the last answer is returned after max_retries"""
+    JSONHandler.n_flaky_errors = 5
+    session = HTTPSession(retry_policy=RetryPolicy(max_retries=1))
+
+    r = session.get(f"{server_url}/flaky")
+
+    assert r.status_code == 503
+    assert session.stats()["n_retries"] == 1
+
+
+def test_token_bucket():
+    """Test that tokens are spent by bursts then at the given rate"""
+    now = [0.0]
+    waits = []
+
+    def sleep(seconds):
+        waits.append(seconds)
+        now[0] += seconds
+
+    bucket = TokenBucket(rate=2, capacity=2, clock=lambda: now[0], sleep=sleep)
+
+    for _ in range(4):
+        bucket.acquire()
+
+    assert waits == [0.5, 0.5]
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [("3", 3), ("-1", 0), (None, None), ("not a date", None)],
+)
+def test_parse_retry_after(value, expected):
+    """Test Retry-After header parsing"""
+    assert parse_retry_after(value) == expected
+
+
+def test_retry_policy_backoff():
+    """Test that backoff doubles at each retry and is capped"""
+    policy = RetryPolicy(backoff_factor=1, max_backoff=4)
+
+    assert 0.5 <= policy.get_backoff(0) <= 1
+    assert 2 <= policy.get_backoff(2) <= 4
+    assert 2 <= policy.get_backoff(10) <= 4
@@ -0,0 +1,142 @@
+"""Tests the local IMDB datasets and their indexes
+
+Small `.tsv.gz` files are written in place of the downloaded ones
+"""
+import gzip
+
+import pandas as pd
+import pytest
+
+from bechdelai.data import imdb
+from bechdelai.data.imdb_datasets import IMDBDatasets
+from bechdelai.data.imdb_datasets import ingest_tsv
+from bechdelai.data.imdb_datasets import SortedIndex
+
+TSV_FILES = {
+    "title.basics": [
+        "tconst\ttitleType\tprimaryTitle\toriginalTitle\tisAdult\tstartYear\tendYear\truntimeMinutes\tgenres",
+        "tt0000001\tshort\tCarmencita\tCarmencita\t0\t1894\t\\N\t1\tDocumentary",
+        "tt0078748\tmovie\tAlien\tAlien\t0\t1979\t\\N\t117\tHorror,Sci-Fi",
+    ],
+    "name.basics": [
+        "nconst\tprimaryName\tbirthYear\tdeathYear\tprimaryProfession\tknownForTitles",
+        "nm0000244\tSigourney Weaver\t1949\t\\N\tactress,producer\ttt0078748",
+        "nm0000631\tRidley Scott\t1937\t\\N\tproducer,director\ttt0078748",
+        "nm0000001\tFred Astaire\t1899\t1987\tsoundtrack,actor\t\\N",
+    ],
+    "title.principals": [
+        "tconst\tordering\tnconst\tcategory\tjob\tcharacters",
+        "tt0078748\t2\tnm0000631\tdirector\t\\N\t\\N",
+        "tt0000001\t1\tnm0000001\tself\t\\N\t\\N",
+        'tt0078748\t1\tnm0000244\tactress\t\\N\t["Ripley"]',
+    ],
+}
+
+
+@pytest.fixture
+def datasets(tmp_path):
+    """Datasets manager with the small files already downloaded"""
+    datasets = IMDBDatasets(str(tmp_path))
+    for name, lines in TSV_FILES.items():
+        with gzip.open(datasets.tsv_path(name), "wt") as f:
+            f.write("\n".join(lines) + "\n")
+    return datasets
+
+
+def test_build_typed(datasets):
+    """Test that ids are integers and nulls parsed"""
+    df = datasets.load("title.basics")
+
+    assert df["tconst"].tolist() == [1, 78748]
+    assert str(df["tconst"].dtype) == "int32"
+    assert df["endYear"].isna().all()
+    assert str(df["titleType"].dtype) == "category"
+
+
+def test_sorted_index_lookups(datasets):
+    """Test single and bulk lookups"""
+    index = datasets.index("title.principals")
+
+    assert index.get(78748)["nconst"].tolist() == [631, 244]
+    assert index.get_many([78748, 5, 1])["nconst"].tolist() == [631, 244, 1]
+    assert index.contains([1, 2, 78748]).tolist() == [True, False, True]
+
+
+def test_get_movie_data_with_indexes(datasets, monkeypatch):
+    """Test that indexes and dataframes give the same movie data"""
+    monkeypatch.setattr(
+        imdb, "get_movie_casts", lambda url: [{"nconst": 244, "character": "Ripley"}]
+    )
+
+    names = ["name.basics", "title.basics", "title.principals"]
+    from_index = imdb.get_movie_data("tt0078748", *[datasets.index(n) for n in names])
+    from_df = imdb.get_movie_data("tt0078748", *[datasets.load(n) for n in names])
+
+    assert from_index == from_df
+    assert from_index["primaryTitle"] == "Alien"
+    assert from_index["director"][0]["primaryName"] == "Ridley Scott"
+    assert from_index["cast"][0]["gender"] == "F"
+
+
+def test_get_movie_data_unknown_cast(datasets, monkeypatch):
+    """Test that cast members keep their credits position and that unknown
+    ones are reported
+    """
+    monkeypatch.setattr(
+        imdb, "get_movie_casts", lambda url: [{"nconst": n} for n in [631, 5, 244, 631]]
+    )
+    names = ["name.basics", "title.basics", "title.principals"]
+
+    for tables in [
+        [datasets.index(n) for n in names],
+        [datasets.load(n) for n in names],
+    ]:
+        with pytest.warns(UserWarning, match="1 cast members"):
+            cast = imdb.get_movie_data("tt0078748", *tables)["cast"]
+
+        assert [c["nconst"] for c in cast] == ["nm0000631", "nm0000244", "nm0000631"]
+        assert [c["ordering"] for c in cast] == [1, 3, 4]
+
+
+def test_sorted_index_wrong_key(datasets):
+    """Test that an index on another key is refused"""
+    with pytest.raises(ValueError):
+        imdb._lookup(
+            SortedIndex(datasets.load("name.basics"), "birthYear"), "nconst", [1]
+        )
+
+
+def test_ingest_tsv_chunks_and_subset(datasets, tmp_path):
+    """Test that chunks share one schema and that rows can be filtered"""
+    path = str(tmp_path / "principals.parquet")
+
+    n_rows = ingest_tsv(
+        datasets.tsv_path("title.principals"),
+        path,
+        "title.principals",
+        ids=[78748],
+        chunk_rows=1,
+    )
+    df = pd.read_parquet(path)
+
+    assert n_rows == 2
+    assert df["nconst"].tolist() == [631, 244]
+    assert str(df["category"].dtype) == "category"
+    assert df["category"].tolist() == ["director", "actress"]
+    assert df["job"].isna().all()
+
+
+def test_build_subset(datasets):
+    """Test that a subset has its own file and does not replace the full dataset"""
+    full_path = datasets.build("title.principals")
+    subset_path = datasets.build("title.principals", ids=[78748])
+
+    assert subset_path != full_path
+    assert datasets.build("title.principals", ids=[78748, 78748]) == subset_path
+    assert datasets.load("title.principals", ids=[78748])["tconst"].tolist() == [
+        78748,
+        78748,
+    ]
+    assert len(datasets.load("title.principals")) == 3
+    assert len(datasets.index("title.principals", ids=[1])) == 1
+    assert len(datasets.index("title.principals")) == 3
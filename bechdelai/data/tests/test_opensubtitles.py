@@ -0,0 +1,103 @@
+"""Tests the bulk subtitles download
+
+Search and download requests are faked so that the tests run offline
+"""
+import zipfile
+from io import BytesIO
+
+import pytest
+
+from bechdelai.data import opensubtitles
+from bechdelai.nlp.process_srt import load_many_srt
+from bechdelai.utils.encoding import decode_bytes
+from bechdelai.utils.encoding import detect_encoding
+
+SRT = "1\n00:00:01,000 --> 00:00:02,000\nHello Ripley\n"
+SRT_FR = (
+    "1\n00:00:01,000 --> 00:00:02,000\nOù étais-tu ? Je t'ai cherchée, à demain !\n"
+)
+
+
+class FakeResponse:
+    """Answer with a zip of one srt file, streamed in small chunks"""
+
+    def __init__(self):
+        f = BytesIO()
+        with zipfile.ZipFile(f, "w") as zfile:
+            zfile.writestr("alien.srt", SRT)
+        self.content = f.getvalue()
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.content), 10):
+            yield self.content[i : i + 10]
+
+
+@pytest.fixture
+def fake_site(monkeypatch):
+    """Replace the opensubtitles.org requests, returns the downloaded urls"""
+    downloads = []
+
+    def search(movie_name, language_code):
+        if movie_name == "Error":
+            raise Exception("Http Error:", "503")
+        return {
+            f"{movie_name} (1986)": "https://search/1986",
+            f"{movie_name} (1979)": "https://search/1979",
+        }
+
+    def fetch_data_from_url(url, stream=False):
+        downloads.append(url)
+        return FakeResponse()
+
+    monkeypatch.setattr(opensubtitles, "search", search)
+    monkeypatch.setattr(
+        opensubtitles, "get_subtitle_link", lambda url: url.replace("search", "dl")
+    )
+    monkeypatch.setattr(opensubtitles, "fetch_data_from_url", fetch_data_from_url)
+    return downloads
+
+
+def test_download_subtitles_status(fake_site, tmp_path):
+    """Test per movie status and that saved zips are not downloaded again"""
+    movies = [("Alien", 1979, "eng"), ("Alien", 2000, "eng"), ("Error", None, "eng")]
+
+    df = opensubtitles.download_subtitles(movies, folder=str(tmp_path), n_workers=2)
+
+    assert df["status"].tolist() == ["downloaded", "not_found", "error"]
+    assert fake_site == ["https://dl/1979"]
+
+    df = opensubtitles.download_subtitles(movies[:1], folder=str(tmp_path))
+
+    assert df["status"].tolist() == ["cached"]
+    assert len(fake_site) == 1
+
+    subs = opensubtitles.load_subtitle_zip(df["path"][0])
+    assert subs[0].text == "Hello Ripley"
+
+
+@pytest.mark.parametrize("encoding", ["utf-8", "utf-8-sig", "utf-16", "cp1252"])
+def test_decode_bytes(encoding):
+    """Test BOM and UTF-8 fast paths and detection of Western code pages"""
+    data = (SRT_FR * 20).encode(encoding)
+
+    assert decode_bytes(data) == SRT_FR * 20
+    assert detect_encoding(data, sample_size=100) == encoding
+
+
+def test_load_many_srt(tmp_path):
+    """Test that files are loaded in order and unreadable ones are None"""
+    paths = []
+    for i, (text, encoding) in enumerate([(SRT, "utf-8"), (SRT_FR, "cp1252")]):
+        path = tmp_path / f"{i}.srt"
+        path.write_bytes(text.encode(encoding))
+        paths.append(str(path))
+    paths.append(str(tmp_path / "missing.srt"))
+
+    subs = load_many_srt(paths, n_workers=2, chunksize=1)
+
+    assert subs[0][0].text == "Hello Ripley"
+    assert subs[1][0].text.startswith("Où étais-tu")
+    assert subs[2] is None
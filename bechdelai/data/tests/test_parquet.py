@@ -0,0 +1,47 @@
+"""Tests the typed Parquet output"""
+
+import pandas as pd
+
+from bechdelai.data.parquet import read_parquet
+from bechdelai.data.parquet import write_parquet
+
+
+def test_write_parquet_movies(tmp_path):
+    """Test that ids are integers and nested columns are kept"""
+    movies_df = pd.DataFrame(
+        [
+            {
+                "id": "1",
+                "release_date": "2001-02-03",
+                "genres": [{"id": 18, "name": "Drama"}],
+            },
+            {"id": "2", "release_date": "", "genres": []},
+        ]
+    )
+    path = str(tmp_path / "movies.parquet")
+
+    write_parquet(movies_df, path, kind="movies")
+    df = read_parquet(path)
+
+    assert df["id"].dtype == "int64"
+    assert df["release_date"].isna().tolist() == [False, True]
+    assert list(df["genres"][0]) == [{"id": 18, "name": "Drama"}]
+
+
+def test_write_parquet_partitioned_append(tmp_path):
+    """Test that partitioned writes append to the dataset"""
+    crew_df = pd.DataFrame(
+        [
+            {"id": 1, "movie_id": "10", "department": "Directing", "job": "Director"},
+            {"id": 2, "movie_id": "10", "department": "Sound", "job": "Music"},
+        ]
+    )
+    path = str(tmp_path / "crew")
+
+    write_parquet(crew_df, path, kind="crew", partition_cols=["department"])
+    write_parquet(crew_df, path, kind="crew", partition_cols=["department"])
+    df = read_parquet(path)
+
+    assert len(df) == 4
+    assert df["job"].dtype == "category"
+    assert df["movie_id"].dtype == "int64"
@@ -0,0 +1,39 @@
+"""Tests the HTML parsing backends"""
+import pytest
+from bs4 import SoupStrainer
+
+from bechdelai.data.allocine import format_movies
+from bechdelai.data.parsing import has_class
+from bechdelai.data.parsing import make_soup
+from bechdelai.data.parsing import set_backend
+
+PAGE = """<html><body><header><a href="/">Home</a></header><ul>
+<li class="mdl big"><img src="/poster.jpg"/>
+<a class="meta-title-link" href="films/1">Movie 1</a>
+<span class="date">1 janvier 2000</span>
+<div class="meta-body-direction">De Jane Doe</div></li>
+<li class="other">Ad</li>
+<li class="mdl"><img src="/poster2.png"/>
+<a class="meta-title-link" href="films/2">Movie 2</a></li>
+</ul></body></html>"""
+
+
+@pytest.mark.parametrize("backend", ["lxml", "html.parser"])
+def test_partial_parsing_same_movies(backend):
+    """Test that parsing only the movie tags extracts the same movies"""
+    strainer = SoupStrainer("li", {"class": has_class("mdl")})
+
+    full = make_soup(PAGE, backend=backend).find_all("li", {"class": "mdl"})
+    partial = make_soup(PAGE, parse_only=strainer, backend=backend).find_all(
+        "li", {"class": "mdl"}
+    )
+
+    assert len(partial) == 2
+    assert format_movies(partial) == format_movies(full)
+    assert format_movies(partial)[0]["director"] == "Jane Doe"
+
+
+def test_set_backend_invalid():
+    """Test that unknown backends are refused"""
+    with pytest.raises(ValueError):
+        set_backend("regex")
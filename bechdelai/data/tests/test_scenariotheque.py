@@ -0,0 +1,99 @@
+"""Tests the bulk text extraction of PDF scripts
+
+Downloads are faked with PDFs generated on the fly so that the tests run offline
+"""
+import fitz
+
+from bechdelai.data import scenariotheque
+from bechdelai.data.corpus import TextCorpus
+
+
+def make_pdf(pages):
+    """Returns a PDF file with a text on each page"""
+    with fitz.open() as doc:
+        for text in pages:
+            doc.new_page().insert_text((72, 72), text)
+        return doc.tobytes()
+
+
+def test_extract_scripts(monkeypatch, tmp_path):
+    """Test page ranges joined in order, per PDF status and resume"""
+    pdfs = {
+        "https://pdf/long": make_pdf([f"Scene {i}" for i in range(5)]),
+        "https://pdf/short": make_pdf(["INT. CUISINE"]),
+        "https://pdf/broken": b"not a pdf",
+    }
+    downloads = []
+
+    class FakeResponse:
+        def __init__(self, url):
+            self.status_code = 200
+            self.content = pdfs[url]
+
+    def fetch_data_from_url(url, use_cache=True):
+        downloads.append(url)
+        return FakeResponse(url)
+
+    monkeypatch.setattr(scenariotheque, "fetch_data_from_url", fetch_data_from_url)
+    corpus = TextCorpus(str(tmp_path))
+
+    df = scenariotheque.extract_scripts(
+        list(pdfs), corpus, n_workers=2, pages_per_task=2
+    )
+
+    assert df["status"].tolist() == ["extracted", "extracted", "error"]
+    assert df["n_pages"].tolist()[:2] == [5, 1]
+    long_hash = df["sha256"][0]
+    assert corpus.read(long_hash) == scenariotheque.read_pdf_from_stream(
+        pdfs["https://pdf/long"]
+    )
+    assert corpus.read(long_hash).split() == [
+        word for i in range(5) for word in ["Scene", str(i)]
+    ]
+
+    df = scenariotheque.extract_scripts(list(pdfs)[:2], TextCorpus(str(tmp_path)))
+
+    assert df["status"].tolist() == ["cached", "cached"]
+    assert len(downloads) == 3
+
+
+def test_extract_scripts_same_pdf_many_urls(monkeypatch, tmp_path):
+    """Test that a PDF served from several urls is parsed once and that
+    none of its urls is downloaded again
+    """
+    pdf = make_pdf(["INT. NOSTROMO"])
+    downloads = []
+
+    class FakeResponse:
+        status_code = 200
+        content = pdf
+
+    def fetch_data_from_url(url, use_cache=True):
+        downloads.append(url)
+        return FakeResponse()
+
+    monkeypatch.setattr(scenariotheque, "fetch_data_from_url", fetch_data_from_url)
+    corpus = TextCorpus(str(tmp_path))
+
+    df = scenariotheque.extract_scripts(["https://a", "https://b"], corpus)
+
+    assert df["status"].tolist() == ["extracted", "extracted"]
+    assert df["sha256"].nunique() == 1
+    assert len(corpus) == 1
+
+    df = scenariotheque.extract_scripts(["https://b", "https://c"], corpus)
+
+    assert df["status"].tolist() == ["cached", "cached"]
+    assert downloads == ["https://a", "https://b", "https://c"]
+
+    df = scenariotheque.extract_scripts(
+        ["https://a", "https://b", "https://c"], TextCorpus(str(tmp_path))
+    )
+
+    assert df["status"].tolist() == ["cached"] * 3
+    assert len(downloads) == 3
+    assert corpus.get_record(df["sha256"][0])["urls"] == [
+        "https://a",
+        "https://b",
+        "https://c",
+    ]
@@ -0,0 +1,90 @@
+"""Tests the concurrent scraping pipeline with checkpoints
+
+Allociné pages, TMDB matching and TMDB fetching are faked so that the
+tests run offline
+"""
+import threading
+from queue import Queue
+
+import pandas as pd
+
+from bechdelai.data.checkpoint import JSONLinesCheckpoint
+from bechdelai.scripts import scrap_movies
+
+
+def fake_iter_movies(n_movies, **kwargs):
+    """3 pages of 5 movies"""
+    for page in range(3):
+        yield [{"url": f"u{page}{i}", "title": f"t{page}{i}"} for i in range(5)]
+
+
+class FakeMatcher:
+    """Match each movie with an id from its url"""
+
+    def match(self, movie):
+        return int(movie["url"][1:]) % 7
+
+
+class FakeTMDB:
+    """Fetch movies, the `failing` ids raise"""
+
+    def __init__(self, failing):
+        self.failing = failing
+
+    def get_movie_bundle(self, movie_id, parts):
+        if movie_id in self.failing:
+            raise RuntimeError("Status code different from 200, got 404")
+        return {
+            "details": {"id": movie_id},
+            "cast": pd.DataFrame([{"name": "a"}]),
+            "crew": pd.DataFrame([{"name": "b"}]),
+        }
+
+
+def test_failed_movie_does_not_stop_pipeline(monkeypatch, tmp_path):
+    """Test that a failing movie is checkpointed as an error and retried on resume"""
+    monkeypatch.setattr(scrap_movies, "iter_movies", fake_iter_movies)
+    folder = str(tmp_path)
+
+    movies_df, cast_df, _ = scrap_movies.run_pipeline(
+        {"n_movies": 15}, folder, n_workers=3, tmdb=FakeTMDB({3}), matcher=FakeMatcher()
+    )
+
+    assert sorted(movies_df["id"].astype(int)) == [0, 1, 2, 4, 5, 6]
+    assert len(cast_df) == 6
+    movies_ckpt = JSONLinesCheckpoint(f"{folder}/tmdb_movies.jsonl", key="movie_id")
+    assert "error" in movies_ckpt.get(3)
+
+    movies_df, _, _ = scrap_movies.run_pipeline(
+        {"n_movies": 15},
+        folder,
+        resume=True,
+        n_workers=3,
+        tmdb=FakeTMDB(set()),
+        matcher=FakeMatcher(),
+    )
+
+    assert sorted(movies_df["id"].astype(int)) == list(range(7))
+
+
+def test_allocine_stage_stops(monkeypatch, tmp_path):
+    """Test that the Allociné stage stops between pages once the pipeline is stopped"""
+    stop = threading.Event()
+    n_pages = []
+
+    def iter_movies(**kwargs):
+        for page in range(100):
+            n_pages.append(page)
+            stop.set()
+            yield [{"url": f"u{page}"}]
+
+    allocine_ckpt = JSONLinesCheckpoint(str(tmp_path / "movies.jsonl"), key="url")
+    done_path = str(tmp_path / "movies.done")
+
+    monkeypatch.setattr(scrap_movies, "iter_movies", iter_movies)
+    scrap_movies.scrap_allocine_stage(
+        Queue(10), stop, allocine_ckpt, done_path, {}, n_workers=2
+    )
+
+    assert len(n_pages) == 1
+    assert not (tmp_path / "movies.done").exists()
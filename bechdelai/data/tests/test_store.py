@@ -0,0 +1,56 @@
+"""Tests the local SQLite stores"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bechdelai.data.store import IdMappingIndex
+from bechdelai.data.store import normalize_imdb_id
+from bechdelai.data.store import TMDBStore
+
+
+@pytest.mark.parametrize(
+    "imdb_id, expected",
+    [(123, "tt0000123"), ("0000123", "tt0000123"), ("tt12345678", "tt12345678")],
+)
+def test_normalize_imdb_id(imdb_id, expected):
+    """Test IMDB ids normalization"""
+    assert normalize_imdb_id(imdb_id) == expected
+
+
+def test_id_mapping_index(tmp_path):
+    """Test that known ids and ids without match are returned"""
+    index = IdMappingIndex(str(tmp_path / "store.sqlite"))
+
+    index.set_many({"tt0000001": "10", 2: np.NaN})
+
+    assert index.get_many([1, "tt0000002", 3]) == {"tt0000001": "10", "tt0000002": None}
+    assert len(index.to_dataframe()) == 2
+
+
+def test_tmdb_store_upsert_movies(tmp_path):
+    """Test that upserted movies replace their cast and crew"""
+    store = TMDBStore(str(tmp_path / "store.sqlite"))
+
+    movies_df = pd.DataFrame([{"id": "1", "title": "old"}, {"id": "2", "title": "b"}])
+    cast_df = pd.DataFrame(
+        [{"name": "a", "movie_id": "1"}, {"name": "b", "movie_id": "2"}]
+    )
+    store.upsert_movies(movies_df, cast_df, cast_df)
+
+    movies_df = pd.DataFrame([{"id": "1", "title": "new"}])
+    cast_df = pd.DataFrame([{"name": "c", "movie_id": "1"}])
+    store.upsert_movies(movies_df, cast_df, cast_df)
+
+    assert store.movie_ids() == {"1", "2"}
+    assert sorted(store.load_movies()["title"]) == ["b", "new"]
+    assert sorted(store.load_cast()["name"]) == ["b", "c"]
+
+
+def test_store_meta(tmp_path):
+    """Test the meta key/value table"""
+    store = TMDBStore(str(tmp_path / "store.sqlite"))
+
+    assert store.get_meta("watermark") is None
+    store.set_meta("watermark", "2023-01-01")
+    assert store.get_meta("watermark") == "2023-01-01"
@@ -0,0 +1,436 @@
+"""Tests the TMDB client offline
+
+The shared session of the fetch module is replaced by a fake one
+answering TMDB paths with JSON
+"""
+import json
+import os
+import time
+from datetime import date
+from urllib.parse import parse_qsl
+from urllib.parse import urlsplit
+
+import pytest
+
+from bechdelai.data import fetch
+from bechdelai.data.cache import ResponseCache
+from bechdelai.data.store import IdMappingIndex
+from bechdelai.data.store import TMDBStore
+from bechdelai.data.tmdb import split_date_range
+from bechdelai.data.tmdb import TMDB
+
+
+class FakeSession:
+    """Answer the TMDB paths (without "/3" for the API) with the result of their route
+
+    Routes are a JSON payload or a (status code, payload) tuple,
+    or a function of the query parameters returning one
+    """
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.requests = []
+
+    def get(self, url, headers=None, params=None, stream=False, timeout=None):
+        split = urlsplit(url)
+        path = split.path.replace("//", "/")
+        if split.netloc == "api.themoviedb.org":
+            path = path[len("/3") :]
+        query = dict(parse_qsl(split.query))
+        self.requests.append((path, query))
+
+        answer = self.routes.get(path, (404, {}))
+        if callable(answer):
+            answer = answer(query)
+        status, payload = answer if isinstance(answer, tuple) else (200, answer)
+
+        return fetch._build_response(
+            url, status, "application/json", json.dumps(payload).encode()
+        )
+
+    def add_bytes(self, n_bytes):
+        pass
+
+
+@pytest.fixture
+def fake_session(monkeypatch):
+    """Replace the shared session, returns a function setting its routes"""
+
+    def set_routes(routes):
+        session = FakeSession(routes)
+        monkeypatch.setattr(fetch, "_SESSION", session)
+        return session
+
+    monkeypatch.setattr(fetch, "_CACHE", None)
+    return set_routes
+
+
+def test_fetch_data_from_pages_order(fake_session):
+    """Test that pages answered out of order are assembled in page order"""
+
+    def search(query):
+        page = int(query.get("page", 1))
+        # First pages answer last
+        time.sleep(0.05 * (5 - page))
+        return {
+            "results": [{"id": page * 10 + i} for i in range(2)],
+            "total_pages": 5,
+            "total_results": 10,
+        }
+
+    fake_session({"/search/movie": search})
+    tmdb = TMDB(api_key="key", n_workers=4)
+
+    results = tmdb.fetch_data_from_pages(tmdb.url_search_api("alien"))
+
+    assert [movie["id"] for movie in results] == [
+        page * 10 + i for page in range(1, 6) for i in range(2)
+    ]
+
+    pages = list(tmdb.iter_pages(tmdb.url_search_api("alien"), n_pages=3))
+
+    assert [df["id"].tolist() for df in pages] == [[10, 11], [20, 21], [30, 31]]
+
+
+@pytest.mark.parametrize(
+    "start, end, expected",
+    [
+        (
+            date(1995, 6, 1),
+            date(2012, 12, 31),
+            [
+                (date(1995, 6, 1), date(1999, 12, 31)),
+                (date(2000, 1, 1), date(2009, 12, 31)),
+                (date(2010, 1, 1), date(2012, 12, 31)),
+            ],
+        ),
+        (
+            date(2000, 1, 1),
+            date(2001, 6, 30),
+            [
+                (date(2000, 1, 1), date(2000, 12, 31)),
+                (date(2001, 1, 1), date(2001, 6, 30)),
+            ],
+        ),
+        (
+            date(2000, 1, 15),
+            date(2000, 3, 10),
+            [
+                (date(2000, 1, 15), date(2000, 1, 31)),
+                (date(2000, 2, 1), date(2000, 2, 29)),
+                (date(2000, 3, 1), date(2000, 3, 10)),
+            ],
+        ),
+        (
+            date(2000, 1, 1),
+            date(2000, 1, 2),
+            [
+                (date(2000, 1, 1), date(2000, 1, 1)),
+                (date(2000, 1, 2), date(2000, 1, 2)),
+            ],
+        ),
+        (date(2000, 1, 1), date(2000, 1, 1), []),
+    ],
+)
+def test_split_date_range(start, end, expected):
+    """Test the split by decades, years, months and days"""
+    assert split_date_range(start, end) == expected
+
+
+def test_discover_movies_sharded_resume(fake_session, tmp_path):
+    """Test that shards are split under the pages limit, resumed from
+    the checkpoint folder and not mixed between queries
+    """
+
+    def discover(query):
+        start = query["primary_release_date.gte"]
+        end = query["primary_release_date.lte"]
+        # Ranges over one year are over the pages limit
+        if start[:4] != end[:4]:
+            return {"results": [], "total_pages": 600, "total_results": 12000}
+        movie = {"id": f"{query['with_original_language']}_{start[:4]}"}
+        return {"results": [movie], "total_pages": 1, "total_results": 1}
+
+    session = fake_session({"/discover/movie": discover})
+    tmdb = TMDB(api_key="key", n_workers=2)
+    folder = str(tmp_path)
+
+    movies = tmdb.discover_movies_sharded("2000", "2001", folder)
+
+    assert movies["id"].tolist() == ["fr_2000", "fr_2001"]
+
+    movies = tmdb.discover_movies_sharded(
+        "2000", "2001", folder, with_original_language="en"
+    )
+
+    assert movies["id"].tolist() == ["en_2000", "en_2001"]
+
+    n_requests = len(session.requests)
+    movies = tmdb.discover_movies_sharded("2000", "2001", folder)
+
+    assert movies["id"].tolist() == ["fr_2000", "fr_2001"]
+    assert len(session.requests) == n_requests
+    assert len([f for f in os.listdir(folder) if f.startswith("plan_")]) == 2
+
+
+def test_map_imdb_ids(fake_session, tmp_path):
+    """Test that known and duplicated ids are requested once, in input order,
+    and that failed ids are recorded without stopping the others
+    """
+    session = fake_session(
+        {
+            "/find/tt0000002": {"movie_results": [{"id": 20}]},
+            "/find/tt0000003": {"movie_results": []},
+            "/find/tt0000004": (500, {}),
+        }
+    )
+    index = IdMappingIndex(str(tmp_path / "store.sqlite"))
+    index.set_many({"tt0000001": "10"})
+    tmdb = TMDB(api_key="key", n_workers=2, id_index=index)
+
+    tmdb_ids = tmdb.map_imdb_ids([1, "tt0000002", 2, "3", 4, "tt0000001"])
+
+    assert tmdb_ids.index.tolist() == [1, "tt0000002", 2, "3", 4, "tt0000001"]
+    assert tmdb_ids.fillna("nan").tolist() == ["10", "20", "20", "nan", "nan", "10"]
+    assert list(tmdb_ids.attrs["errors"]) == ["tt0000004"]
+    assert sorted(path for path, _ in session.requests) == [
+        "/find/tt0000002",
+        "/find/tt0000003",
+        "/find/tt0000004",
+    ]
+    assert index.get_many([2, 3, 4]) == {"tt0000002": "20", "tt0000003": None}
+
+    session.requests.clear()
+    tmdb.map_imdb_ids([2, 3, 4])
+
+    assert session.requests == [
+        ("/find/tt0000004", {"api_key": "key", "external_source": "imdb_id"})
+    ]
+
+
+def test_sync_with_cache(fake_session, monkeypatch, tmp_path):
+    """Test that changed movies and persons are refreshed despite the response
+    cache and that failed ids do not stop the sync but are retried
+    """
+    titles = {"1": "Alien", "2": "Aliens"}
+
+    def movie(movie_id):
+        def route(query):
+            if movie_id not in titles:
+                return 404, {"status_message": "Not found"}
+            credits = {"cast": [{"id": 5, "name": "Sigourney"}], "crew": []}
+            return {"id": int(movie_id), "title": titles[movie_id], "credits": credits}
+
+        return route
+
+    def changes(ids):
+        return {"results": [{"id": x} for x in ids], "total_pages": 1}
+
+    session = fake_session(
+        {
+            "/movie/1": movie("1"),
+            "/movie/2": movie("2"),
+            "/person/5": {"id": 5, "name": "Sigourney Weaver"},
+            "/movie/changes": changes([1, 2, 3]),
+            "/person/changes": changes([5]),
+        }
+    )
+    monkeypatch.setattr(fetch, "_CACHE", ResponseCache(str(tmp_path / "http.sqlite")))
+    store = TMDBStore(str(tmp_path / "store.sqlite"))
+    tmdb = TMDB(api_key="key", n_workers=2)
+
+    store.upsert_movies(*tmdb.get_all_movies_details(["1", "2"]))
+    store.upsert_persons([tmdb.get_person_details(5)])
+
+    # Movie 1 is edited and movie 2 deleted on TMDB
+    titles["1"] = "Alien: director's cut"
+    del titles["2"]
+
+    result = tmdb.sync(store, since="2023-01-01", until="2023-01-10")
+
+    assert result["movies"] == 1 and result["persons"] == 1
+    assert list(result["errors"]["movie"]) == ["2"]
+    assert result["watermark"] == "2023-01-10"
+    movies = store.load_movies().set_index("id")["title"]
+    assert movies.to_dict() == {"1": "Alien: director's cut", "2": "Aliens"}
+
+    # The failed movie is retried at the next sync
+    session.routes["/movie/changes"] = changes([])
+    session.routes["/person/changes"] = changes([])
+    titles["2"] = "Aliens: special edition"
+    session.requests.clear()
+
+    result = tmdb.sync(store, until="2023-01-20")
+
+    assert result["movies"] == 1 and result["errors"]["movie"] == {}
+    assert "/movie/2" in [path for path, _ in session.requests]
+    assert store.load_movies().set_index("id")["title"]["2"] == titles["2"]
+
+
+def test_download_all_posters(fake_session, tmp_path):
+    """Test per movie status, a failed download not stopping the others"""
+    fake_session(
+        {
+            "/movie/1": {"poster_path": "/alien.jpg"},
+            "/movie/2": {"poster_path": None},
+            "/movie/3": {"poster_path": "/missing.jpg"},
+            "/t/p/w500/alien.jpg": "image",
+        }
+    )
+    (tmp_path / "4.png").write_bytes(b"")
+    tmdb = TMDB(api_key="key", n_workers=2)
+
+    df = tmdb.download_all_posters([1, 2, 3, 4, 5], folder=str(tmp_path))
+
+    assert df["status"].tolist() == [
+        "downloaded",
+        "no_poster",
+        "error",
+        "exists",
+        "error",
+    ]
+    assert (tmp_path / "1.jpg").exists()
+    assert df["error"].notna().tolist() == [False, False, True, False, True]
+
+
+def test_get_persons_details_join(fake_session, tmp_path):
+    """Test that persons join on the cast `id` column and that stored
+    persons are not requested again
+    """
+    session = fake_session(
+        {
+            "/movie/1": {
+                "id": 1,
+                "credits": {
+                    "cast": [{"id": 5, "character": "Ripley"}, {"id": 6}],
+                    "crew": [{"id": 5, "job": "Producer"}],
+                },
+            },
+            "/person/5": {"id": 5, "name": "Sigourney Weaver"},
+            "/person/6": {"id": 6, "name": "Tom Skerritt"},
+        }
+    )
+    store = TMDBStore(str(tmp_path / "store.sqlite"))
+    tmdb = TMDB(api_key="key", n_workers=2)
+    _, cast, crew = tmdb.get_all_movies_details([1])
+
+    persons = tmdb.get_persons_details(list(cast["id"]) + list(crew["id"]), store=store)
+    joined = cast.join(persons[["name"]], on="id")
+
+    assert joined["name"].tolist() == ["Sigourney Weaver", "Tom Skerritt"]
+
+    session.requests.clear()
+    persons = tmdb.get_persons_details(crew["id"], store=store)
+
+    assert session.requests == []
+    assert crew.join(persons[["name"]], on="id")["name"].tolist() == [
+        "Sigourney Weaver"
+    ]
+
+
+def test_get_persons_details_errors(fake_session, tmp_path):
+    """Test that a failed person is reported without losing the other ones"""
+    fake_session(
+        {
+            "/person/5": {"id": 5, "name": "Sigourney Weaver"},
+            "/person/6": (404, {"status_message": "not found"}),
+            "/person/7": {"id": 7, "name": "John Hurt"},
+        }
+    )
+    store = TMDBStore(str(tmp_path / "store.sqlite"))
+    tmdb = TMDB(api_key="key", n_workers=2)
+
+    persons = tmdb.get_persons_details([7, 6, 5], store=store)
+
+    assert persons.index.tolist() == [7, 5]
+    assert list(persons.attrs["errors"]) == [6]
+    assert sorted(int(k) for k in store.get_persons([5, 6, 7])) == [5, 7]
+
+
+def test_get_all_movies_details_order(fake_session):
+    """Test that concurrent results are in input order and match the
+    sequential ones, failed movies being reported without stopping the others
+    """
+
+    def movie(movie_id):
+        def route(query):
+            # First movies answer last
+            time.sleep(0.02 * (6 - movie_id))
+            credits = {"cast": [{"id": movie_id * 10}], "crew": [{"id": movie_id}]}
+            return {"id": movie_id, "title": f"t{movie_id}", "credits": credits}
+
+        return route
+
+    fake_session({f"/movie/{i}": movie(i) for i in [1, 2, 4, 5]})
+    movie_ids = [5, 1, 3, 4, 2, 1]
+
+    sequential = TMDB(api_key="key").get_all_movies_details(movie_ids)
+    concurrent = TMDB(api_key="key", n_workers=4).get_all_movies_details(movie_ids)
+
+    for seq_df, conc_df in zip(sequential, concurrent):
+        assert seq_df.equals(conc_df)
+    movies_df, cast_df, _ = concurrent
+    assert movies_df["id"].tolist() == ["5", "1", "4", "2", "1"]
+    assert cast_df["id"].tolist() == [50, 10, 40, 20, 10]
+    assert list(movies_df.attrs["errors"]) == [3]
+
+    movies_df, cast_df, crew_df = TMDB(api_key="key").get_all_movies_details([3])
+
+    assert len(movies_df) == len(cast_df) == len(crew_df) == 0
+    assert list(movies_df.attrs["errors"]) == [3]
+
+
+def test_get_movie_bundle(fake_session):
+    """Test that the appended sub-resources are split from the details
+    and that movies details are fetched with one request per movie
+    """
+    session = fake_session(
+        {
+            "/movie/81": {
+                "id": 81,
+                "title": "Nausicaä",
+                "credits": {"cast": [{"id": 1}], "crew": [{"id": 2}, {"id": 3}]},
+                "keywords": {"keywords": [{"id": 4, "name": "ecology"}]},
+                "videos": {"results": [{"key": "abc"}]},
+                "images": {"backdrops": [{"file_path": "/b.jpg"}], "posters": []},
+            }
+        }
+    )
+    tmdb = TMDB(api_key="key")
+
+    bundle = tmdb.get_movie_bundle(81)
+
+    assert bundle["details"] == {"id": 81, "title": "Nausicaä"}
+    assert len(bundle["cast"]) == 1 and len(bundle["crew"]) == 2
+    assert bundle["keywords"] == ["ecology"]
+    assert bundle["videos"]["key"].tolist() == ["abc"]
+    assert bundle["images"]["image_type"].tolist() == ["backdrop"]
+    assert session.requests == [
+        (
+            "/movie/81",
+            {
+                "api_key": "key",
+                "append_to_response": "credits,keywords,videos,images",
+                "include_image_language": "en,null",
+            },
+        )
+    ]
+
+    session.requests.clear()
+    bundle = tmdb.get_movie_bundle(81, parts=["keywords"])
+
+    assert sorted(bundle) == ["details", "keywords"]
+    assert session.requests[0][1]["append_to_response"] == "keywords"
+    assert "include_image_language" not in session.requests[0][1]
+
+    session.requests.clear()
+    movies_df, cast_df, crew_df = tmdb.get_all_movies_details([81])
+
+    assert session.requests == [
+        ("/movie/81", {"api_key": "key", "append_to_response": "credits"})
+    ]
+    assert "credits" not in movies_df.columns
+    assert len(cast_df) == 1 and len(crew_df) == 2
+
+    with pytest.raises(ValueError):
+        tmdb.get_movie_bundle(81, parts=["reviews"])
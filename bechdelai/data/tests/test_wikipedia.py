@@ -0,0 +1,87 @@
+"""Tests the batched Wikipedia client
+
+API answers are faked so that the tests run offline
+"""
+import pytest
+
+from bechdelai.data import wikipedia
+from bechdelai.data.wikipedia import WikipediaClient
+
+# Old layout (h2 > span.mw-headline) and new layout (div.mw-heading > h2)
+PAGE_HTML = """<div class="mw-parser-output"><p>Intro</p>
+<h2><span class="mw-headline" id="Plot">Plot</span></h2>
+<p>Ripley wakes up.</p>
+<h3><span class="mw-headline" id="Ending">Ending</span></h3>
+<p>The alien dies.<sup>[1]</sup></p>
+<div class="mw-heading mw-heading2"><h2 id="Cast">Cast</h2></div>
+<ul><li>Sigourney Weaver</li></ul>
+</div>"""
+
+PARSE_ANSWER = {
+    "parse": {
+        "title": "Alien",
+        "text": PAGE_HTML,
+        "sections": [
+            {"anchor": "Plot", "index": "1"},
+            {"anchor": "Ending", "index": "2"},
+            {"anchor": "Cast", "index": "3"},
+        ],
+    }
+}
+
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    """Replace API calls by fixed answers, returns the sent params"""
+    calls = []
+
+    def fetch_json_from_url(url, params=None):
+        calls.append(params)
+        if params["action"] == "parse":
+            return PARSE_ANSWER
+
+        # links of "Alien" arrive in two answers (continuation)
+        if "plcontinue" not in params:
+            return {
+                "continue": {"plcontinue": "2|0|B", "continue": "||"},
+                "query": {
+                    "normalized": [{"from": "alien", "to": "Alien"}],
+                    "redirects": [{"from": "Alien", "to": "Alien (film)"}],
+                    "pages": [
+                        {"title": "Alien (film)", "links": [{"title": "A"}]},
+                        {"title": "Nope", "missing": True},
+                    ],
+                },
+            }
+        return {
+            "query": {
+                "normalized": [{"from": "alien", "to": "Alien"}],
+                "redirects": [{"from": "Alien", "to": "Alien (film)"}],
+                "pages": [{"title": "Alien (film)", "links": [{"title": "B"}]}],
+            }
+        }
+
+    monkeypatch.setattr(wikipedia, "fetch_json_from_url", fetch_json_from_url)
+    return calls
+
+
+def test_get_section_text_one_parse(fake_api):
+    """Test that all sections come from one parse call"""
+    texts = WikipediaClient().get_section_text("Alien", ["Plot", "Cast", "Trivia"])
+
+    assert len(fake_api) == 1
+    assert set(texts) == {"Plot", "Cast"}
+    assert "Ripley wakes up." in texts["Plot"]
+    assert "The alien dies." in texts["Plot"]
+    assert "[1]" not in texts["Plot"]
+    assert "Sigourney" not in texts["Plot"]
+    assert "Sigourney Weaver" in texts["Cast"]
+
+
+def test_get_links_batched(fake_api):
+    """Test that titles are resolved and continuations merged"""
+    links = WikipediaClient().get_links(["alien", "Nope"])
+
+    assert len(fake_api) == 2
+    assert fake_api[0]["titles"] == "alien|Nope"
+    assert links == {"alien": ["A", "B"], "Nope": None}
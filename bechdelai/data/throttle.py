@@ -0,0 +1,235 @@
+"""Rate limiting and retry policy of the HTTP requests
+
+Every host has its own token bucket so that concurrent scrapers stay
+under the provider limits, and failed requests (429, 5xx, connection
+errors) are retried with an exponential backoff and jitter honouring
+the `Retry-After` header.
+"""
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable
+from typing import Optional
+from urllib.parse import urlsplit
+
+import requests
+
+# Requests per second allowed by host (other hosts are not limited)
+DEFAULT_RATE_LIMITS = {
+    "api.themoviedb.org": 40,
+    "bechdeltest.com": 1,
+    "www.allocine.fr": 5,
+    "www.imdb.com": 5,
+    "imsdb.com": 2,
+    "www.opensubtitles.org": 1,
+    "lecteursanonymes.org": 2,
+    "www.dictionary.com": 5,
+}
+
+# Status codes of the answers worth retrying
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+    """Thread-safe token bucket
+
+    Parameters
+    ----------
+    rate : float
+        number of tokens added per second
+    capacity : float, optional
+        maximum number of tokens (size of the bursts), by default `rate`
+    clock : Callable, optional
+        function returning the current time in seconds, by default time.monotonic
+    sleep : Callable, optional
+        function waiting a number of seconds, by default time.sleep
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+
+        self.rate = rate
+        self.capacity = max(1, rate if capacity is None else capacity)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.capacity
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take a token, waiting until one is available
+
+        Returns
+        -------
+        float
+            waited time in seconds
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._last) * self.rate
+            )
+            self._last = now
+
+            # Tokens can go negative: waiting threads reserve future tokens
+            self._tokens -= 1
+            wait = 0 if self._tokens >= 0 else -self._tokens / self.rate
+
+        if wait > 0:
+            self._sleep(wait)
+
+        return wait
+
+
+class RateLimiter:
+    """Token buckets by host
+
+    Parameters
+    ----------
+    rates : dict, optional
+        requests per second by host, by default DEFAULT_RATE_LIMITS
+    default_rate : float, optional
+        requests per second of the other hosts (None for no limit), by default None
+    """
+
+    def __init__(self, rates: dict = None, default_rate: Optional[float] = None):
+        self.rates = dict(DEFAULT_RATE_LIMITS if rates is None else rates)
+        self.default_rate = default_rate
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _get_bucket(self, host: str) -> Optional[TokenBucket]:
+        """Returns the bucket of a host (None if not limited)"""
+        with self._lock:
+            if host not in self._buckets:
+                rate = self.rates.get(host, self.default_rate)
+                self._buckets[host] = None if rate is None else TokenBucket(rate)
+
+            return self._buckets[host]
+
+    def set_rate(self, host: str, rate: Optional[float]) -> None:
+        """Set the requests per second of a host (None for no limit)"""
+        with self._lock:
+            self.rates[host] = rate
+            self._buckets.pop(host, None)
+
+    def acquire(self, url: str) -> float:
+        """Wait for the rate limit of the url host
+
+        Returns
+        -------
+        float
+            waited time in seconds
+        """
+        bucket = self._get_bucket(urlsplit(url).netloc.lower())
+        if bucket is None:
+            return 0
+
+        return bucket.acquire()
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Returns the seconds to wait from a `Retry-After` header
+    (number of seconds or HTTP date), None if not valid
+    """
+    if value is None:
+        return None
+
+    try:
+        return max(0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    return max(0, retry_date.timestamp() - time.time())
+
+
+class RetryPolicy:
+    """Exponential backoff with jitter for failed requests
+
+    Parameters
+    ----------
+    max_retries : int, optional
+        maximum number of retries of a request, by default 5
+    backoff_factor : float, optional
+        backoff of the first retry in seconds, doubled at each retry, by default 0.5
+    max_backoff : float, optional
+        maximum backoff in seconds (also caps `Retry-After`), by default 60
+    status_codes : tuple, optional
+        status codes to retry, by default RETRY_STATUS_CODES
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 5,
+        backoff_factor: float = 0.5,
+        max_backoff: float = 60,
+        status_codes: tuple = RETRY_STATUS_CODES,
+    ):
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.status_codes = status_codes
+
+    def should_retry(
+        self,
+        attempt: int,
+        response: Optional[requests.Response] = None,
+        error: Optional[Exception] = None,
+    ) -> bool:
+        """Returns whether a request must be retried
+
+        Parameters
+        ----------
+        attempt : int
+            number of retries already done
+        response : requests.Response, optional
+            answer of the request, by default None
+        error : Exception, optional
+            exception raised by the request, by default None
+        """
+        if attempt >= self.max_retries:
+            return False
+
+        if error is not None:
+            return isinstance(
+                error,
+                (requests.exceptions.ConnectionError, requests.exceptions.Timeout),
+            )
+
+        return response is not None and response.status_code in self.status_codes
+
+    def get_backoff(
+        self, attempt: int, response: Optional[requests.Response] = None
+    ) -> float:
+        """Returns the seconds to wait before a retry
+
+        The `Retry-After` header is used if the answer has one, otherwise
+        the backoff doubles at each retry with a random jitter of half its value.
+
+        Parameters
+        ----------
+        attempt : int
+            number of retries already done
+        response : requests.Response, optional
+            answer of the request, by default None
+        """
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                return min(retry_after, self.max_backoff)
+
+        backoff = min(self.backoff_factor * 2**attempt, self.max_backoff)
+        return backoff / 2 + random.uniform(0, backoff / 2)
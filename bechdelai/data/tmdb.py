@@ -1,18 +1,25 @@
 """Function to get data from TMDB API
 """
+import hashlib
+import json
 import urllib
-import requests
 import pandas as pd
 import numpy as np
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor,as_completed
+from datetime import date,timedelta
+from itertools import islice
 from PIL import Image
 from tqdm.auto import tqdm
+from tqdm.contrib.concurrent import thread_map
 from os import environ
 from io import BytesIO
-from typing import Union,Optional,List,Dict,Tuple
+from typing import Union,Optional,List,Dict,Tuple,Iterator
 from dotenv import load_dotenv
 from IPython.display import display,HTML
-from .fetch import fetch_json_from_url,fetch_image_from_url
+from .fetch import RequestException,fetch_data_from_url,fetch_json_from_url,fetch_image_from_url
+from .store import IdMappingIndex,TMDBStore,normalize_imdb_id
 
 class APIKeyNotSetInEnv(Exception):
     """Exception class for API key not set"""
@@ -25,6 +32,37 @@ MAIN_URL = "https://www.themoviedb.org"
 IMG_URL = "https://image.tmdb.org/t/p/w94_and_h141_bestv2"
 API_URL = "https://api.themoviedb.org/3"
 IMG_URL = "https://image.tmdb.org/t/p/original"
+IMG_BASE_URL = "https://image.tmdb.org/t/p"
+
+# Poster sizes served by TMDB and extensions of downloaded posters
+POSTER_SIZES = ["w92","w154","w185","w342","w500","w780","original"]
+POSTER_EXTENSIONS = [".jpg",".png"]
+
+# TMDB allows around 50 requests per second and per IP,
+# and the shared session keeps 16 connections per host
+TMDB_MAX_WORKERS = 16
+
+# Movie sub-resources that can be fetched with the details
+# in one request with `append_to_response`
+BUNDLE_PARTS = ["credits","keywords","videos","images"]
+
+# Number of fetched ids written at once to the id index by `map_imdb_ids()`
+ID_INDEX_CHUNK_SIZE = 100
+
+# Number of persons fetched then written at once to the store by `get_persons_details()`
+PERSONS_CHUNK_SIZE = 500
+
+# The Discover API does not return pages after this one
+DISCOVER_MAX_PAGES = 500
+
+# The changes endpoints accept at most 14 days per query
+CHANGES_MAX_DAYS = 14
+
+# Meta key of the last sync date in a TMDBStore
+SYNC_WATERMARK_KEY = "tmdb_sync_watermark"
+
+# Meta key of the ids whose refresh failed, retried at the next sync
+SYNC_FAILED_KEY = "tmdb_sync_failed"
 
 # Url for the API
 # SEARCH_API_URL = f"{API_URL}/search/movie?api_key={API_KEY}&query={{query}}"
@@ -50,8 +88,70 @@ FORMAT_SUGG_HTML = """
 </tr>
 """
 
+def _parse_date(value: str, end: bool = False) -> date:
+    """Parse a "YYYY" or "YYYY-MM-DD" string (a year is its first or last day)"""
+    value = str(value)
+    if len(value) == 4:
+        return date(int(value),12,31) if end else date(int(value),1,1)
+    return date.fromisoformat(value)
+
+
+def _add_months(day: date, n_months: int) -> date:
+    """Returns the first day of the month `n_months` after `day`"""
+    month = day.month - 1 + n_months
+    return date(day.year + month // 12,month % 12 + 1,1)
+
+
+def split_date_range(start: date, end: date) -> List[Tuple[date, date]]:
+    """Split a date range by decades, else by years, else by months
+    else by days (empty list for a single day)
+
+    Parameters
+    ----------
+    start : date
+        first day of the range
+    end : date
+        last day of the range (included)
+
+    Returns
+    -------
+    list
+        list of (first day, last day) covering the range
+    """
+    if end.year - start.year >= 10:
+        boundaries = [date(year,1,1) for year in range(start.year // 10 * 10 + 10,end.year + 1,10)]
+    elif start.year != end.year:
+        boundaries = [date(year,1,1) for year in range(start.year + 1,end.year + 1)]
+    elif start.month != end.month:
+        boundaries = [_add_months(start,i) for i in range(1,end.month - start.month + 1)]
+    else:
+        boundaries = [start + timedelta(days = i) for i in range(1,(end - start).days + 1)]
+
+    if not boundaries:
+        return []
+
+    starts = [start] + boundaries
+    ends = [b - timedelta(days = 1) for b in boundaries] + [end]
+    return list(zip(starts,ends))
+
+
 class TMDB:
-    def __init__(self,api_key = None):
+    def __init__(self,api_key = None,n_workers: int = 1,id_index: IdMappingIndex = None):
+        """TMDB API client
+
+        Parameters
+        ----------
+        api_key : str, optional
+            TMDB API key, by default read from `TMDB_API_KEY` in a .env file
+        n_workers : int, optional
+            Default number of concurrent requests of bulk methods (capped to
+            `TMDB_MAX_WORKERS`), by default 1
+        id_index : IdMappingIndex, optional
+            Local IMDB to TMDB ids index queried before the API and filled
+            with its answers, by default None
+        """
+        self.n_workers = n_workers
+        self.id_index = id_index
 
         if api_key is None:
 
@@ -85,7 +185,7 @@ class TMDB:
         return f"{API_URL}/person/{person_id}?api_key={self.api_key}"
 
     def url_search_imdb(self,imdb_id):
-        imdb_id = imdb_id.replace("tt","")
+        imdb_id = str(imdb_id).replace("tt","")
         return f"{API_URL}//find/tt{imdb_id}?api_key={self.api_key}&external_source=imdb_id"        
 
     def url_movie_api(self,movie_id,endpoint):
@@ -97,28 +197,68 @@ class TMDB:
 
 
  
-    def fetch_data_from_pages(self,api_url: str, n_pages: int = None) -> List[Dict]:
+    def _get_n_workers(self,n_workers: Optional[int] = None) -> int:
+        """Returns the number of concurrent requests to use"""
+        if n_workers is None:
+            n_workers = self.n_workers
+        return max(1,min(n_workers,TMDB_MAX_WORKERS))
+
+    def _map_with_errors(self,func,ids: list,n_workers: int = None) -> Tuple[dict, dict]:
+        """Call `func` on each id concurrently without stopping on failures
+
+        Returns
+        -------
+        tuple
+            results and error messages by id, in input order
         """
-        Fetches data from multiple pages of a TMDB API response.
+        def call(x):
+            try:
+                return func(x),None
+            except Exception as e:
+                return None,str(e)
+
+        answers = thread_map(call,ids,max_workers = self._get_n_workers(n_workers))
+
+        results = {x: res for x,(res,error) in zip(ids,answers) if error is None}
+        errors = {x: error for x,(res,error) in zip(ids,answers) if error is not None}
+        return results,errors
+
+    def fetch_page(self,api_url: str,page: int = 1) -> dict:
+        """
+        Fetches one page of a paginated TMDB API response.
 
         Args:
-            api_url: The URL of the API endpoint.
-            n_pages: The number of pages to fetch. If None, fetches all pages.
+            api_url: The URL of the API endpoint (with the api key as query parameter).
+            page: The page number to fetch. Defaults to 1.
 
         Returns:
-            A list of dictionaries containing the results from all pages.
+            The JSON response of the page.
 
         Raises:
             Exception: If an error occurs while fetching the data.
         """
-        # Send request to the first page of the API response
-        response = requests.get(api_url)
+        if page > 1:
+            api_url = f"{api_url}&page={page}"
+
+        response = fetch_data_from_url(api_url)
         response_json = response.json()
 
         # Check for errors
         if response.status_code != 200:
             raise Exception(f"Failed to fetch data. Status code: {response.status_code}. Error message: {response_json.get('status_message')}")
 
+        return response_json
+
+    def _iter_pages_results(self,api_url: str, n_pages: int = None, n_workers: int = None,
+                            progress: bool = False) -> Iterator[List[Dict]]:
+        """Yields the results of each page of a TMDB API response in page order
+
+        Once the first page gives the number of pages, at most `n_workers`
+        pages are fetched ahead of the one being consumed.
+        """
+        # Send request to the first page of the API response
+        response_json = self.fetch_page(api_url)
+
         # Extract the total number of pages from the response
         total_pages = response_json.get('total_pages')
         total_results = response_json.get('total_results')
@@ -130,23 +270,80 @@ class TMDB:
         else:
             n_pages = min(n_pages, total_pages)
 
-        # Fetch data from all pages
-        results = response_json.get('results')
-        for page in tqdm(range(2, n_pages + 1)):
-            response = requests.get(f"{api_url}&page={page}")
-            response_json = response.json()
+        yield response_json.get('results')
 
-            # Check for errors
-            if response.status_code != 200:
-                raise Exception(f"Failed to fetch data. Status code: {response.status_code}. Error message: {response_json.get('status_message')}")
+        pages = iter(range(2, n_pages + 1))
+        n_workers = self._get_n_workers(n_workers)
+        pbar = tqdm(total = n_pages - 1,disable = not progress)
 
-            # Append results from the current page to the results list
-            results.extend(response_json.get('results'))
+        with ThreadPoolExecutor(n_workers) as executor:
+            futures = deque(executor.submit(self.fetch_page,api_url,page) for page in islice(pages,n_workers))
+            try:
+                while futures:
+                    page_results = futures.popleft().result().get('results')
+                    for page in islice(pages,1):
+                        futures.append(executor.submit(self.fetch_page,api_url,page))
+                    pbar.update(1)
+                    yield page_results
+            finally:
+                for future in futures:
+                    future.cancel()
+                pbar.close()
+
+    def iter_pages(self,api_url: str, n_pages: int = None, n_workers: int = None,
+                   as_records: bool = False) -> Iterator[Union[pd.DataFrame, List[Dict]]]:
+        """
+        Yields the pages of a TMDB API response one by one, in page order.
+
+        Only a bounded number of pages is held in memory, so results can be
+        streamed to a file while the crawl goes on:
+
+        ```python
+        for i, df in enumerate(tmdb.iter_pages(url)):
+            df.to_csv("movies.csv", mode="a", header=(i == 0), index=False)
+        ```
+
+        Args:
+            api_url: The URL of the API endpoint.
+            n_pages: The number of pages to fetch. If None, fetches all pages.
+            n_workers: The number of pages fetched ahead concurrently. Defaults to the client `n_workers`.
+            as_records: Whether to yield the list of dictionaries instead of a DataFrame. Defaults to False.
+
+        Yields:
+            A DataFrame (or list of dictionaries) with the results of one page.
+
+        Raises:
+            Exception: If an error occurs while fetching the data.
+        """
+        for page_results in self._iter_pages_results(api_url,n_pages,n_workers):
+            yield page_results if as_records else pd.DataFrame(page_results)
+
+    def fetch_data_from_pages(self,api_url: str, n_pages: int = None, n_workers: int = None) -> List[Dict]:
+        """
+        Fetches data from multiple pages of a TMDB API response.
+
+        Once the first page gives the number of pages, the other ones
+        are fetched concurrently and assembled in page order.
+
+        Args:
+            api_url: The URL of the API endpoint.
+            n_pages: The number of pages to fetch. If None, fetches all pages.
+            n_workers: The number of pages fetched concurrently. Defaults to the client `n_workers`.
+
+        Returns:
+            A list of dictionaries containing the results from all pages.
+
+        Raises:
+            Exception: If an error occurs while fetching the data.
+        """
+        results = []
+        for page_results in self._iter_pages_results(api_url,n_pages,n_workers,progress = True):
+            results.extend(page_results)
 
         return results
 
 
-    def search_movie_from_query(self,query: str,n_pages = 1,return_json = False) -> dict:
+    def search_movie_from_query(self,query: str,n_pages = 1,return_json = False,n_workers: int = None) -> dict:
         """Get TMDB API result for search movie endpoint given a query
 
         More info at:
@@ -159,26 +356,19 @@ class TMDB:
         ----------
         query : str
             Movie query to research
+        n_pages : int, optional
+            Number of pages to fetch (all if None), by default 1
+        return_json : bool, optional
+            Whether to return the raw JSON of the first page, by default False
+        n_workers : int, optional
+            Number of pages fetched concurrently, by default the client `n_workers`
         """
         url = self.url_search_api(query)
-        json_results = fetch_json_from_url(url)
         if return_json:
-            return json_results
+            return fetch_json_from_url(url)
         else:
-            total_pages = json_results["total_pages"]
-            total_results = json_results["total_results"]
-            print(f"... There are {total_results} movies with {total_pages} pages of results for the search '{query}'")
-            if n_pages is None:
-                n_pages = total_pages
-            results = json_results["results"]
-            if n_pages == 1:
-                return pd.DataFrame(results)
-            else:
-                for i in tqdm(range(2,min(n_pages,total_pages)+1)):
-                    json_results = self.search_movie_from_query(f"{query}&page={i}",return_json = True)
-                    results.extend(json_results["results"])
-                return pd.DataFrame(results)
-            
+            results = self.fetch_data_from_pages(url,n_pages,n_workers)
+            return pd.DataFrame(results)
 
 
     def get_movie_details(self,movie_id) -> dict:
@@ -195,47 +385,127 @@ class TMDB:
         url = self.url_movie_details_api(movie_id)
         return fetch_json_from_url(url)
 
+    @staticmethod
+    def _format_videos(results: dict) -> pd.DataFrame:
+        """Format the videos endpoint result"""
+        return pd.DataFrame(results["results"])
+
+    @staticmethod
+    def _format_images(results: dict) -> pd.DataFrame:
+        """Format the images endpoint result"""
+        backdrops = pd.DataFrame(results["backdrops"]).assign(image_type = lambda x : "backdrop")
+        posters = pd.DataFrame(results["posters"]).assign(image_type = lambda x : "poster")
+        return pd.concat([backdrops,posters],ignore_index = True,axis = 0)
+
+    @staticmethod
+    def _format_keywords(results: dict) -> list:
+        """Format the keywords endpoint result"""
+        return [x["name"] for x in results["keywords"]]
+
+    @staticmethod
+    def _format_credits(results: dict) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """Format the credits endpoint result as cast and crew dataframes"""
+        cast = pd.DataFrame(results["cast"])
+        crew = pd.DataFrame(results["crew"])
+        return cast, crew
+
+    def get_movie_bundle(self,movie_id,parts: list = None,refresh: bool = False) -> dict:
+        """Get movie details and sub-resources in one request
+        using TMDB `append_to_response`
+
+        More info at:
+        https://developers.themoviedb.org/3/getting-started/append-to-response
+
+        Images appended to the details are filtered on the request language
+        (plus images without language) while `get_movie_images()` returns all of them.
+
+        Parameters
+        ----------
+        movie_id : str or int
+            Movie id to get details from
+        parts : list, optional
+            Sub-resources to fetch among `BUNDLE_PARTS`, by default all of them
+        refresh : bool, optional
+            Whether to ignore the response cache (and update it), by default False
+
+        Returns
+        -------
+        dict
+            "details" key with the movie details and one key per sub-resource
+            with the same format as the dedicated methods: "cast" and "crew"
+            dataframes for credits, "keywords" list, "videos" and "images" dataframes
+
+        Raises
+        ------
+        ValueError
+            A part is not in `BUNDLE_PARTS`
+        """
+        if parts is None:
+            parts = BUNDLE_PARTS
+
+        invalid_parts = [part for part in parts if part not in BUNDLE_PARTS]
+        if invalid_parts:
+            raise ValueError(f"Parts {invalid_parts} are not valid, please choose among {BUNDLE_PARTS}")
+
+        url = self.url_movie_details_api(movie_id)
+        if parts:
+            url += "&append_to_response=" + ",".join(parts)
+        if "images" in parts:
+            url += "&include_image_language=en,null"
+
+        details = fetch_json_from_url(url,refresh = refresh)
+        bundle = {"details": {k: v for k, v in details.items() if k not in BUNDLE_PARTS}}
+
+        if "credits" in parts:
+            bundle["cast"], bundle["crew"] = self._format_credits(details["credits"])
+        if "keywords" in parts:
+            bundle["keywords"] = self._format_keywords(details["keywords"])
+        if "videos" in parts:
+            bundle["videos"] = self._format_videos(details["videos"])
+        if "images" in parts:
+            bundle["images"] = self._format_images(details["images"])
+
+        return bundle
+
     def get_movie_videos(self,movie_id:str) -> pd.DataFrame:
         url = self.url_movie_api(movie_id,"videos")
         results = fetch_json_from_url(url)
-        return pd.DataFrame(results["results"])
+        return self._format_videos(results)
 
-    def get_movie_reviews(self,movie_id:str,n_pages: int = None) -> pd.DataFrame:
+    def get_movie_reviews(self,movie_id:str,n_pages: int = None,n_workers: int = None) -> pd.DataFrame:
         url = self.url_movie_api(movie_id,"reviews")
-        results = self.fetch_data_from_pages(url,n_pages)
+        results = self.fetch_data_from_pages(url,n_pages,n_workers)
         return pd.DataFrame(results)
 
     def get_movie_images(self,movie_id:str,n_pages: int = None) -> pd.DataFrame:
         url = self.url_movie_api(movie_id,"images")
         results = fetch_json_from_url(url)
-        backdrops = pd.DataFrame(results["backdrops"]).assign(image_type = lambda x : "backdrop")
-        posters = pd.DataFrame(results["posters"]).assign(image_type = lambda x : "poster")
-        return pd.concat([backdrops,posters],ignore_index = True,axis = 0)
+        return self._format_images(results)
 
     def get_movie_keywords(self,movie_id:str) -> list:
         url = self.url_movie_api(movie_id,"keywords")
-        results = fetch_json_from_url(url)["keywords"]
-        return [x["name"] for x in results]
+        results = fetch_json_from_url(url)
+        return self._format_keywords(results)
 
-    def get_movies_now_playing(self,n_pages = None,region = None):
+    def get_movies_now_playing(self,n_pages = None,region = None,n_workers: int = None):
         url = f"{API_URL}/movie/now_playing?api_key={self.api_key}"
         if region is not None:
             url += f"&region={region}"
-        results = self.fetch_data_from_pages(url,n_pages)
+        results = self.fetch_data_from_pages(url,n_pages,n_workers)
         return pd.DataFrame(results)
 
-    def get_movies_popular(self,n_pages = None,region = None):
+    def get_movies_popular(self,n_pages = None,region = None,n_workers: int = None):
         url = f"{API_URL}/movie/popular?api_key={self.api_key}"
         if region is not None:
             url += f"&region={region}"
-        results = self.fetch_data_from_pages(url,n_pages)
+        results = self.fetch_data_from_pages(url,n_pages,n_workers)
         return pd.DataFrame(results)
         
-    def get_movies_top_rated(self,n_pages = None,region = None):
+    def get_movies_top_rated(self,n_pages = None,region = None,n_workers: int = None):
         url = f"{API_URL}/movie/top_rated?api_key={self.api_key}"
         if region is not None:
             url += f"&region={region}"
-        results = self.fetch_data_from_pages(url,n_pages)
+        results = self.fetch_data_from_pages(url,n_pages,n_workers)
         return pd.DataFrame(results)
 
 
@@ -267,27 +537,102 @@ class TMDB:
 
         # Fetch the JSON response from the API and convert it to pandas dataframes for the cast and crew
         results = fetch_json_from_url(url)
-        cast = pd.DataFrame(results["cast"])
-        crew = pd.DataFrame(results["crew"])
+        return self._format_credits(results)
 
-        return cast, crew
 
+    def _fetch_id_from_imdb_id(self,imdb_id) -> str:
+        """Get TMDB id from the find endpoint (NaN if no match)"""
+        url = self.url_search_imdb(normalize_imdb_id(imdb_id))
+
+        res = fetch_json_from_url(url)
+        if len(res["movie_results"]) == 0:
+            return np.NaN
+        else:
+            return str(res["movie_results"][0]["id"])
 
     def get_id_from_imdb_id(self,imdb_id) -> str:
-        """Get TMDB API result for movie cast endpoint given an id
+        """Get TMDB id given an IMDB id (NaN if no match)
+
+        The id index is queried first if the client has one.
 
         Parameters
         ----------
         imdb_id : str or int
-            Movie id to get cast from
+            IMDB id of the movie (with or without "tt")
+
+        Raises
+        ------
+        RequestException
+            The request to the find endpoint failed
         """
-        url = self.url_search_imdb(str(imdb_id))
+        tmdb_ids = self.map_imdb_ids([imdb_id],n_workers = 1)
+        for error in tmdb_ids.attrs["errors"].values():
+            raise RequestException(error)
 
-        res = fetch_json_from_url(url)
-        if len(res["movie_results"]) == 0:
-            return np.NaN
-        else:
-            return str(res["movie_results"][0]["id"])
+        return tmdb_ids.iloc[0]
+
+    def map_imdb_ids(self,imdb_ids: list,n_workers: int = None) -> pd.Series:
+        """Get TMDB ids for a list of IMDB ids
+
+        Ids known by the client id index are not requested, the other ones
+        are requested concurrently and added to the index by chunks of
+        `ID_INDEX_CHUNK_SIZE` as they are fetched, so that an interrupted
+        run keeps what was already fetched. Failed requests do not stop the
+        other ones: their ids are NaN and not added to the index.
+
+        Parameters
+        ----------
+        imdb_ids : list
+            IMDB ids (with or without "tt")
+        n_workers : int, optional
+            Number of concurrent requests, by default the client `n_workers`
+
+        Returns
+        -------
+        pd.Series
+            TMDB ids (NaN if no match) indexed by the input IMDB ids, in input order.
+            The error message of each failed (normalized) IMDB id is in `attrs["errors"]`
+        """
+        imdb_ids = list(imdb_ids)
+        normalized_ids = [normalize_imdb_id(imdb_id) for imdb_id in imdb_ids]
+
+        mapping = {} if self.id_index is None else self.id_index.get_many(normalized_ids)
+        misses = [imdb_id for imdb_id in dict.fromkeys(normalized_ids) if imdb_id not in mapping]
+
+        errors = {}
+        if misses:
+            pending = {}
+
+            def save_pending():
+                if self.id_index is not None and pending:
+                    self.id_index.set_many(pending)
+                mapping.update(pending)
+                pending.clear()
+
+            with ThreadPoolExecutor(self._get_n_workers(n_workers)) as executor:
+                futures = {executor.submit(self._fetch_id_from_imdb_id,imdb_id): imdb_id for imdb_id in misses}
+                try:
+                    for future in tqdm(as_completed(futures),total = len(futures),disable = len(misses) == 1):
+                        imdb_id = futures[future]
+                        try:
+                            pending[imdb_id] = future.result()
+                        except Exception as e:
+                            errors[imdb_id] = str(e)
+                        if len(pending) >= ID_INDEX_CHUNK_SIZE:
+                            save_pending()
+                finally:
+                    for future in futures:
+                        future.cancel()
+                    save_pending()
+
+            if errors:
+                print(f"... {len(errors)} IMDB ids could not be mapped")
+
+        tmdb_ids = [mapping.get(imdb_id) for imdb_id in normalized_ids]
+        tmdb_ids = pd.Series([np.NaN if x is None else x for x in tmdb_ids],index = imdb_ids,dtype = object)
+        tmdb_ids.attrs["errors"] = errors
+
+        return tmdb_ids
 
     def format_results_for_suggestion(self,search_res: dict) -> list:
         """Format search movie results for `show_movie_suggestions()`
@@ -326,48 +671,73 @@ class TMDB:
         return format_res
 
 
-    def get_all_movies_details(self,movie_ids: list,is_imdb_id:bool = False) -> tuple:
+    def _get_one_movie_details(self,movie_id,refresh: bool = False) -> Optional[tuple]:
+        """Returns details, cast and crew of one movie for `get_all_movies_details()`
+        (None if there is no id)
+        """
+        if movie_id is None or pd.isna(movie_id):
+            return None
+
+        bundle = self.get_movie_bundle(movie_id,parts = ["credits"],refresh = refresh)
+        data,cast,crew = bundle["details"],bundle["cast"],bundle["crew"]
+
+        cast["movie_id"] = movie_id
+        crew["movie_id"] = movie_id
+
+        return data, cast, crew
+
+
+    def get_all_movies_details(self,movie_ids: list,is_imdb_id:bool = False,n_workers:int = None) -> tuple:
         """Returns TMDB API return for all movie ID
         set in the input
 
-        Get metadata from `get_movie_details_from_id()` function
-        and cast and crew from `get_movie_cast_from_id()` function
+        Get metadata, cast and crew in one request per movie
+        with `get_movie_bundle()`. A failed movie does not stop the
+        other ones, it is missing from the results.
 
         Parameters
         ----------
         movie_ids : list
             List of TMDB ids
+        is_imdb_id : bool, optional
+            Whether ids are IMDB ids, they are then mapped in bulk
+            with `map_imdb_ids()`, by default False
+        n_workers : int, optional
+            Number of movies fetched concurrently (capped to
+            `TMDB_MAX_WORKERS`), by default the client `n_workers`
 
         Returns
         -------
         tuple
-            3 dataframes: movie details, crew and cast
+            3 dataframes: movie details, cast and crew (in input order).
+            The error message of each failed id is in `attrs["errors"]`
+            of the movie details
         """
-        metadata_df = []
-        crew_df = []
-        cast_df = []
-
-        for movie_id in tqdm(movie_ids):
-
-            if is_imdb_id:
-                movie_id = self.get_id_from_imdb_id(movie_id)
+        if is_imdb_id:
+            movie_ids = self.map_imdb_ids(movie_ids,n_workers).tolist()
+        movie_ids = list(movie_ids)
 
-            if movie_id is None:
-                continue
+        results,errors = self._map_with_errors(self._get_one_movie_details,list(dict.fromkeys(movie_ids)),n_workers)
+        if errors:
+            print(f"... {len(errors)} movies could not be fetched")
 
-            data = self.get_movie_details(movie_id)
-            metadata_df.append(data)
+        movies_df,cast_df,crew_df = self._concat_movies_details(
+            [results[movie_id] for movie_id in movie_ids if movie_id in results]
+        )
+        movies_df.attrs["errors"] = errors
 
-            cast,crew = self.get_movie_cast(movie_id)
-            cast["movie_id"] = movie_id
-            crew["movie_id"] = movie_id
+        return movies_df, cast_df, crew_df
 
-            cast_df.append(cast)
-            crew_df.append(crew)
+    @staticmethod
+    def _concat_movies_details(results: list) -> tuple:
+        """Concatenate the (details, cast, crew) of movies as 3 dataframes"""
+        results = [res for res in results if res is not None]
+        if not results:
+            return pd.DataFrame(columns = ["id"]),pd.DataFrame(columns = ["movie_id"]),pd.DataFrame(columns = ["movie_id"])
 
-        movies_df = pd.DataFrame(metadata_df)
-        cast_df = pd.concat(cast_df,ignore_index = True,axis = 0)
-        crew_df = pd.concat(crew_df,ignore_index = True,axis = 0)
+        movies_df = pd.DataFrame([res[0] for res in results])
+        cast_df = pd.concat([res[1] for res in results],ignore_index = True,axis = 0)
+        crew_df = pd.concat([res[2] for res in results],ignore_index = True,axis = 0)
 
         movies_df["id"] = movies_df["id"].astype(str)
         cast_df["movie_id"] = cast_df["movie_id"].astype(str)
@@ -444,9 +814,29 @@ class TMDB:
 
 
 
+    def url_discover_api(self, with_original_language: str = "fr", start_year: Optional[str] = None,
+                         end_year: Optional[str] = None, year: Optional[str] = None, min_vote_count: int = 0,
+                         sort_by: str = "popularity.desc", **kwargs) -> str:
+        """Returns the Discover API url for the criteria of `discover_movies()`"""
+        query = {
+            "with_original_language":with_original_language,
+            "vote_count.gte":min_vote_count,
+            "sort_by":sort_by,
+            **kwargs
+        }
+
+        if year is not None: query["primary_release_year"] = year
+        if start_year is not None: query["primary_release_date.gte"] = start_year
+        if end_year is not None: query["primary_release_date.lte"] = end_year
+
+        query_string = urllib.parse.urlencode(query)
+
+        return f"{API_URL}/discover/movie?api_key={self.api_key}&{query_string}"
+
     def discover_movies(self, with_original_language: str = "fr", start_year: Optional[str] = None,
                             end_year: Optional[str] = None, year: Optional[str] = None, min_vote_count: int = 0,
-                            n_pages: int = None, sort_by: str = "popularity.desc", **kwargs) -> pd.DataFrame:
+                            n_pages: int = None, sort_by: str = "popularity.desc", n_workers: int = None,
+                            **kwargs) -> pd.DataFrame:
         """
         Queries the TMDB Discover API to get a list of movies that match the specified criteria, across multiple pages.
 
@@ -463,6 +853,7 @@ class TMDB:
             min_vote_count (int): The minimum number of votes a movie must have to be returned. Defaults to 0.
             pages (int): The number of pages of results to retrieve. Defaults to 1000.
             sort_by (str): The sorting criteria to use for the results. Defaults to "popularity.desc".
+            n_workers (int, optional): The number of pages fetched concurrently. Defaults to the client `n_workers`.
             **kwargs: Additional query parameters that can be passed to the Discover API.
 
         Returns:
@@ -471,50 +862,219 @@ class TMDB:
         Raises:
             HTTPError: An error occurred while sending a request to the TMDB API.
         """
+        url = self.url_discover_api(with_original_language,start_year,end_year,year,min_vote_count,sort_by,**kwargs)
+        results = self.fetch_data_from_pages(url,n_pages,n_workers)
+        return pd.DataFrame(results)
 
-        query = {
-            "with_original_language":with_original_language,
-            "vote_count.gte":min_vote_count,
-            "sort_by":sort_by,
-            **kwargs
-        }
+    def iter_discover(self, with_original_language: str = "fr", start_year: Optional[str] = None,
+                      end_year: Optional[str] = None, year: Optional[str] = None, min_vote_count: int = 0,
+                      n_pages: int = None, sort_by: str = "popularity.desc", n_workers: int = None,
+                      as_records: bool = False, **kwargs) -> Iterator[Union[pd.DataFrame, List[Dict]]]:
+        """
+        Streaming version of `discover_movies()`: yields one DataFrame
+        (or list of dictionaries if `as_records`) per page of results, in page order.
 
-        if year is not None: query["primary_release_year"] = year
-        if start_year is not None: query["primary_release_date.gte"] = start_year
-        if end_year is not None: query["primary_release_date.lte"] = end_year
+        See `discover_movies()` and `iter_pages()` for the arguments.
+        """
+        url = self.url_discover_api(with_original_language,start_year,end_year,year,min_vote_count,sort_by,**kwargs)
+        yield from self.iter_pages(url,n_pages,n_workers,as_records)
 
-        query_string = urllib.parse.urlencode(query)
+    def _plan_discover_shards(self,start: date,end: date,n_workers: int = None,**kwargs) -> List[dict]:
+        """Split a Discover query by release dates until each shard has at most
+        `DISCOVER_MAX_PAGES` pages (the first page of each shard is kept)
+        """
+        def fetch_first_page(shard):
+            url = self.url_discover_api(start_year = shard[0].isoformat(),end_year = shard[1].isoformat(),**kwargs)
+            return self.fetch_page(url)
+
+        shards = []
+        to_check = [(start,end)]
+        while to_check:
+            first_pages = thread_map(fetch_first_page,to_check,max_workers = self._get_n_workers(n_workers),
+                                     desc = f"Plan {len(to_check)} shards")
+            next_check = []
+            for shard,first_page in zip(to_check,first_pages):
+                total_pages = first_page.get("total_pages",0)
+                sub_shards = split_date_range(*shard) if total_pages > DISCOVER_MAX_PAGES else []
+                if sub_shards:
+                    next_check.extend(sub_shards)
+                    continue
+
+                if total_pages > DISCOVER_MAX_PAGES:
+                    print(f"... Shard {shard[0]} has {total_pages} pages, only {DISCOVER_MAX_PAGES} can be fetched")
+                shards.append({
+                    "start": shard[0].isoformat(),
+                    "end": shard[1].isoformat(),
+                    "total_pages": min(total_pages,DISCOVER_MAX_PAGES),
+                    "first_page": first_page.get("results"),
+                })
+            to_check = next_check
+
+        return shards
+
+    def _fetch_discover_shard(self,shard: dict,**kwargs) -> List[Dict]:
+        """Fetch all the pages of a shard planned by `_plan_discover_shards()`"""
+        url = self.url_discover_api(start_year = shard["start"],end_year = shard["end"],**kwargs)
+
+        results = shard.get("first_page")
+        if results is None:
+            results = self.fetch_page(url).get("results")
+        else:
+            results = list(results)
 
+        for page in range(2,shard["total_pages"] + 1):
+            results.extend(self.fetch_page(url,page).get("results"))
 
-        url = f"{API_URL}/discover/movie?api_key={self.api_key}&{query_string}"
-        results = self.fetch_data_from_pages(url,n_pages)
-        return pd.DataFrame(results)
+        return results
 
-    def download_all_posters(self,movie_ids: list, folder: str = "posters") -> None:
+    def discover_movies_sharded(self, start_date: str, end_date: str, checkpoint_folder: Optional[str] = None,
+                                sort_by: str = "primary_release_date.asc", n_workers: int = None,
+                                **kwargs) -> pd.DataFrame:
         """
-        Downloads the poster images for all movies in a given DataFrame and saves them to a folder.
+        Queries the TMDB Discover API over a release date range without being
+        truncated by the `DISCOVER_MAX_PAGES` pages limit of the API.
+
+        The date range is split recursively (decades, years, months then days) until
+        each shard fits under the limit. Shards are then fetched concurrently and movies
+        are deduplicated by id.
+
+        With a `checkpoint_folder`, the shards plan and each fetched shard are saved,
+        so that calling again the function with the same folder and criteria resumes
+        the crawl. Files are named after a hash of the criteria, so that crawls with
+        other criteria can share the folder.
 
         Args:
-            movies (list): list of movie TMDB ids 
+            start_date (str): The first release date ("YYYY-MM-DD" or "YYYY").
+            end_date (str): The last release date, included ("YYYY-MM-DD" or "YYYY").
+            checkpoint_folder (str, optional): Folder where to save the progress. Defaults to None.
+            sort_by (str): The sorting criteria, it should be stable during the crawl.
+                Defaults to "primary_release_date.asc".
+            n_workers (int, optional): The number of shards fetched concurrently. Defaults to the client `n_workers`.
+            **kwargs: Additional criteria of `discover_movies()` (e.g. with_original_language, min_vote_count).
+
+        Returns:
+            pd.DataFrame: A pandas DataFrame containing the movies released in the date range.
+        """
+        kwargs["sort_by"] = sort_by
+        query = {"start_date": str(start_date),"end_date": str(end_date),**kwargs}
+        query_hash = hashlib.sha256(json.dumps(query,sort_keys = True,default = str).encode()).hexdigest()[:12]
+        plan_path = None if checkpoint_folder is None else os.path.join(checkpoint_folder,f"plan_{query_hash}.json")
+
+        shards = None
+        if plan_path is not None and os.path.exists(plan_path):
+            with open(plan_path,"r",encoding = "utf-8") as f:
+                plan = json.load(f)
+            if plan["query"] == json.loads(json.dumps(query,default = str)):
+                shards = plan["shards"]
+                print(f"... Resume crawl from {plan_path}")
+
+        if shards is None:
+            shards = self._plan_discover_shards(_parse_date(start_date),_parse_date(end_date,end = True),
+                                                n_workers,**kwargs)
+            if plan_path is not None:
+                os.makedirs(checkpoint_folder,exist_ok = True)
+                plan = {
+                    "query": query,
+                    "shards": [{k: v for k,v in shard.items() if k != "first_page"} for shard in shards],
+                }
+                with open(plan_path,"w",encoding = "utf-8") as f:
+                    json.dump(plan,f,default = str)
+
+        print(f"... {len(shards)} shards with {sum(shard['total_pages'] for shard in shards)} pages to fetch")
+
+        def fetch_shard(shard):
+            if checkpoint_folder is None:
+                return self._fetch_discover_shard(shard,**kwargs)
+
+            shard_path = os.path.join(checkpoint_folder,f"shard_{query_hash}_{shard['start']}_{shard['end']}.json")
+            if os.path.exists(shard_path):
+                with open(shard_path,"r",encoding = "utf-8") as f:
+                    return json.load(f)
+
+            results = self._fetch_discover_shard(shard,**kwargs)
+            with open(shard_path + ".tmp","w",encoding = "utf-8") as f:
+                json.dump(results,f)
+            os.replace(shard_path + ".tmp",shard_path)
+            return results
+
+        shards_results = thread_map(fetch_shard,shards,max_workers = self._get_n_workers(n_workers),
+                                    desc = "Fetch shards")
+
+        movies = pd.DataFrame([movie for results in shards_results for movie in results])
+        if len(movies) > 0:
+            movies = movies.drop_duplicates(subset = "id").reset_index(drop = True)
+
+        return movies
+
+    def _download_one_poster(self,movie_id,folder: str,size: str,poster_path: Optional[str] = None) -> dict:
+        """Download the poster of one movie for `download_all_posters()`"""
+        for ext in POSTER_EXTENSIONS:
+            path = os.path.join(folder,f"{movie_id}{ext}")
+            if os.path.exists(path):
+                return {"movie_id": movie_id,"path": path,"status": "exists"}
+
+        try:
+            if poster_path is None:
+                poster_path = self.get_movie_details(movie_id)["poster_path"]
+            if not poster_path:
+                return {"movie_id": movie_id,"path": None,"status": "no_poster"}
+
+            # The file on disk is the cache of the image
+            response = fetch_data_from_url(f"{IMG_BASE_URL}/{size}{poster_path}",use_cache = False)
+            if response.status_code != 200:
+                raise RequestException(f"Status code different from 200, got {response.status_code}")
+        except Exception as e:
+            return {"movie_id": movie_id,"path": None,"status": "error","error": str(e)}
+
+        path = os.path.join(folder,f"{movie_id}{os.path.splitext(poster_path)[1]}")
+        with open(path + ".tmp","wb") as f:
+            f.write(response.content)
+        os.replace(path + ".tmp",path)
+
+        return {"movie_id": movie_id,"path": path,"status": "downloaded"}
+
+    def download_all_posters(self,movie_ids: list, folder: str = "posters", size: str = "w500",
+                             poster_paths: Optional[dict] = None, n_workers: int = None) -> pd.DataFrame:
+        """
+        Downloads the poster images for a list of movies and saves them to a folder.
+
+        Movies with a poster already in the folder are skipped before any request.
+        Images are written as served by TMDB (no re-encoding) and fetched concurrently.
+        A failed download does not stop the other ones, it gets an "error" status.
+
+        Args:
+            movie_ids (list): list of movie TMDB ids
             folder (str): Path to the folder where the images will be saved. If the folder does not exist, it will be created.
+            size (str): TMDB image size, one of `POSTER_SIZES`. Defaults to "w500".
+            poster_paths (dict, optional): TMDB poster paths by movie id (e.g. from `discover_movies()` results)
+                to avoid requesting the movie details. Defaults to None.
+            n_workers (int, optional): The number of concurrent downloads. Defaults to the client `n_workers`.
 
         Returns:
-            None
+            pd.DataFrame: movie id, path of the poster and status ("exists", "downloaded", "no_poster"
+                or "error" with the error message)
+
+        Raises:
+            ValueError: If the size is not available.
         """
+        if size not in POSTER_SIZES:
+            raise ValueError(f"size must be one of {POSTER_SIZES}")
 
-        if not os.path.exists(folder):
-            os.mkdir(folder)
+        if poster_paths is None:
+            poster_paths = {}
 
-        for movie_id in tqdm(movie_ids):
-            img = self.get_poster_image(movie_id)
-            path = os.path.join(folder,f"{movie_id}.png")
-            if not os.path.exists(path):
-                img.save(path)
+        os.makedirs(folder,exist_ok = True)
 
+        results = thread_map(
+            lambda movie_id: self._download_one_poster(movie_id,folder,size,poster_paths.get(movie_id)),
+            movie_ids,
+            max_workers = self._get_n_workers(n_workers),
+        )
 
+        return pd.DataFrame(results,columns = ["movie_id","path","status","error"])
 
 
-    def get_person_details(self,person_id) -> dict:
+    def get_person_details(self,person_id,refresh: bool = False) -> dict:
         """Get TMDB API result for person details by id
 
         You can find the website view with this url (example for id 81):
@@ -524,10 +1084,61 @@ class TMDB:
         ----------
         person_id : str or int
             Person id to get details from
+        refresh : bool, optional
+            Whether to ignore the response cache (and update it), by default False
         """
         url = self.url_person_api(person_id)
-        return fetch_json_from_url(url)
+        return fetch_json_from_url(url,refresh = refresh)
+
+
+    def get_persons_details(self,person_ids: list,store: Optional[TMDBStore] = None,
+                            n_workers: int = None) -> pd.DataFrame:
+        """Get TMDB API result for person details for a list of ids
+
+        Ids are deduplicated (e.g. the `id` column of the cast of many movies),
+        persons already in the store are not requested and the other ones
+        are requested concurrently then added to the store by chunks of
+        `PERSONS_CHUNK_SIZE`, so that an interrupted run keeps what was
+        already fetched. A failed person does not stop the other ones.
+
+        Parameters
+        ----------
+        person_ids : list
+            Person ids to get details from
+        store : TMDBStore, optional
+            Local store of persons, by default None
+        n_workers : int, optional
+            Number of concurrent requests, by default the client `n_workers`
+
+        Returns
+        -------
+        pd.DataFrame
+            Persons details indexed by person id (as integer) ready to be
+            joined on the cast and crew `id` column. Failed persons are missing,
+            the error message of each failed id is in `attrs["errors"]`
+        """
+        person_ids = list(dict.fromkeys(int(person_id) for person_id in person_ids if not pd.isna(person_id)))
+
+        persons = {} if store is None else {int(k): v for k,v in store.get_persons(person_ids).items()}
+        misses = [person_id for person_id in person_ids if person_id not in persons]
+
+        errors = {}
+        for i in range(0,len(misses),PERSONS_CHUNK_SIZE):
+            fetched,chunk_errors = self._map_with_errors(self.get_person_details,misses[i:i + PERSONS_CHUNK_SIZE],n_workers)
+            if store is not None and fetched:
+                store.upsert_persons(list(fetched.values()))
+            persons.update(fetched)
+            errors.update(chunk_errors)
+
+        if errors:
+            print(f"... {len(errors)} persons could not be fetched")
 
+        person_ids = [person_id for person_id in person_ids if person_id in persons]
+        persons_df = pd.DataFrame([persons[person_id] for person_id in person_ids])
+        persons_df.index = pd.Index(person_ids,name = "person_id",dtype = "int64")
+        persons_df.attrs["errors"] = errors
+
+        return persons_df
 
     def get_person_credits(self,person_id) -> dict:
         url = f"{API_URL}/person/{person_id}/combined_credits?api_key={self.api_key}"
@@ -539,6 +1150,107 @@ class TMDB:
         url = f"{API_URL}/person/{person_id}/images?api_key={self.api_key}"
         return fetch_json_from_url(url)
 
+    def get_changed_ids(self,kind: str,since: date,until: date,n_workers: int = None) -> set:
+        """Get ids of movies or persons changed between two dates with the changes endpoint
+
+        More info at:
+        https://developers.themoviedb.org/3/changes/get-movie-change-list
+
+        Parameters
+        ----------
+        kind : str
+            "movie" or "person"
+        since : date
+            first day of the changes
+        until : date
+            last day of the changes (included)
+        n_workers : int, optional
+            Number of pages fetched concurrently, by default the client `n_workers`
+
+        Returns
+        -------
+        set
+            changed ids as strings
+        """
+        ids = set()
+        start = since
+        while start <= until:
+            end = min(start + timedelta(days = CHANGES_MAX_DAYS - 1),until)
+            url = f"{API_URL}/{kind}/changes?api_key={self.api_key}&start_date={start.isoformat()}&end_date={end.isoformat()}"
+            ids.update(str(x["id"]) for x in self.fetch_data_from_pages(url,n_workers = n_workers))
+            start = end + timedelta(days = 1)
+
+        return ids
+
+    def sync(self,store: TMDBStore,since: Optional[str] = None,until: Optional[str] = None,
+             n_workers: int = None) -> dict:
+        """Refresh the movies and persons of a local store that changed on TMDB
+
+        Reads the movie and person changes feeds since the last sync (or `since`),
+        re-fetches the changed movies (details, cast and crew) and persons already
+        in the store, upserts them and records `until` as the new sync watermark.
+
+        Changed data is requested without the response cache (which is updated).
+        Ids that fail (e.g. a deleted movie) do not stop the sync: they are
+        recorded in the store and retried at the next sync.
+
+        Parameters
+        ----------
+        store : TMDBStore
+            Local store to refresh
+        since : str, optional
+            First day of changes ("YYYY-MM-DD"), by default the store watermark
+        until : str, optional
+            Last day of changes ("YYYY-MM-DD"), by default today
+        n_workers : int, optional
+            Number of concurrent requests, by default the client `n_workers`
+
+        Returns
+        -------
+        dict
+            number of movies and persons refreshed, error message by "movie"
+            and "person" id and the new watermark
+
+        Raises
+        ------
+        ValueError
+            `since` is not given and the store was never synced
+        """
+        if since is None:
+            since = store.get_meta(SYNC_WATERMARK_KEY)
+            if since is None:
+                raise ValueError("The store was never synced, please set `since`")
+        until = date.today() if until is None else _parse_date(until,end = True)
+        since = _parse_date(since)
+
+        failed = json.loads(store.get_meta(SYNC_FAILED_KEY,"{}"))
+        movie_ids = (self.get_changed_ids("movie",since,until,n_workers) & store.movie_ids()) | set(failed.get("movie",[]))
+        person_ids = (self.get_changed_ids("person",since,until,n_workers) & store.person_ids()) | set(failed.get("person",[]))
+        print(f"... {len(movie_ids)} movies and {len(person_ids)} persons to refresh")
+
+        movies,movie_errors = self._map_with_errors(lambda movie_id: self._get_one_movie_details(movie_id,refresh = True),
+                                                    sorted(movie_ids),n_workers)
+        if movies:
+            store.upsert_movies(*self._concat_movies_details(list(movies.values())))
+
+        persons,person_errors = self._map_with_errors(lambda person_id: self.get_person_details(person_id,refresh = True),
+                                                      sorted(person_ids),n_workers)
+        if persons:
+            store.upsert_persons(list(persons.values()))
+
+        if movie_errors or person_errors:
+            print(f"... {len(movie_errors)} movies and {len(person_errors)} persons failed, retried at next sync")
+
+        store.set_meta(SYNC_FAILED_KEY,json.dumps({"movie": sorted(movie_errors),"person": sorted(person_errors)}))
+        store.set_meta(SYNC_WATERMARK_KEY,until.isoformat())
+
+        return {
+            "movies": len(movies),
+            "persons": len(persons),
+            "errors": {"movie": movie_errors,"person": person_errors},
+            "watermark": until.isoformat(),
+        }
+
     def show_images_on_notebook(self,list_of_paths,width = 250):
 
         html = ""
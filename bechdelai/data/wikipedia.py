@@ -1,12 +1,22 @@
 """
 Functions to get data from wikipedia
 """
-import requests
 from bs4 import BeautifulSoup
+from bs4 import Tag
 import re
 import outputformat as ouf
 import wikipediaapi
-from bechdelai.data.scrap import get_json_from_url
+from tqdm.contrib.concurrent import thread_map
+from bechdelai.data.fetch import fetch_data_from_url
+from bechdelai.data.fetch import fetch_json_from_url
+from bechdelai.data.parsing import make_soup
+
+API_URL = "https://{lang}.wikipedia.org/w/api.php"
+
+# Maximum number of titles in one `action=query` request
+MAX_TITLES_PER_QUERY = 50
+
+HEADING_TAGS = ["h1", "h2", "h3", "h4", "h5", "h6"]
 
 def get_sections(query, lang="en"):
     """Return all sections and subsections in the page and their corresponding indexes
@@ -34,7 +44,7 @@ def get_sections(query, lang="en"):
         'redirects': 1
     }
 
-    R = requests.get(url=URL, params=PARAMS)
+    R = fetch_data_from_url(URL, params=PARAMS)
     if page_exists(R.json()):
         DATA = R.json()["parse"]['sections']
         dict_sections = {}
@@ -70,7 +80,7 @@ def get_section(query, section_index, lang="en"):
         'redirects': 1
     }
 
-    R =  requests.get(url=URL, params=PARAMS)
+    R =  fetch_data_from_url(URL, params=PARAMS)
     if page_exists(R.json()):
         return R.json()["parse"]["text"]["*"]
 
@@ -126,6 +136,9 @@ def parse_section_content(html):
 def get_section_text(query,section_list:list,lang="en",verbose=False):
     """Return the text from section_list,
 
+    All sections are extracted from a single parse of the page
+    (see `WikipediaClient.get_section_text()`)
+
     Parameters
     ----------
     query : str
@@ -140,29 +153,7 @@ def get_section_text(query,section_list:list,lang="en",verbose=False):
     dict
         dictionary of parsed texts from sections in section_list(keys)
     """
-    if type(section_list)!=list:
-        section_list = [section_list]
-
-    # get sections and corresponding index in page
-    sections = get_sections(query,lang=lang)
-    if sections is None:
-        if verbose:
-            print('Page not found.')
-        return {}
-    else:
-        if verbose:
-            ouf.showdict(sections,title="Page sections")
-
-    # get text from each section in section_name
-    contents = {}
-    for section_name in section_list:
-        if section_name not in sections.keys():
-            if verbose:
-                print('KeyError: {} is not a section in the page'.format(section_name))
-            continue
-        section_content = get_section(query,sections[section_name],lang=lang)
-        contents[section_name] =parse_section_content(section_content).replace(section_name+'[edit]\n','')
-    return contents
+    return WikipediaClient(lang).get_section_text(query,section_list,verbose=verbose)
 
 def get_links(query, lang="en", verbose=False):
     """
@@ -192,7 +183,7 @@ def get_links(query, lang="en", verbose=False):
                 'redirects': 1
     }
 
-    R = requests.get(url=URL, params=PARAMS)
+    R = fetch_data_from_url(URL, params=PARAMS)
     data = R.json()
 
     if page_exists(data):
@@ -212,7 +203,7 @@ def get_links(query, lang="en", verbose=False):
                 plcontinue = data["continue"]["plcontinue"]
                 PARAMS["plcontinue"] = plcontinue
 
-                R = requests.get(url=URL, params=PARAMS)
+                R = fetch_data_from_url(URL, params=PARAMS)
                 data = R.json()
                 pages = data["query"]["pages"]
 
@@ -257,7 +248,7 @@ def get_categories(query, lang="en"):
                 'redirects': 1
             }
 
-    R =  requests.get(url=URL, params=PARAMS)
+    R =  fetch_data_from_url(URL, params=PARAMS)
 
     if page_exists(R.json()):
         pages = R.json()["query"]["pages"]
@@ -294,3 +285,250 @@ def page_exists(request_dict):
             raise ValueError("This query does not correspond to a Wikipedia page.")
             return False
     return True
+
+
+def _heading_level(tag):
+    """Returns the level of a section heading (None if the tag is not a heading)
+
+    Headings are `<h2>` tags, wrapped in a `<div class="mw-heading">`
+    in recent MediaWiki versions.
+    """
+    if not isinstance(tag, Tag):
+        return None
+    if tag.name in HEADING_TAGS:
+        return int(tag.name[1])
+    if tag.name == "div" and "mw-heading" in (tag.get("class") or []):
+        heading = tag.find(HEADING_TAGS)
+        if heading is not None:
+            return int(heading.name[1])
+    return None
+
+
+def slice_section_html(soup, anchor):
+    """Return the html of a section (with its subsections) from a parsed page
+
+    Parameters
+    ----------
+    soup : BeautifulSoup
+        whole page parsed
+    anchor : str
+        anchor of the section (see `get_sections()`)
+
+    Returns
+    -------
+    str
+        html of the section content without its heading,
+        None if the section is not in the page
+    """
+    heading = soup.find(id=anchor)
+    while heading is not None and _heading_level(heading) is None:
+        heading = heading.parent
+    if heading is None:
+        return None
+
+    parent = heading.parent
+    if _heading_level(parent) is not None:
+        heading = parent
+    level = _heading_level(heading)
+
+    content = []
+    for sibling in heading.next_siblings:
+        sibling_level = _heading_level(sibling)
+        if sibling_level is not None and sibling_level <= level:
+            break
+        content.append(str(sibling))
+
+    return "".join(content)
+
+
+class WikipediaClient:
+    """Wikipedia API client for many pages
+
+    - links and categories of up to `MAX_TITLES_PER_QUERY` titles are
+      requested in one `action=query` call (continuations included)
+    - all the sections of a page are extracted from one `action=parse` call
+
+    Requests go through the shared session of `bechdelai.data.fetch`
+    (pooled connections, HTTP cache if enabled).
+
+    Parameters
+    ----------
+    lang : str
+        Language of Wikipedia to research, by default "en"
+    n_workers : int
+        Number of requests sent concurrently, by default 4
+    """
+
+    def __init__(self, lang="en", n_workers=4):
+        self.lang = lang
+        self.api_url = API_URL.format(lang=lang)
+        self.n_workers = n_workers
+
+    def _query_titles_chunk(self, titles, prop, limit_param):
+        """Return the `prop` items of each title of one `action=query` call"""
+        params = {
+            "action": "query",
+            "prop": prop,
+            "titles": "|".join(titles),
+            limit_param: "max",
+            "redirects": 1,
+            "format": "json",
+            "formatversion": 2,
+        }
+        # requested title -> resolved title (normalized, then redirected)
+        resolved = {title: title for title in titles}
+        pages = {}
+
+        query_continue = {}
+        while True:
+            data = fetch_json_from_url(self.api_url, params={**params, **query_continue})
+            query = data.get("query", {})
+
+            for key in ["normalized", "redirects"]:
+                for item in query.get(key, []):
+                    for title, resolved_title in resolved.items():
+                        if resolved_title == item["from"]:
+                            resolved[title] = item["to"]
+
+            for page in query.get("pages", []):
+                if page.get("missing") or page.get("invalid"):
+                    pages[page["title"]] = None
+                    continue
+                items = pages.setdefault(page["title"], [])
+                items.extend(item["title"] for item in page.get(prop, []))
+
+            if "continue" not in data:
+                break
+            query_continue = data["continue"]
+
+        return {title: pages.get(resolved[title]) for title in titles}
+
+    def _query_titles(self, titles, prop, limit_param):
+        """Return the `prop` items of each title, `MAX_TITLES_PER_QUERY` titles per call"""
+        titles = list(dict.fromkeys(titles))
+        chunks = [
+            titles[i : i + MAX_TITLES_PER_QUERY]
+            for i in range(0, len(titles), MAX_TITLES_PER_QUERY)
+        ]
+
+        results = {}
+        for chunk_results in thread_map(
+            lambda chunk: self._query_titles_chunk(chunk, prop, limit_param),
+            chunks,
+            max_workers=self.n_workers,
+            disable=len(chunks) < 2,
+        ):
+            results.update(chunk_results)
+
+        return results
+
+    def get_links(self, titles):
+        """Get the titles of the pages linked in each page
+
+        Parameters
+        ----------
+        titles : list of str
+            Pages to research
+
+        Returns
+        -------
+        dict
+            list of linked titles by requested title (None if the page does not exist)
+        """
+        return self._query_titles(titles, "links", "pllimit")
+
+    def get_categories(self, titles):
+        """Get the categories of each page
+
+        Parameters
+        ----------
+        titles : list of str
+            Pages to research
+
+        Returns
+        -------
+        dict
+            list of categories by requested title (None if the page does not exist)
+        """
+        return self._query_titles(titles, "categories", "cllimit")
+
+    def get_section_text(self, query, section_list, verbose=False):
+        """Return the text from section_list with one parse of the page
+
+        Parameters
+        ----------
+        query : str
+            Movie query to research
+        section_list : list of str
+            list of sections' name (anchors) to request
+        verbose : bool
+            Whether to show the page sections and the missing ones
+
+        Returns
+        -------
+        dict
+            dictionary of parsed texts from sections in section_list(keys)
+
+        Raises
+        ------
+        ValueError
+            The query does not correspond to a Wikipedia page
+        """
+        if type(section_list) != list:
+            section_list = [section_list]
+
+        params = {
+            "action": "parse",
+            "page": query,
+            "prop": "text|sections",
+            "disableeditsection": 1,
+            "redirects": 1,
+            "format": "json",
+            "formatversion": 2,
+        }
+        data = fetch_json_from_url(self.api_url, params=params)
+        page_exists(data)
+
+        sections = {d["anchor"]: d["index"] for d in data["parse"]["sections"]}
+        if verbose:
+            ouf.showdict(sections, title="Page sections")
+
+        soup = make_soup(data["parse"]["text"])
+
+        contents = {}
+        for section_name in section_list:
+            html = None
+            if section_name in sections:
+                html = slice_section_html(soup, section_name)
+            if html is None:
+                if verbose:
+                    print("KeyError: {} is not a section in the page".format(section_name))
+                continue
+            contents[section_name] = parse_section_content(html)
+
+        return contents
+
+    def get_many_section_texts(self, queries, section_list):
+        """Return the text from section_list of many pages, concurrently
+
+        Parameters
+        ----------
+        queries : list of str
+            Movie queries to research
+        section_list : list of str
+            list of sections' name (anchors) to request
+
+        Returns
+        -------
+        dict
+            parsed texts by section by query (None if the page does not exist)
+        """
+
+        def get_one(query):
+            try:
+                return self.get_section_text(query, section_list)
+            except ValueError:
+                return None
+
+        texts = thread_map(get_one, queries, max_workers=self.n_workers)
+        return dict(zip(queries, texts))
@@ -1,9 +1,14 @@
 """Subtitles processing functions"""
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+from typing import Optional
 
-import chardet
 import pysrt
 
+from bechdelai.utils.encoding import decode_bytes
+
 brackets_pattern = "\[[A-Za-z ]*\]"
 parenthesis_pattern = "\([A-Za-z ]*\)"
 dash_pattern = r"^-"
@@ -20,16 +25,52 @@ patterns = [
 
 
 def load_srt(fpath):
-    """Load subtitles form srt file"""
-    try:
-        srt = pysrt.open(fpath)
-    except:
-        with open(fpath, "rb") as f:
-            encoding = chardet.detect(f.read())["encoding"]
+    """Load subtitles form srt file
+
+    The file is read once, its encoding being detected with `decode_bytes()`
+    """
+    with open(fpath, "rb") as f:
+        data = f.read()
 
-        srt = pysrt.open(fpath, encoding=encoding)
+    return pysrt.from_string(decode_bytes(data))
 
-    return srt
+
+def _load_srt_or_none(fpath) -> Optional[pysrt.SubRipFile]:
+    """Load subtitles for `load_many_srt()`, None if the file can't be loaded"""
+    try:
+        return load_srt(fpath)
+    except Exception:
+        return None
+
+
+def load_many_srt(
+    fpaths: List[str], n_workers: Optional[int] = None, chunksize: int = 8
+) -> List[Optional[pysrt.SubRipFile]]:
+    """Load many srt files in a process pool (decoding and parsing are CPU bound)
+
+    Parameters
+    ----------
+    fpaths : list
+        paths of the srt files
+    n_workers : int, optional
+        number of processes, by default the number of CPUs
+    chunksize : int, optional
+        number of files sent to a process at once, by default 8
+
+    Returns
+    -------
+    list
+        subtitles of each file, in the order of `fpaths`
+        (None for the files that can't be loaded)
+    """
+    fpaths = list(fpaths)
+    n_workers = n_workers or os.cpu_count() or 1
+
+    if n_workers == 1 or len(fpaths) <= 1:
+        return [_load_srt_or_none(fpath) for fpath in fpaths]
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        return list(executor.map(_load_srt_or_none, fpaths, chunksize=chunksize))
 
 
 def get_dist_between_2_srt(prev, new):
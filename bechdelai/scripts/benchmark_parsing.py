@@ -0,0 +1,103 @@
+"""Benchmark of the HTML parsing backends on saved pages
+
+For each page, the full parse and the partial parse (`SoupStrainer`) of
+the scraper are timed with every installed backend and the extracted
+nodes are compared.
+
+Save pages with e.g. `curl -o movies.html https://www.allocine.fr/films/`
+then run:
+
+    python -m bechdelai.scripts.benchmark_parsing -p allocine_movies=movies.html
+"""
+import importlib.util
+from time import perf_counter
+
+import click
+from bs4 import SoupStrainer
+
+from bechdelai.data.parsing import has_class
+from bechdelai.data.parsing import make_soup
+from bechdelai.data.parsing import VALID_BACKENDS
+
+DEFAULT_PAGES = ["allocine_filters=data/allocine/filters.html"]
+
+# Strainer of the scraper and nodes extracted from the page
+CASES = {
+    "allocine_filters": (
+        SoupStrainer("div", {"id": "filter-entity"}),
+        lambda soup: soup.find("div", {"id": "filter-entity"}).find_all("a"),
+    ),
+    "allocine_movies": (
+        SoupStrainer("li", {"class": has_class("mdl")}),
+        lambda soup: soup.find_all("li", {"class": "mdl"}),
+    ),
+    "imdb_search": (
+        SoupStrainer("tr", {"class": has_class("findResult")}),
+        lambda soup: soup.find_all("tr", {"class": "findResult"}),
+    ),
+    "imdb_credits": (
+        SoupStrainer("table", {"class": has_class("cast_list")}),
+        lambda soup: soup.find("table", {"class": "cast_list"}).find_all("tr"),
+    ),
+    "imsdb_scripts": (SoupStrainer("p"), lambda soup: soup.find_all("p")),
+}
+
+
+def get_installed_backends() -> list:
+    """Returns the backends whose package is installed"""
+    packages = {"lxml": "lxml", "html.parser": "html", "html5lib": "html5lib"}
+    return [
+        backend
+        for backend in VALID_BACKENDS
+        if importlib.util.find_spec(packages[backend]) is not None
+    ]
+
+
+def time_parsing(html, case, backend, partial, n_runs):
+    """Returns the mean time of parse + extraction and the number of nodes"""
+    strainer, extract = CASES[case]
+
+    t0 = perf_counter()
+    for _ in range(n_runs):
+        soup = make_soup(
+            html, parse_only=strainer if partial else None, backend=backend
+        )
+        nodes = extract(soup)
+
+    return (perf_counter() - t0) / n_runs, len(nodes)
+
+
+@click.command()
+@click.option(
+    "-p",
+    "--page",
+    "pages",
+    multiple=True,
+    default=DEFAULT_PAGES,
+    help="Saved page as CASE=PATH, CASE being one of: " + str(list(CASES)),
+)
+@click.option("-r", "--runs", "n_runs", default=20, help="Number of runs by timing.")
+def cli(pages, n_runs):
+    """Time full and partial parsing of saved pages with each backend"""
+    backends = get_installed_backends()
+
+    print(f"{'case':<18}{'backend':<13}{'parse':<9}{'ms':>9}{'nodes':>8}")
+    for page in pages:
+        case, path = page.split("=", 1)
+        if case not in CASES:
+            raise click.BadParameter(f"case must be one of {list(CASES)}")
+
+        with open(path, "rb") as f:
+            html = f.read()
+
+        for backend in backends:
+            for partial in [False, True]:
+                seconds, n_nodes = time_parsing(html, case, backend, partial, n_runs)
+                print(
+                    f"{case:<18}{backend:<13}{'partial' if partial else 'full':<9}"
+                    f"{1000 * seconds:>9.2f}{n_nodes:>8}"
+                )
+
+
+if __name__ == "__main__":
+    cli()
@@ -2,10 +2,9 @@
 import json
 import time
 
-import requests
-
 from bechdelai.data.dictionary import find_words_url
 from bechdelai.data.dictionary import get_definition_from_word_url
+from bechdelai.data.fetch import fetch_data_from_url
 from bechdelai.nlp.dictionary import process_syn_dict
 
 BASE_URL = "https://www.dictionary.com"
@@ -40,7 +39,7 @@ def main():
                 num += 1
                 continue
 
-            ans = requests.get(url)
+            ans = fetch_data_from_url(url)
             print(url, ans.status_code, "---- %.1fs" % (time.time() - t0))
 
             if ans.status_code != 200:
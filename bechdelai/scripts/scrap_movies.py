@@ -1,21 +1,327 @@
 """Cli function to scrap from Allociné and map to TMDB
+
+Every stage appends its results to a checkpoint file in `<path>/checkpoints`
+so that an interrupted run can be continued with `--resume`. TMDB ids
+matching and TMDB fetching run while Allociné pages are still scraped,
+stages being connected by bounded queues.
 """
+import os
+import threading
+from concurrent.futures import FIRST_EXCEPTION
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from queue import Empty
+from queue import Full
+from queue import Queue
 from time import time
 
 import click
+import pandas as pd
 
-from bechdelai.data.allocine import get_movies
-from bechdelai.data.allocine import get_tmdb_ids
+from bechdelai.data.allocine import iter_movies
+from bechdelai.data.allocine import TMDBMatcher
 from bechdelai.data.allocine import VALID_SORT_BY
-from bechdelai.data.tmdb import get_movies_from_ids
+from bechdelai.data.cache import ResponseCache
+from bechdelai.data.checkpoint import JSONLinesCheckpoint
+from bechdelai.data.fetch import get_cache
+from bechdelai.data.fetch import set_cache
+from bechdelai.data.parquet import write_parquet
+from bechdelai.data.tmdb import TMDB
+
+CHECKPOINT_FOLDER = "checkpoints"
+
+# Maximum number of items waiting between two stages
+QUEUE_SIZE = 100
+
+# End of stream marker of the queues
+_END = object()
+
+
+def _put(queue: Queue, item, stop: threading.Event) -> None:
+    """Put an item in a queue unless the pipeline is stopped"""
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=0.1)
+            return
+        except Full:
+            continue
+
+
+def _get(queue: Queue, stop: threading.Event):
+    """Get an item from a queue (`_END` if the pipeline is stopped)"""
+    while not stop.is_set():
+        try:
+            return queue.get(timeout=0.1)
+        except Empty:
+            continue
+    return _END
+
+
+class _Countdown:
+    """Thread-safe counter of the workers still running a stage"""
+
+    def __init__(self, n: int):
+        self.n = n
+        self._lock = threading.Lock()
+
+    def done(self) -> bool:
+        """Mark one worker as done, returns whether it was the last one"""
+        with self._lock:
+            self.n -= 1
+            return self.n == 0
+
+
+def _stop_on_error(stop: threading.Event, func, *args):
+    """Run a stage and stop the other ones if it fails"""
+    try:
+        return func(*args)
+    except BaseException:
+        stop.set()
+        raise
+
+
+def scrap_allocine_stage(
+    movies_queue, stop, allocine_ckpt, done_path, allocine_kwargs, n_workers
+) -> None:
+    """Stage 1: send Allociné movies to the queue, page by page
+
+    Movies are read back from the checkpoint if the stage is already done.
+    Scraping stops at the next page if the pipeline is stopped.
+    """
+    if os.path.exists(done_path):
+        print(f"(1) {len(allocine_ckpt)} Allociné movies loaded from checkpoint")
+        for movie in allocine_ckpt:
+            if stop.is_set():
+                return
+            _put(movies_queue, movie, stop)
+    else:
+        for page_movies in iter_movies(**allocine_kwargs):
+            if stop.is_set():
+                return
+            for movie in page_movies:
+                allocine_ckpt.append(movie)
+                _put(movies_queue, movie, stop)
+        open(done_path, "w").close()
+
+    for _ in range(n_workers):
+        _put(movies_queue, _END, stop)
+
+
+def match_tmdb_stage(
+    movies_queue, ids_queue, stop, ids_ckpt, matcher, n_workers, countdown
+) -> None:
+    """Stage 2: match Allociné movies with TMDB ids
+
+    Movies without match are saved too so that they are not searched again,
+    failed searches are not saved and retried on resume.
+    """
+    while True:
+        movie = _get(movies_queue, stop)
+        if movie is _END:
+            break
+
+        if movie["url"] in ids_ckpt:
+            tmdb_id = ids_ckpt.get(movie["url"])["tmdb_id"]
+        else:
+            try:
+                tmdb_id = matcher.match(movie)
+            except Exception as e:
+                print(
+                    "Error when try to get TMDB ID for '%s': %s" % (movie["title"], e)
+                )
+                continue
+            ids_ckpt.append({"url": movie["url"], "tmdb_id": tmdb_id})
+
+        if tmdb_id is not None:
+            _put(ids_queue, tmdb_id, stop)
+
+    if countdown.done():
+        for _ in range(n_workers):
+            _put(ids_queue, _END, stop)
+
+
+def fetch_tmdb_stage(ids_queue, stop, movies_ckpt, tmdb) -> None:
+    """Stage 3: fetch details, cast and crew of the TMDB ids
+
+    Failed movies are saved with their error so that they do not stop
+    the pipeline, they are retried on resume.
+    """
+    while True:
+        tmdb_id = _get(ids_queue, stop)
+        if tmdb_id is _END:
+            break
+
+        record = movies_ckpt.get(tmdb_id)
+        if record is not None and "error" not in record:
+            continue
+
+        try:
+            bundle = tmdb.get_movie_bundle(tmdb_id, parts=["credits"])
+        except Exception as e:
+            print("Error when fetching TMDB movie '%s': %s" % (tmdb_id, e))
+            movies_ckpt.append({"movie_id": str(tmdb_id), "error": str(e)})
+            continue
+
+        movies_ckpt.append(
+            {
+                "movie_id": str(tmdb_id),
+                "details": bundle["details"],
+                "cast": bundle["cast"].to_dict(orient="records"),
+                "crew": bundle["crew"].to_dict(orient="records"),
+            }
+        )
+
+
+def load_tmdb_results(allocine_ckpt, ids_ckpt, movies_ckpt) -> tuple:
+    """Build the movie details, cast and crew dataframes from the checkpoints
+    in Allociné order, each TMDB movie appearing once (failed movies are skipped)
+    """
+    movie_ids = []
+    for movie in allocine_ckpt:
+        movie_id = ids_ckpt.get(movie["url"], {}).get("tmdb_id")
+        record = None if movie_id is None else movies_ckpt.get(movie_id)
+        if record is not None and "error" not in record:
+            movie_ids.append(str(movie_id))
+    movie_ids = list(dict.fromkeys(movie_ids))
+
+    records = [movies_ckpt.get(movie_id) for movie_id in movie_ids]
+
+    movies_df = pd.DataFrame([record["details"] for record in records])
+    cast_df = pd.DataFrame(
+        [{**row, "movie_id": r["movie_id"]} for r in records for row in r["cast"]]
+    )
+    crew_df = pd.DataFrame(
+        [{**row, "movie_id": r["movie_id"]} for r in records for row in r["crew"]]
+    )
+
+    if len(movies_df) > 0:
+        movies_df["id"] = movies_df["id"].astype(str)
+
+    return movies_df, cast_df, crew_df
+
+
+def run_pipeline(
+    allocine_kwargs: dict,
+    checkpoint_folder: str,
+    resume: bool = False,
+    n_workers: int = 4,
+    tmdb: TMDB = None,
+    matcher: TMDBMatcher = None,
+) -> tuple:
+    """Run stages 1 to 3 concurrently with checkpoints
+
+    Parameters
+    ----------
+    allocine_kwargs : dict
+        parameters of `iter_movies()`
+    checkpoint_folder : str
+        folder of the checkpoint files
+    resume : bool, optional
+        whether to continue from existing checkpoints, by default False
+        (checkpoints are removed)
+    n_workers : int, optional
+        number of threads matching and of threads fetching TMDB movies,
+        by default 4
+    tmdb : TMDB, optional
+        TMDB client to use, by default a new one is created
+    matcher : TMDBMatcher, optional
+        matcher of the TMDB ids, by default a new one is created with `tmdb`
+
+    Returns
+    -------
+    tuple
+        3 dataframes: movie details, cast and crew
+    """
+    if tmdb is None:
+        tmdb = TMDB()
+    if matcher is None:
+        matcher = TMDBMatcher(tmdb, n_workers)
+
+    reset = not resume
+    allocine_ckpt = JSONLinesCheckpoint(
+        f"{checkpoint_folder}/allocine_movies.jsonl", key="url", reset=reset
+    )
+    ids_ckpt = JSONLinesCheckpoint(
+        f"{checkpoint_folder}/tmdb_ids.jsonl", key="url", reset=reset
+    )
+    movies_ckpt = JSONLinesCheckpoint(
+        f"{checkpoint_folder}/tmdb_movies.jsonl", key="movie_id", reset=reset
+    )
+    done_path = f"{checkpoint_folder}/allocine_movies.done"
+    if reset and os.path.exists(done_path):
+        os.remove(done_path)
+
+    stop = threading.Event()
+    movies_queue = Queue(QUEUE_SIZE)
+    ids_queue = Queue(QUEUE_SIZE)
+
+    countdown = _Countdown(n_workers)
+
+    with ThreadPoolExecutor(max_workers=2 * n_workers + 1) as executor:
+        futures = [
+            executor.submit(
+                _stop_on_error,
+                stop,
+                scrap_allocine_stage,
+                movies_queue,
+                stop,
+                allocine_ckpt,
+                done_path,
+                allocine_kwargs,
+                n_workers,
+            )
+        ]
+        futures += [
+            executor.submit(
+                _stop_on_error,
+                stop,
+                match_tmdb_stage,
+                movies_queue,
+                ids_queue,
+                stop,
+                ids_ckpt,
+                matcher,
+                n_workers,
+                countdown,
+            )
+            for _ in range(n_workers)
+        ]
+        futures += [
+            executor.submit(
+                _stop_on_error,
+                stop,
+                fetch_tmdb_stage,
+                ids_queue,
+                stop,
+                movies_ckpt,
+                tmdb,
+            )
+            for _ in range(n_workers)
+        ]
+
+        try:
+            wait(futures, return_when=FIRST_EXCEPTION)
+        except BaseException:
+            stop.set()
+            raise
+
+    for future in futures:
+        future.result()
+
+    return load_tmdb_results(allocine_ckpt, ids_ckpt, movies_ckpt)
 
 
 @click.command()
 @click.option(
     "-n", "--movies-number", "n_movies", required=True, help="Number of movies wanted."
 )
+@click.option("-p", "--path", "path", required=True, help="Path where to save results.")
 @click.option(
-    "-p", "--path", "path", required=True, help="Path where to save csv results."
+    "--format",
+    "output_format",
+    default="csv",
+    type=click.Choice(["csv", "parquet"]),
+    help="Format of the saved results (parquet keeps typed and nested columns).",
 )
 @click.option(
     "--sort-by",
@@ -27,8 +333,41 @@ from bechdelai.data.tmdb import get_movies_from_ids
 @click.option("--genre", default="", help="Filter for genre.")
 @click.option("--year", default="", help="Filter for year.")
 @click.option("--country", default="", help="Filter for country.")
+@click.option(
+    "--cache-path",
+    "cache_path",
+    default=None,
+    help="Path of the SQLite HTTP cache (e.g. ~/.cache/bechdelai/http.sqlite). "
+    + "Disabled by default.",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    default=False,
+    help="Continue an interrupted run from its checkpoints.",
+)
+@click.option(
+    "-w",
+    "--workers",
+    "n_workers",
+    default=4,
+    type=int,
+    help="Number of threads fetching Allociné pages and TMDB movies.",
+)
 @click.option("-v", "--verbose", default=True, help="The person to greet.")
-def cli(n_movies, path, sort_by, genre, year, country, verbose):
+def cli(
+    n_movies,
+    path,
+    output_format,
+    sort_by,
+    genre,
+    year,
+    country,
+    cache_path,
+    resume,
+    n_workers,
+    verbose,
+):
     """CLI for scraping movies from Allociné and TMDB.
 
     It follows these steps:
@@ -39,7 +378,10 @@ def cli(n_movies, path, sort_by, genre, year, country, verbose):
 
     3. Get data for each movie with TMDB API: metadata, crew and cast
 
-    4. Save csv results
+    4. Save csv or parquet results
+
+    Steps 1 to 3 run concurrently and save checkpoints in `<path>/checkpoints`,
+    use `--resume` to continue an interrupted run.
     """
     n_movies = int(n_movies)
     verbose = bool(verbose)
@@ -48,48 +390,59 @@ def cli(n_movies, path, sort_by, genre, year, country, verbose):
     crew_csv_name = "movies_crew"
     cast_csv_name = "movies_cast"
 
-    details_df_path = f"{path}/{details_csv_name}.csv"
-    crew_df_path = f"{path}/{crew_csv_name}.csv"
-    cast_df_path = f"{path}/{cast_csv_name}.csv"
+    details_df_path = f"{path}/{details_csv_name}.{output_format}"
+    crew_df_path = f"{path}/{crew_csv_name}.{output_format}"
+    cast_df_path = f"{path}/{cast_csv_name}.{output_format}"
+
+    if cache_path is not None:
+        set_cache(ResponseCache(cache_path))
 
     print("===== Script start =====")
     t0 = time()
-    print("(1 - start) get movies from allociné")
+    print("(1-3 - start) get movies from allociné, match and fetch them with TMDB")
 
-    movies = get_movies(
+    allocine_kwargs = dict(
         n_movies=n_movies,
         genre=genre,
         country=country,
         year=year,
         sort_by=sort_by,
-        verbose=True,
+        verbose=verbose,
+        n_workers=n_workers,
+    )
+    matcher = TMDBMatcher(TMDB(), n_workers)
+    movies_df, cast_df, crew_df = run_pipeline(
+        allocine_kwargs,
+        checkpoint_folder=f"{path}/{CHECKPOINT_FOLDER}",
+        resume=resume,
+        n_workers=n_workers,
+        matcher=matcher,
     )
-
-    print("(1 - end) Allociné data retrieved after `%.1fsec`" % (time() - t0))
-    print("(2 - start) match with TMDB ids")
-
-    movies_id = get_tmdb_ids(movies)
-
-    print("(2 - end) TMDB ids retrieved after `%.1fsec`" % (time() - t0))
-    print("(3 - start) Get movie detail, cast and crew")
-
-    movies_df, crew_df, cast_df = get_movies_from_ids(movies_id)
 
     print(
-        "(3 - end) movie detail, cast and crew retrieved after `%.1fsec`"
-        % (time() - t0)
+        "(1-3 - end) %d movies detail, cast and crew retrieved after `%.1fsec`"
+        % (len(movies_df), time() - t0)
     )
     print("(4 - start) save dataframes")
 
-    movies_df.to_csv(details_df_path, index=False)
-    cast_df.to_csv(cast_df_path, index=False)
-    crew_df.to_csv(crew_df_path, index=False)
+    if output_format == "parquet":
+        write_parquet(movies_df, details_df_path, kind="movies")
+        write_parquet(cast_df, cast_df_path, kind="cast")
+        write_parquet(crew_df, crew_df_path, kind="crew")
+    else:
+        movies_df.to_csv(details_df_path, index=False)
+        cast_df.to_csv(cast_df_path, index=False)
+        crew_df.to_csv(crew_df_path, index=False)
 
     print(f"- movies_df save at `{details_df_path}`")
     print(f"- cast_df save at `{cast_df_path}`")
     print(f"- crew_df save at `{crew_df_path}`")
 
-    print("(4 - end) csv saved after `%.1fsec`" % (time() - t0))
+    print("(4 - end) %s saved after `%.1fsec`" % (output_format, time() - t0))
+
+    print("TMDB matching: %s" % matcher.stats())
+    if get_cache() is not None:
+        print("HTTP cache: %s" % get_cache().stats())
     print("===== Script done =====")
 
 
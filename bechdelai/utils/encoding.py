@@ -0,0 +1,92 @@
+"""Decoding of text files with an unknown encoding (e.g. subtitles)
+
+Files with a BOM or valid UTF-8 are decoded without detection. Other
+files are detected on a bounded sample with charset_normalizer (chardet
+if it is not installed), detection over a whole file being slow.
+"""
+import codecs
+
+import chardet
+
+try:
+    from charset_normalizer import from_bytes
+except ImportError:
+    from_bytes = None
+
+# Number of bytes used to detect the encoding
+DETECTION_SAMPLE_SIZE = 64 * 1024
+
+# UTF-32 BOMs first as the UTF-32 LE BOM starts with the UTF-16 LE one
+BOMS = [
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+# Encoding used when detection fails
+FALLBACK_ENCODING = "latin-1"
+
+# Encodings chosen among candidates decoding a sample as cleanly as the best
+# one (single byte code pages often do), most common in subtitles first
+PREFERRED_ENCODINGS = ["cp1252", "iso8859_15", "latin_1", "cp1250", "cp1251"]
+
+
+def _pick_match(matches):
+    """Returns the encoding of the best charset_normalizer match, ties on
+    noise being broken by `PREFERRED_ENCODINGS`
+    """
+    best = matches.best()
+    if best is None:
+        return None
+
+    tied = [match.encoding for match in matches if match.chaos == best.chaos]
+    for encoding in PREFERRED_ENCODINGS:
+        if encoding in tied:
+            return encoding
+
+    return best.encoding
+
+
+def detect_encoding(data: bytes, sample_size: int = DETECTION_SAMPLE_SIZE) -> str:
+    """Returns the encoding of a text
+
+    Parameters
+    ----------
+    data : bytes
+        encoded text
+    sample_size : int, optional
+        number of bytes used for the detection, by default DETECTION_SAMPLE_SIZE
+
+    Returns
+    -------
+    str
+        encoding name
+    """
+    for bom, encoding in BOMS:
+        if data.startswith(bom):
+            return encoding
+
+    try:
+        data.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+
+    sample = data[:sample_size]
+
+    if from_bytes is not None:
+        encoding = _pick_match(from_bytes(sample))
+        if encoding is not None:
+            return encoding
+
+    return chardet.detect(sample)["encoding"] or FALLBACK_ENCODING
+
+
+def decode_bytes(data: bytes, sample_size: int = DETECTION_SAMPLE_SIZE) -> str:
+    """Decode a text of unknown encoding (see `detect_encoding()`)
+
+    Characters that are not valid in the detected encoding are replaced.
+    """
+    return data.decode(detect_encoding(data, sample_size), errors="replace")